@@ -1,58 +1,181 @@
 # ai_handler.py
-import requests
 import json
 import time
+import threading
 import traceback
-from openai import OpenAI
 import config
-from utils import Logger, image_to_base64, get_mime_type
+from utils import Logger, image_to_base64, get_mime_type, stitch_continuation
 from stats_manager import StatsManager # 导入 StatsManager
+from tracer import tracer
+from deadline import Deadline, DeadlineExceededError
+from prompt_cache import PromptCache, gemini_cached_tokens, openai_cached_tokens
+from file_upload import FileUploadCache
+from page_store import PDF_MIME_TYPE
+from model_selector import ModelSelector
+from cassette import (open_cassette, fingerprint, RecordingSSEResponse, ReplayedSSEResponse,
+                      ReplayedAPIError)
+from key_pool import (KeyPool, PROVIDER_MODELS, ProviderNotConfiguredError, KeyRejectedError,
+                      provider_configured, model_provider)
 
 # 全局变量记录是否曾经成功连接过网络
 HAS_CONNECTED_ONCE = False
 
 
+def configured_models():
+    """返回已配置有效 API Key 的模型列表"""
+    models = []
+    if provider_configured("gemini"):
+        models += [config.MODEL_GEMINI_PRO, config.MODEL_GEMINI_FLASH]
+    if provider_configured("aliyun"):
+        models.append(config.MODEL_ALIYUN_QWEN)
+    if provider_configured("siliconflow"):
+        models.append(config.MODEL_QWEN)
+    return models
+
+
 class AIHandler:
     def __init__(self, stats_manager: StatsManager): # 接收 stats_manager 实例
         self.stats_manager = stats_manager # 存储实例
-        # 初始化阿里云客户端
-        self.aliyun_client = OpenAI(
-            api_key=config.DASHSCOPE_API_KEY,
-            base_url=config.DASHSCOPE_API_URL
-        )
-        # 初始化硅基流动客户端
-        self.qwen_client = OpenAI(
-            api_key=config.QWEN_API_KEY,
-            base_url=config.QWEN_API_URL
-        )
+        # 阿里云 / 硅基流动客户端在首次调用时才创建 (openai 包导入较慢，未配置 Key 的服务商不创建)，每个 Key 一个客户端
+        self._clients = {}
+        self.key_pool = KeyPool(stats_manager)
+        self._client_lock = threading.Lock()
         self.current_model_type = "gemini"  # 'gemini', 'aliyun', or 'siliconflow'
+        self.locked_at = None  # 锁定备用模型的时间
+        self._local = threading.local()  # 记录当前线程最近一次成功调用的模型
+        self._session = None
+        self.prompt_cache = PromptCache(lambda: self.session)  # 系统提示词的服务端缓存
+        self.file_uploads = FileUploadCache(lambda: self.session, stats_manager)  # 已上传的页面图片 (Files API)
+        self._pdf_rejected = set()  # 拒绝 PDF 输入的模型 (原生 PDF 模式下改为发送渲染后的图片)
+        self.cassette = open_cassette()  # 录制 / 回放服务商流量 (config.CASSETTE_MODE)
+        if self.cassette:
+            Logger.info(f"Cassette {self.cassette.mode} 模式: {self.cassette.path} (已有 {self.cassette.count()} 条录制)")
+        # 按页选择模型并执行预算
+        self.model_selector = ModelSelector(stats_manager, configured_models()) if config.MODEL_SELECTION_ENABLED else None
+
+    @property
+    def session(self):
+        """复用 HTTP 连接池 (Gemini 与连通性检查)，首次使用时才导入 requests"""
+        if self._session is None:
+            with self._client_lock:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+        return self._session
+
+    def _openai_client(self, api_key, base_url):
+        """按需创建 OpenAI 兼容客户端"""
+        with self._client_lock:
+            if api_key.secret not in self._clients:
+                from openai import OpenAI
+                # 重试由 _translate_with_retry 按单页时间预算控制，不使用 SDK 内部的重试
+                self._clients[api_key.secret] = OpenAI(api_key=api_key.secret, base_url=base_url, max_retries=0)
+            return self._clients[api_key.secret]
+
+    def _reject_key(self, api_key, error, latency, status=None, body=""):
+        """归还调用失败的 Key；若是 Key 本身的问题 (无效 / 限流 / 额度耗尽) 则停用并抛出 KeyRejectedError"""
+        reason = self.key_pool.release(api_key, False, latency, status, body or str(error))
+        if reason:
+            Logger.warning(f"{api_key.provider} Key {api_key.label} 已停用 ({reason})。", indent=3)
+            raise KeyRejectedError(f"{api_key.provider} Key {api_key.label} 被拒绝 ({reason}): {error}") from error
+
+    def accepts_pdf(self, model_name):
+        """模型是否可以直接接收原生 PDF 模式的单页 PDF"""
+        return model_provider(model_name) in config.PDF_NATIVE_PROVIDERS and model_name not in self._pdf_rejected
+
+    def last_served_model(self):
+        """返回当前线程最近一次成功返回结果的模型名称"""
+        return getattr(self._local, "last_model", None)
 
-    def check_google_connection(self):
+    def refresh_provider_health(self):
+        """备用模型锁定超过 PROVIDER_LOCK_TTL 后解除锁定，让后续论文重新尝试 Gemini (长时间运行时使用)"""
+        if self.current_model_type == "gemini" or self.locked_at is None:
+            return
+        if time.time() - self.locked_at >= config.PROVIDER_LOCK_TTL:
+            Logger.info(f"备用模型 ({self.current_model_type}) 已锁定超过 {config.PROVIDER_LOCK_TTL} 秒，重新尝试 Gemini。")
+            self.current_model_type = "gemini"
+            self.locked_at = None
+            tracer.instant("unlock_provider")
+
+    def check_google_connection(self, deadline=None):
         """检查谷歌连接"""
+        if self.cassette and self.cassette.replaying:
+            return True  # 回放模式不访问网络
+        timeout = deadline.timeout(5, "网络检查") if deadline else 5
         try:
-            requests.get(config.GOOGLE_TEST_URL, timeout=5)
+            self.session.get(config.GOOGLE_TEST_URL, timeout=timeout)
             global HAS_CONNECTED_ONCE
             HAS_CONNECTED_ONCE = True
             return True
         except:
             return False
 
-    def _call_gemini(self, model_name, prompt, image_path):
-        """调用 Gemini API"""
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:streamGenerateContent?key={config.GOOGLE_API_KEY}&alt=sse"
+    def _call_gemini(self, model_name, prompt, image_path, deadline=None):
+        """调用 Gemini API (输出被截断时自动续写)"""
+        return self._with_continuation(model_name,
+                                       lambda partial: self._request_gemini(model_name, prompt, image_path, partial, deadline))
+
+    def _call_aliyun_qwen(self, prompt, image_path, deadline=None):
+        """调用阿里云 Qwen API (输出被截断时自动续写)"""
+        return self._with_continuation(config.MODEL_ALIYUN_QWEN,
+                                       lambda partial: self._request_aliyun_qwen(prompt, image_path, partial, deadline))
+
+    def _call_qwen(self, prompt, image_path, deadline=None):
+        """调用硅基流动 Qwen API (输出被截断时自动续写)"""
+        return self._with_continuation(config.MODEL_QWEN,
+                                       lambda partial: self._request_qwen(prompt, image_path, partial, deadline))
+
+    def _with_continuation(self, model_name, request):
+        """
+        request(partial) 返回 (文本, 是否因长度上限被截断)。被截断时携带已输出的内容请求模型接着写，
+        最多 MAX_CONTINUATIONS 次，各段拼接后返回；只需为缺失的部分支付输出 token。
+        """
+        text, truncated = request(None)
+        continuations = 0
+        while truncated and continuations < config.MAX_CONTINUATIONS:
+            continuations += 1
+            Logger.warning(f"{model_name} 输出被截断 (已输出 {len(text)} 字)，发送第 {continuations} 次续写请求...", indent=3)
+            self.stats_manager.record_continuation(model_name)
+            with tracer.span("continuation", model=model_name, attempt=continuations):
+                piece, truncated = request(text)
+            text = stitch_continuation(text, piece)
+        if truncated:
+            Logger.warning(f"{model_name} 续写 {continuations} 次后输出仍被截断，本页译文可能不完整。", indent=3)
+        return text
+
+    def _request_gemini(self, model_name, prompt, image_path, partial=None, deadline=None):
+        """发送一次 Gemini 请求，partial 不为空时为续写请求。返回: (文本, 是否被截断)"""
+        import requests  # 延迟导入 (session 创建时已加载，这里仅用于异常类型)
+        deadline = deadline or Deadline(0)
+        deadline.check(model_name)
+        api_key = self.key_pool.acquire("gemini")
+        api_url = f"{config.GEMINI_API_BASE}/models/{model_name}:streamGenerateContent?key={api_key.secret}&alt=sse"
         headers = {'Content-Type': 'application/json'}
 
-        b64_img = image_to_base64(image_path)
+        # 优先引用已上传的文件 (重试与续写复用同一个文件)，否则 inline 发送 base64 图片；
+        # 原生 PDF 模式的页面直接以 application/pdf 发送，模型不支持时渲染为图片
+        b64_img = None
         mime_type = get_mime_type(image_path)
+        rasterize = mime_type == PDF_MIME_TYPE and not self.accepts_pdf(model_name)
+        image_part = None if rasterize else self.file_uploads.gemini_part(image_path, api_key, deadline)
+        if image_part is None:
+            b64_img = image_to_base64(image_path, rasterize_pdf=rasterize)
+            image_part = {"inline_data": {"mime_type": "image/png" if rasterize else mime_type, "data": b64_img}}
 
+        contents = [{
+            "role": "user",
+            "parts": [
+                {"text": prompt},
+                image_part
+            ]
+        }]
+        if partial:
+            contents += [{"role": "model", "parts": [{"text": partial}]},
+                         {"role": "user", "parts": [{"text": config.CONTINUATION_PROMPT}]}]
+        # 系统提示词作为固定前缀 (缓存名称或 systemInstruction)，不再拼进每页的用户文本
         payload = {
-            "contents": [{
-                "role": "user",
-                "parts": [
-                    {"text": config.SYSTEM_PROMPT + "\n\n" + prompt},
-                    {"inline_data": {"mime_type": mime_type, "data": b64_img}}
-                ]
-            }],
+            **self.prompt_cache.gemini_fields(model_name, api_key, deadline),
+            "contents": contents,
             "safetySettings": [
                 {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
                 {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
@@ -62,7 +185,7 @@ class AIHandler:
         }
         
         request_details = {
-            "url": api_url,
+            "url": api_url.replace(api_key.secret, api_key.label),
             "headers": headers,
             "payload": payload
         }
@@ -70,35 +193,127 @@ class AIHandler:
         start_time = time.time()
         full_text = ""
         response_text = ""
+        usage = None
+        finish_reason = None
         try:
-            response = requests.post(api_url, headers=headers, data=json.dumps(payload), stream=True, timeout=60)
+            # 上传图片 / 创建缓存之后再计算本次请求的超时
+            timeout = deadline.timeout(config.REQUEST_TIMEOUT, model_name)
+            # 上传请求体并等待响应头
+            with tracer.span("upload", model=model_name, bytes=len(b64_img or "")):
+                response = self._post_gemini(api_url, headers, payload, model_name, start_time, timeout)
             response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if line:
-                    decoded = line.decode('utf-8')
-                    response_text += decoded # 记录完整的响应文本
-                    if decoded.startswith('data: '):
-                        try:
-                            data = json.loads(decoded[6:])
-                            if "candidates" in data:
-                                chunk = data["candidates"][0]["content"]["parts"][0]["text"]
-                                full_text += chunk
-                        except:
-                            pass
+
+            # 流式接收: 阻塞在网络读取上的时间计为等待模型，json 解析单独累计
+            with tracer.span("model_wait", model=model_name) as span:
+                parse_time = 0.0
+                first_chunk_time = None
+                for line in response.iter_lines():
+                    if line:
+                        if first_chunk_time is None:
+                            first_chunk_time = time.time() - start_time
+                        parse_start = time.perf_counter()
+                        decoded = line.decode('utf-8')
+                        response_text += decoded # 记录完整的响应文本
+                        if decoded.startswith('data: '):
+                            try:
+                                data = json.loads(decoded[6:])
+                                if "usageMetadata" in data:
+                                    usage = data["usageMetadata"]
+                                if "candidates" in data:
+                                    finish_reason = data["candidates"][0].get("finishReason") or finish_reason
+                                    chunk = data["candidates"][0]["content"]["parts"][0]["text"]
+                                    full_text += chunk
+                            except:
+                                pass
+                        parse_time += time.perf_counter() - parse_start
+                    if deadline.expired():
+                        # 读超时只限制单次读取的间隔，持续缓慢输出时在这里截止
+                        response.close()
+                        raise DeadlineExceededError(f"{model_name}: 单页时间预算 {deadline.budget} 秒在接收响应时用尽")
+                span["sse_parse_ms"] = round(parse_time * 1000, 3)
+                span["first_chunk_ms"] = round(first_chunk_time * 1000, 3) if first_chunk_time is not None else None
+            self.key_pool.release(api_key, True, time.time() - start_time)
             self.stats_manager.log_api_call(model_name, True, time.time() - start_time, request_details, response_text)
-            return full_text
+            self._local.last_model = model_name
+            if usage:
+                # 思考 token 按输出计费
+                self._record_usage(model_name, usage.get("promptTokenCount", 0),
+                                   usage.get("candidatesTokenCount", 0) + usage.get("thoughtsTokenCount", 0),
+                                   gemini_cached_tokens(usage))
+            return full_text, finish_reason == "MAX_TOKENS"
         except requests.exceptions.RequestException as e:
             error_response_text = response.text if 'response' in locals() else str(e)
+            status = response.status_code if 'response' in locals() else None
+            if "cachedContent" in payload and status in (400, 403, 404) and "cache" in error_response_text.lower():
+                # 引用的缓存已过期或被删除 (服务端对此返回 403)，不是 Key 的问题；下次请求重新创建
+                self.prompt_cache.invalidate(model_name, api_key)
+                status = None
+            if "file_data" in image_part and status in (400, 403, 404) and "file" in error_response_text.lower():
+                # 引用的文件已过期或被删除 (服务端对此返回 403)，不是 Key 的问题；下次请求重新上传
+                self.file_uploads.invalidate(image_part["file_data"]["file_uri"])
+                status = None
+            pdf_rejected = mime_type == PDF_MIME_TYPE and not rasterize and status == 400 \
+                and ("pdf" in error_response_text.lower() or "mime" in error_response_text.lower())
             self.stats_manager.log_api_call(model_name, False, time.time() - start_time, request_details, error_response_text)
+            self._reject_key(api_key, e, time.time() - start_time, status, error_response_text)
+            if pdf_rejected:
+                Logger.warning(f"{model_name} 不支持 PDF 输入，改为发送渲染后的页面图片。", indent=3)
+                self._pdf_rejected.add(model_name)
+                return self._request_gemini(model_name, prompt, image_path, partial, deadline)
             raise # 重新抛出异常
         except Exception as e:
             self.stats_manager.log_api_call(model_name, False, time.time() - start_time, request_details, str(e))
+            self.key_pool.release(api_key, False, time.time() - start_time)
             raise # 重新抛出异常
 
-    def _call_aliyun_qwen(self, prompt, image_path):
-        """调用阿里云 Qwen API"""
-        b64_img = image_to_base64(image_path)
+    def _post_gemini(self, api_url, headers, payload, model_name, start_time, timeout=None):
+        """发送 Gemini 流式请求；启用 cassette 时录制响应，或直接回放录制的响应"""
+        import requests
+        fp = fingerprint(model_name, payload) if self.cassette else None
+        if self.cassette and self.cassette.replaying:
+            entry, content = self.cassette.next(fp, model_name)
+            if entry["kind"] == "exception":
+                self.cassette.wait(entry["latency"])
+                raise requests.exceptions.ConnectionError(f"{content} (replayed)")
+            return ReplayedSSEResponse(self.cassette, entry, content)
+        data = json.dumps(payload)
+        self.stats_manager.record_request_bytes(len(data))
+        try:
+            response = self.session.post(api_url, headers=headers, data=data, stream=True,
+                                         timeout=timeout or config.REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            if self.cassette:
+                self.cassette.record(fp, model_name, "exception", str(e), latency=time.time() - start_time)
+            raise
+        return RecordingSSEResponse(response, self.cassette, fp, model_name, start_time) if self.cassette else response
+
+    def _chat_completion(self, client, request_details, timeout=None):
+        """调用 OpenAI 兼容接口 (request_details 即请求参数)；启用 cassette 时录制或回放"""
+        model_name = request_details["model"]
+        fp = fingerprint(model_name, request_details) if self.cassette else None
+        if self.cassette and self.cassette.replaying:
+            entry, content = self.cassette.next(fp, model_name)
+            self.cassette.wait(entry["latency"])
+            if entry["kind"] != "json":
+                raise ReplayedAPIError(f"{content} (replayed)", entry["status"])
+            from openai.types.chat import ChatCompletion
+            return ChatCompletion.model_validate(content)
+        start_time = time.time()
+        self.stats_manager.record_request_bytes(len(json.dumps(request_details)))
+        try:
+            response = client.chat.completions.create(**request_details, timeout=timeout or config.REQUEST_TIMEOUT)
+        except Exception as e:
+            if self.cassette:
+                self.cassette.record(fp, model_name, "error", str(e), status=getattr(e, "status_code", None),
+                                     latency=time.time() - start_time)
+            raise
+        if self.cassette:
+            self.cassette.record(fp, model_name, "json", response.model_dump(mode="json"), latency=time.time() - start_time)
+        return response
+
+    @staticmethod
+    def _chat_messages(prompt, b64_img, partial=None):
+        """OpenAI 兼容接口的消息列表，partial 不为空时追加已输出内容与续写指令"""
         messages = [
             {"role": "system", "content": config.SYSTEM_PROMPT},
             {
@@ -109,157 +324,251 @@ class AIHandler:
                 ],
             },
         ]
+        if partial:
+            messages += [{"role": "assistant", "content": partial},
+                         {"role": "user", "content": config.CONTINUATION_PROMPT}]
+        return messages
+
+    def _request_aliyun_qwen(self, prompt, image_path, partial=None, deadline=None):
+        """发送一次阿里云 Qwen 请求。返回: (文本, 是否被截断)"""
+        b64_img = image_to_base64(image_path, rasterize_pdf=True)  # OpenAI 兼容接口只接受图片
+        messages = self._chat_messages(prompt, b64_img, partial)
         request_details = {
             "model": config.MODEL_ALIYUN_QWEN,
             "messages": messages,
             "temperature": 0.2,
-            "max_tokens": 4000
+            "max_tokens": config.MAX_OUTPUT_TOKENS
         }
+        timeout = (deadline or Deadline(0)).timeout(config.REQUEST_TIMEOUT, config.MODEL_ALIYUN_QWEN)
 
+        api_key = self.key_pool.acquire("aliyun")
+        client = self._openai_client(api_key, config.DASHSCOPE_API_URL)
         start_time = time.time()
         try:
-            response = self.aliyun_client.chat.completions.create(
-                model=config.MODEL_ALIYUN_QWEN,
-                messages=messages,
-                temperature=0.2,
-                max_tokens=4000
-            )
-            self.stats_manager.log_api_call(config.MODEL_ALIYUN_QWEN, True, time.time() - start_time, request_details, response.model_dump_json())
-            return response.choices[0].message.content
+            with tracer.span("model_wait", model=config.MODEL_ALIYUN_QWEN):
+                response = self._chat_completion(client, request_details, timeout)
         except Exception as e:
             self.stats_manager.log_api_call(config.MODEL_ALIYUN_QWEN, False, time.time() - start_time, request_details, str(e))
+            self._reject_key(api_key, e, time.time() - start_time, getattr(e, "status_code", None))
             raise # 重新抛出异常
+        self.key_pool.release(api_key, True, time.time() - start_time)
+        self.stats_manager.log_api_call(config.MODEL_ALIYUN_QWEN, True, time.time() - start_time, request_details, response.model_dump_json())
+        self._local.last_model = config.MODEL_ALIYUN_QWEN
+        if response.usage:
+            self._record_usage(config.MODEL_ALIYUN_QWEN, response.usage.prompt_tokens, response.usage.completion_tokens,
+                               openai_cached_tokens(response.usage))
+        choice = response.choices[0]
+        return choice.message.content or "", choice.finish_reason == "length"
 
-    def _call_qwen(self, prompt, image_path):
-        """调用硅基流动 Qwen API"""
-        b64_img = image_to_base64(image_path)
-        messages = [
-            {"role": "system", "content": config.SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}},
-                ],
-            },
-        ]
+    def _request_qwen(self, prompt, image_path, partial=None, deadline=None):
+        """发送一次硅基流动 Qwen 请求。返回: (文本, 是否被截断)"""
+        b64_img = image_to_base64(image_path, rasterize_pdf=True)  # OpenAI 兼容接口只接受图片
+        messages = self._chat_messages(prompt, b64_img, partial)
         request_details = {
             "model": config.MODEL_QWEN,
             "messages": messages,
             "temperature": 0.2,
-            "max_tokens": 4000
+            "max_tokens": config.MAX_OUTPUT_TOKENS
         }
+        timeout = (deadline or Deadline(0)).timeout(config.REQUEST_TIMEOUT, config.MODEL_QWEN)
 
+        api_key = self.key_pool.acquire("siliconflow")
+        client = self._openai_client(api_key, config.QWEN_API_URL)
         start_time = time.time()
         try:
-            response = self.qwen_client.chat.completions.create(
-                model=config.MODEL_QWEN,
-                messages=messages,
-                temperature=0.2,
-                max_tokens=4000
-            )
-            self.stats_manager.log_api_call(config.MODEL_QWEN, True, time.time() - start_time, request_details, response.model_dump_json())
-            return response.choices[0].message.content
+            with tracer.span("model_wait", model=config.MODEL_QWEN):
+                response = self._chat_completion(client, request_details, timeout)
         except Exception as e:
             self.stats_manager.log_api_call(config.MODEL_QWEN, False, time.time() - start_time, request_details, str(e))
+            self._reject_key(api_key, e, time.time() - start_time, getattr(e, "status_code", None))
             raise # 重新抛出异常
+        self.key_pool.release(api_key, True, time.time() - start_time)
+        self.stats_manager.log_api_call(config.MODEL_QWEN, True, time.time() - start_time, request_details, response.model_dump_json())
+        self._local.last_model = config.MODEL_QWEN
+        if response.usage:
+            self._record_usage(config.MODEL_QWEN, response.usage.prompt_tokens, response.usage.completion_tokens,
+                               openai_cached_tokens(response.usage))
+        choice = response.choices[0]
+        return choice.message.content or "", choice.finish_reason == "length"
+
+    def translate_page(self, image_path, prompt, page_info=None, deadline=None):
+        """
+        统一的翻译入口，处理模型选择、重试和降级。
+        deadline 为本页的时间预算 (默认 PAGE_DEADLINE_SECONDS)，所有重试与降级共享，用尽时抛出 DeadlineExceededError
+        """
+        deadline = deadline or Deadline()
+        try:
+            return self._translate_page(image_path, prompt, page_info, deadline)
+        except DeadlineExceededError as e:
+            self.stats_manager.record_deadline_miss()
+            tracer.instant("deadline_miss", elapsed=round(deadline.elapsed(), 3))
+            Logger.error(f"{e}，本页标记为失败。", indent=3)
+            raise
 
-    def translate_page(self, image_path, prompt):
-        """统一的翻译入口，处理重试和降级"""
+    def _translate_page(self, image_path, prompt, page_info, deadline):
         global HAS_CONNECTED_ONCE
 
-        # 如果已锁定备用模型，直接使用
+        # 按权重在多个服务商之间分流 (仅在未锁定备用模型时)
+        provider = None
+        if config.PROVIDER_WEIGHTS and self.current_model_type == "gemini":
+            provider = self.key_pool.pick_provider(config.PROVIDER_WEIGHTS)
+        start_model = self._select_start_model(image_path, prompt, page_info, provider)
+
+        # 如果已锁定备用模型 (或选择器直接选中了备用模型)，跳过 Gemini
+        if self.current_model_type == "siliconflow" or start_model == config.MODEL_QWEN:
+            return self._translate_with_retry(self._call_qwen, "SiliconFlow Qwen", image_path, prompt, deadline)
         if self.current_model_type == "aliyun":
-            return self._translate_with_retry(self._call_aliyun_qwen, "Aliyun Qwen", image_path, prompt)
-        if self.current_model_type == "siliconflow":
-            return self._translate_with_retry(self._call_qwen, "SiliconFlow Qwen", image_path, prompt)
+            return self._translate_with_retry(self._call_aliyun_qwen, "Aliyun Qwen", image_path, prompt, deadline)
+        if start_model == config.MODEL_ALIYUN_QWEN:
+            return self._fallback_to_alternatives(image_path, prompt, deadline, lock=False)
 
         # === 尝试 Gemini 流程 ===
+        gemini_models = [config.MODEL_GEMINI_PRO, config.MODEL_GEMINI_FLASH]
+        if start_model in gemini_models:
+            gemini_models = gemini_models[gemini_models.index(start_model):]
+
         # 1. 网络检查 (仅针对 Gemini)
-        if not self.check_google_connection():
+        if not self.check_google_connection(deadline):
             Logger.warning("无法连接到 Google 服务。", indent=3)
             if HAS_CONNECTED_ONCE:
-                self._wait_for_connection() # 曾连上过，无限等
+                self._wait_for_connection(deadline) # 曾连上过，等到本页预算用尽
             else:
-                if not self._retry_connection_limited(): # 从未连上，有限重试
+                if not self._retry_connection_limited(deadline): # 从未连上，有限重试
                     Logger.warning("Google 连接失败，将尝试备用方案...", indent=3)
-                    return self._fallback_to_alternatives(image_path, prompt) # 直接进入备用流程
-        
-        # 2. 尝试 Gemini
-        try:
-            Logger.api_log(f"尝试使用 Gemini ({config.MODEL_GEMINI_PRO})...", indent=3)
-            return self._call_gemini(config.MODEL_GEMINI_PRO, prompt, image_path)
-        except Exception as e:
-            Logger.error(f"Gemini Pro 错误: {str(e)}", indent=3)
-            try:
-                Logger.api_log(f"尝试备用模型 Gemini ({config.MODEL_GEMINI_FLASH})...", indent=3)
-                return self._call_gemini(config.MODEL_GEMINI_FLASH, prompt, image_path)
-            except Exception as e2:
-                Logger.error(f"Gemini Flash 错误: {str(e2)}", indent=3)
-                Logger.warning("所有 Gemini 模型均调用失败。", indent=3)
-                # Gemini 彻底失败，进入备用流程
-                return self._fallback_to_alternatives(image_path, prompt)
+                    return self._fallback_to_alternatives(image_path, prompt, deadline) # 直接进入备用流程
+
+        # 2. 依次尝试 Gemini 模型 (Pro -> Flash)
+        for model_name in gemini_models:
+            attempt = 1
+            while True:
+                try:
+                    Logger.api_log(f"尝试使用 Gemini ({model_name})...", indent=3)
+                    with tracer.span("attempt", provider="gemini", model=model_name, attempt=attempt) as span, \
+                            Logger.bind(provider=model_name):
+                        result = self._call_gemini(model_name, prompt, image_path, deadline)
+                        span["ok"] = True
+                        return result
+                except DeadlineExceededError:
+                    raise
+                except KeyRejectedError as e:
+                    Logger.error(f"Gemini ({model_name}) 错误: {str(e)}", indent=3, provider=model_name)
+                    if not self.key_pool.has_available("gemini"):
+                        break
+                    attempt += 1  # 换一个 Key 立即重试
+                except Exception as e:
+                    Logger.error(f"Gemini ({model_name}) 错误: {str(e)}", indent=3, provider=model_name)
+                    break
 
-    def _fallback_to_alternatives(self, image_path, prompt):
-        """备用模型降级流程: Aliyun -> SiliconFlow"""
+        Logger.warning("所有 Gemini 模型均调用失败。", indent=3)
+        # Gemini 彻底失败，进入备用流程
+        return self._fallback_to_alternatives(image_path, prompt, deadline)
+
+    def _select_start_model(self, image_path, prompt, page_info, provider=None):
+        """
+        通过模型选择器确定本页的起始模型，未启用时返回 None (按默认顺序从 Gemini Pro 开始)。
+        provider 为按权重分流选中的服务商时，只在该服务商及其后的降级链中选择。
+        """
+        if self.current_model_type == "aliyun":
+            allowed_models = [config.MODEL_ALIYUN_QWEN, config.MODEL_QWEN]
+        elif self.current_model_type == "siliconflow":
+            allowed_models = [config.MODEL_QWEN]
+        elif provider:
+            allowed_models = config.MODEL_CHAIN[config.MODEL_CHAIN.index(PROVIDER_MODELS[provider][0]):]
+        else:
+            allowed_models = None
+        if not self.model_selector:
+            return allowed_models[0] if provider and self.current_model_type == "gemini" else None
+        return self.model_selector.select(image_path, prompt, page_info, allowed_models)
+
+    def _record_usage(self, model_name, input_tokens, output_tokens, cached_tokens=0):
+        """记录服务端返回的实际 token 用量 (cached_tokens 为输入中命中缓存的部分)，并与预算对账"""
+        if self.model_selector:
+            cost = self.model_selector.record_actual(model_name, input_tokens, output_tokens, cached_tokens)
+        else:
+            cost = ModelSelector.cost_of(model_name, input_tokens, output_tokens, cached_tokens)
+        self.stats_manager.record_usage(model_name, input_tokens, output_tokens, cost, cached_tokens)
+
+    def _fallback_to_alternatives(self, image_path, prompt, deadline, lock=True):
+        """备用模型降级流程: Aliyun -> SiliconFlow。lock=False 时不锁定后续页面使用的模型"""
         # 1. 尝试 Aliyun
         try:
             Logger.warning("切换至第一备用方案: Aliyun Qwen...", indent=3)
-            result = self._translate_with_retry(self._call_aliyun_qwen, config.MODEL_ALIYUN_QWEN, image_path, prompt) # 传递模型名称
-            self.current_model_type = "aliyun" # 锁定 Aliyun
-            Logger.info("已锁定使用 Aliyun Qwen 进行后续翻译。", indent=3)
+            result = self._translate_with_retry(self._call_aliyun_qwen, config.MODEL_ALIYUN_QWEN, image_path, prompt, deadline)
+            if lock:
+                self.current_model_type = "aliyun" # 锁定 Aliyun
+                self.locked_at = time.time()
+                tracer.instant("lock_provider", provider="aliyun")
+                Logger.info("已锁定使用 Aliyun Qwen 进行后续翻译。", indent=3)
             return result
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             Logger.error(f"Aliyun Qwen 错误: {e}", indent=3)
 
             # 2. 尝试 SiliconFlow
             try:
                 Logger.warning("切换至第二备用方案: SiliconFlow Qwen...", indent=3)
-                result = self._translate_with_retry(self._call_qwen, config.MODEL_QWEN, image_path, prompt) # 传递模型名称
-                self.current_model_type = "siliconflow" # 锁定 SiliconFlow
-                Logger.info("已锁定使用 SiliconFlow Qwen 进行后续翻译。", indent=3)
+                result = self._translate_with_retry(self._call_qwen, config.MODEL_QWEN, image_path, prompt, deadline)
+                if lock:
+                    self.current_model_type = "siliconflow" # 锁定 SiliconFlow
+                    self.locked_at = time.time()
+                    tracer.instant("lock_provider", provider="siliconflow")
+                    Logger.info("已锁定使用 SiliconFlow Qwen 进行后续翻译。", indent=3)
                 return result
+            except DeadlineExceededError:
+                raise
             except Exception as e2:
                 Logger.critical(f"所有备用方案均失败: {e2}", indent=3)
                 raise e2 # 抛出最终异常
 
-    def _wait_for_connection(self):
-        """无限等待网络恢复"""
+    def _wait_for_connection(self, deadline):
+        """等待网络恢复，最多等到本页的时间预算用尽 (预算为 0 时无限等待)"""
         attempt = 1
-        while not self.check_google_connection():
+        while not self.check_google_connection(deadline):
             Logger.warning(f"网络连接超时。由于程序之前已成功连接, 将持续重试。 (第 {attempt} 次)", indent=3)
-            time.sleep(10 if attempt < 10 else 30)
+            deadline.sleep(10 if attempt < 10 else 30, "等待网络恢复")
             attempt += 1
         Logger.success("网络连接已恢复！", indent=3)
 
-    def _retry_connection_limited(self):
+    def _retry_connection_limited(self, deadline):
         """有限次数重试连接，成功返回True，失败返回False"""
         for i in range(config.INITIAL_RETRY_LIMIT):
             Logger.retry_log(
                 f"{config.RETRY_DELAY} 秒后进行第 {i + 1} 次重试... (剩余 {config.INITIAL_RETRY_LIMIT - i - 1} 次)",
                 indent=3)
-            time.sleep(config.RETRY_DELAY)
-            if self.check_google_connection():
+            deadline.sleep(config.RETRY_DELAY)
+            if self.check_google_connection(deadline):
                 return True
         return False
 
-    def _translate_with_retry(self, func, model_name, image_path, prompt): # 接收 model_name
+    def _translate_with_retry(self, func, model_name, image_path, prompt, deadline): # 接收 model_name
         """通用的 API 调用重试逻辑"""
         retry_count = 0
         max_retries = 5
 
-        while retry_count < max_retries:
-            try:
-                Logger.api_log(f"正在连接 {model_name}...", indent=3)
-                res = func(prompt, image_path) # func 内部会记录 log_api_call
-                if res:
-                    return res
-            except Exception as e:
-                Logger.error(f"{model_name} 连接失败: {e}", indent=3)
-                retry_count += 1
-                if retry_count < max_retries:
-                    Logger.retry_log(f"{config.RETRY_DELAY} 秒后进行第 {retry_count} 次重试...", indent=3)
-                    time.sleep(config.RETRY_DELAY)
-
-        Logger.critical(f"所有重试均失败 ({model_name})。", indent=3)
+        with Logger.bind(provider=model_name):
+            while retry_count < max_retries:
+                try:
+                    Logger.api_log(f"正在连接 {model_name}...", indent=3, attempt=retry_count + 1)
+                    with tracer.span("attempt", provider=model_name, model=model_name, attempt=retry_count + 1) as span:
+                        res = func(prompt, image_path, deadline) # func 内部会记录 log_api_call
+                        span["ok"] = bool(res)
+                    if res:
+                        return res
+                    # 空结果同样计为一次失败的尝试，避免模型持续返回空文本时一直重试到时间预算用尽
+                    raise RuntimeError("返回空结果")
+                except (ProviderNotConfiguredError, DeadlineExceededError):
+                    raise
+                except KeyRejectedError as e:
+                    # Key 已停用，下一次尝试会换用其他 Key，无需等待
+                    Logger.error(f"{model_name} 连接失败: {e}", indent=3)
+                    retry_count += 1
+                except Exception as e:
+                    Logger.error(f"{model_name} 连接失败: {e}", indent=3)
+                    retry_count += 1
+                    if retry_count < max_retries:
+                        Logger.retry_log(f"{config.RETRY_DELAY} 秒后进行第 {retry_count} 次重试...", indent=3)
+                        deadline.sleep(config.RETRY_DELAY)
+
+        Logger.critical(f"所有重试均失败 ({model_name})。", indent=3, provider=model_name)
         raise Exception(f"{model_name} Failed")
\ No newline at end of file
@@ -0,0 +1,148 @@
+# bench_corpus.py
+"""
+使用 PyMuPDF 生成合成论文语料，供渲染与流水线基准测试使用。
+版式: single (单栏) / double (双栏) / math (公式密集) / figure (图片密集)
+"""
+import os
+import random
+import fitz  # PyMuPDF
+
+LAYOUTS = ("single", "double", "math", "figure")
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 (pt)
+MARGIN = 56
+
+WORDS = (
+    "graph neural network integration test order class importance reinforcement learning "
+    "policy reward agent state action coupling dependency stub minimization experiment "
+    "baseline evaluation dataset benchmark method approach result analysis proposed "
+    "framework algorithm complexity convergence optimal strategy software system"
+).split()
+
+
+def _paragraph(rng, words=120):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _fill_column(page, rect, rng, fontsize=9.5):
+    """用若干段落填满一个文本区域 (放不下时 insert_textbox 不写入任何内容，因此逐步减少段落)"""
+    paragraphs = [_paragraph(rng) for _ in range(10)]
+    while paragraphs:
+        if page.insert_textbox(rect, "\n".join(paragraphs), fontsize=fontsize, fontname="helv") >= 0:
+            return
+        paragraphs.pop()
+
+
+def _draw_single(page, rng):
+    _fill_column(page, fitz.Rect(MARGIN, MARGIN + 30, PAGE_WIDTH - MARGIN, PAGE_HEIGHT - MARGIN), rng, fontsize=10)
+
+
+def _draw_double(page, rng):
+    gap = 18
+    col_width = (PAGE_WIDTH - 2 * MARGIN - gap) / 2
+    for col in range(2):
+        x0 = MARGIN + col * (col_width + gap)
+        _fill_column(page, fitz.Rect(x0, MARGIN + 30, x0 + col_width, PAGE_HEIGHT - MARGIN), rng, fontsize=8.5)
+
+
+def _draw_math(page, rng):
+    """公式密集页: 大量小字号上下标与分数线等矢量元素"""
+    y = MARGIN + 40
+    eq_num = 1
+    while y < PAGE_HEIGHT - MARGIN - 40:
+        x = MARGIN + 40
+        for _ in range(rng.randint(4, 8)):
+            symbol = rng.choice(["Q", "x", "y", "a", "s", "r", "V", "P", "L"])
+            page.insert_text((x, y), symbol, fontsize=11, fontname="tiro")
+            page.insert_text((x + 7, y + 4), f"{rng.randint(0, 9)}", fontsize=6)      # 下标
+            page.insert_text((x + 7, y - 5), f"{rng.choice('ijkt')}", fontsize=6)    # 上标
+            if rng.random() < 0.4:
+                # 分数: 分子、分数线、分母
+                page.draw_line((x + 16, y - 2), (x + 40, y - 2), width=0.5)
+                page.insert_text((x + 20, y - 5), "1", fontsize=7)
+                page.insert_text((x + 20, y + 7), "n", fontsize=7)
+                x += 48
+            else:
+                page.insert_text((x + 16, y), rng.choice(["+", "-", "=", "<"]), fontsize=11)
+                x += 30
+        page.insert_text((PAGE_WIDTH - MARGIN - 30, y), f"({eq_num})", fontsize=9)
+        eq_num += 1
+        y += 24
+        if rng.random() < 0.3:
+            page.insert_textbox(fitz.Rect(MARGIN, y, PAGE_WIDTH - MARGIN, y + 40), _paragraph(rng, 40), fontsize=8)
+            y += 44
+
+
+def _noise_image(rng, width=320, height=220):
+    """生成一张带渐变与噪声的 RGB 位图，近似真实论文插图的压缩难度"""
+    samples = bytearray(width * height * 3)
+    for yy in range(height):
+        row = yy * width * 3
+        for xx in range(0, width * 3, 3):
+            base = (xx // 3 + yy) % 256
+            samples[row + xx] = base
+            samples[row + xx + 1] = (base * 3 + rng.randint(0, 40)) % 256
+            samples[row + xx + 2] = 255 - base
+    return fitz.Pixmap(fitz.csRGB, width, height, bytes(samples), 0)
+
+
+def _draw_figure(page, rng, image_xref_cache):
+    """图片密集页: 嵌入位图 + 矢量折线图"""
+    if "pix" not in image_xref_cache:
+        image_xref_cache["pix"] = _noise_image(rng)
+    half = (PAGE_WIDTH - 2 * MARGIN) / 2
+    for row in range(3):
+        y0 = MARGIN + 30 + row * 250
+        img_rect = fitz.Rect(MARGIN, y0, MARGIN + half - 8, y0 + 200)
+        xref = image_xref_cache.get("xref", 0)
+        if xref:
+            page.insert_image(img_rect, xref=xref)
+        else:
+            image_xref_cache["xref"] = page.insert_image(img_rect, pixmap=image_xref_cache["pix"])
+        # 矢量折线图
+        plot = fitz.Rect(MARGIN + half + 8, y0, PAGE_WIDTH - MARGIN, y0 + 200)
+        page.draw_rect(plot, width=0.6)
+        points = [fitz.Point(plot.x0 + i * plot.width / 40, plot.y1 - rng.random() * plot.height) for i in range(41)]
+        page.draw_polyline(points, color=(0.1, 0.3, 0.8), width=0.8)
+        page.insert_text((MARGIN, y0 + 215), f"Figure {row + 1}: synthetic figure caption.", fontsize=8)
+
+
+def make_synthetic_paper(pdf_path, num_pages, layout="double", seed=0):
+    """生成一篇指定页数与版式的合成论文"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"未知版式: {layout}，可选: {LAYOUTS}")
+    rng = random.Random(seed)
+    doc = fitz.open()
+    image_xref_cache = {}
+    for page_num in range(num_pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page.insert_text((MARGIN, MARGIN + 10), f"Synthetic {layout} paper - page {page_num + 1}", fontsize=14)
+        if layout == "single":
+            _draw_single(page, rng)
+        elif layout == "double":
+            _draw_double(page, rng)
+        elif layout == "math":
+            _draw_math(page, rng)
+        else:
+            # 图片页文档也保留一部分正文页
+            if page_num % 3 == 2:
+                _draw_double(page, rng)
+            else:
+                _draw_figure(page, rng, image_xref_cache)
+    doc.save(pdf_path, garbage=3, deflate=True)
+    doc.close()
+    return pdf_path
+
+
+def ensure_corpus(corpus_dir, layouts=LAYOUTS, page_counts=(10, 50), seed=0):
+    """生成 (或复用已生成的) 语料，返回 {(layout, pages): pdf_path}"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = {}
+    for layout in layouts:
+        for num_pages in page_counts:
+            pdf_path = os.path.join(corpus_dir, f"{layout}_{num_pages}p.pdf")
+            if not os.path.exists(pdf_path):
+                make_synthetic_paper(pdf_path, num_pages, layout, seed)
+            corpus[(layout, num_pages)] = pdf_path
+    return corpus
@@ -0,0 +1,156 @@
+# bench_pipeline.py
+"""
+端到端吞吐基准测试: 启动本地 mock_server，将 config.py 的端点指向它，
+在每个场景下完整运行一次 main.main()，报告 pages/min、尾延迟、上传数据量和降级情况。
+--modes image pdf 在每个场景下分别以图片模式与原生 PDF 模式运行，便于对比两种模式
+(可配合 --uplink-kbps 模拟受限的上行带宽)。
+
+用法:
+    python bench_pipeline.py --scenarios baseline flaky gemini_down --pages 10 --time-scale 0.2
+    python bench_pipeline.py --scenarios baseline no_pdf_input --modes image pdf --uplink-kbps 20000
+"""
+import os
+import io
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime
+import config
+import main as pipeline
+import ai_handler
+from tracer import tracer
+from mock_server import SCENARIOS, start_mock_server
+from bench_corpus import make_synthetic_paper
+
+
+def _latest_summary(summary_dir):
+    files = sorted(f for f in os.listdir(summary_dir) if f.startswith("summary_"))
+    if not files:
+        return None
+    with open(os.path.join(summary_dir, files[-1]), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_scenario(scenario_name, work_dir, num_papers, num_pages, time_scale, retry_delay, seed, verbose,
+                 mode="image", uplink_kbps=0):
+    """在一个场景下以 mode (image / pdf) 运行完整流水线，返回报告字典"""
+    scenario_dir = os.path.join(work_dir, f"{scenario_name}_{mode}")
+    data_dir = os.path.join(scenario_dir, 'Data')
+    os.makedirs(data_dir, exist_ok=True)
+    for i in range(num_papers):
+        make_synthetic_paper(os.path.join(data_dir, f"bench_paper_{i + 1}.pdf"), num_pages, layout="double", seed=i)
+
+    server = start_mock_server(scenario_name, time_scale=time_scale, seed=seed, uplink_kbps=uplink_kbps)
+    overrides = {
+        "DATA_DIR": data_dir,
+        "OUTPUT_DIR": os.path.join(scenario_dir, 'output'),
+        "TRANS_DIR": os.path.join(scenario_dir, 'Trans'),
+        "TRACE_DIR": os.path.join(scenario_dir, 'output', 'traces'),
+        "JOB_DB_PATH": os.path.join(scenario_dir, 'output', 'jobs.sqlite3'),
+        # 性能历史与预检缓存也放在场景目录内，避免模拟运行混入真实 output 目录的滚动基线
+        "PERF_HISTORY_DB": os.path.join(scenario_dir, 'output', 'perf_history.sqlite3'),
+        "PREFLIGHT_CACHE_FILE": os.path.join(scenario_dir, 'output', 'preflight_cache.json'),
+        "GOOGLE_API_KEY": "mock-google-key",
+        "DASHSCOPE_API_KEY": "mock-dashscope-key",
+        "QWEN_API_KEY": "mock-qwen-key",
+        "GOOGLE_API_KEYS": ["mock-google-key"],
+        "DASHSCOPE_API_KEYS": ["mock-dashscope-key"],
+        "QWEN_API_KEYS": ["mock-qwen-key"],
+        "RETRY_DELAY": retry_delay,
+        "PDF_NATIVE_ENABLED": mode == "pdf",
+    }
+    overrides.update(server.endpoint_env())
+    saved = {key: getattr(config, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    ai_handler.HAS_CONNECTED_ONCE = False
+    tracer.clear()
+
+    start = time.time()
+    try:
+        sink = None if verbose else io.StringIO()
+        with contextlib.redirect_stdout(sink) if sink else contextlib.nullcontext():
+            pipeline.main([])
+    finally:
+        elapsed = time.time() - start
+        for key, value in saved.items():
+            setattr(config, key, value)
+        mock_counts = server.stats.snapshot()
+        server.shutdown()
+        server.server_close()
+
+    summary = _latest_summary(os.path.join(overrides["OUTPUT_DIR"], 'summaries')) or {}
+    exec_summary = summary.get("execution_summary", {})
+    pages = exec_summary.get("translated_pages", 0)
+    uploads = summary.get("upload_stats", {})
+    return {
+        "scenario": scenario_name,
+        "mode": mode,
+        "papers": num_papers,
+        "pages": pages,
+        "wall_seconds": elapsed,
+        "pages_per_minute": pages / elapsed * 60 if elapsed > 0 else 0,
+        "page_time_percentiles_seconds": exec_summary.get("page_time_percentiles_seconds", {}),
+        "upload_bytes": uploads.get("request_bytes", 0) + uploads.get("file_bytes", 0),
+        "model_usage": {m: u for m, u in summary.get("model_usage_stats", {}).items() if u["success"] + u["failure"] > 0},
+        "mock_responses": mock_counts,
+    }
+
+
+def format_report(results):
+    """生成终端可读的报告"""
+    lines = ["=" * 88, f"{'场景':<18}{'模式':<7}{'页数':>6}{'耗时(s)':>10}{'pages/min':>11}{'上传(MB)':>10}"
+                       f"{'P50':>8}{'P90':>8}{'P99':>8}", "-" * 88]
+    for r in results:
+        pct = r["page_time_percentiles_seconds"]
+        lines.append(
+            f"{r['scenario']:<18}{r['mode']:<7}{r['pages']:>6}{r['wall_seconds']:>10.1f}{r['pages_per_minute']:>11.1f}"
+            f"{r['upload_bytes'] / 1e6:>10.2f}{pct.get('p50', 0):>8.2f}{pct.get('p90', 0):>8.2f}{pct.get('p99', 0):>8.2f}"
+        )
+    lines.append("-" * 88)
+    lines.append("降级情况 (模型: 成功/失败):")
+    for r in results:
+        usage = ", ".join(f"{m}: {u['success']}/{u['failure']}" for m, u in r["model_usage"].items())
+        lines.append(f"  {r['scenario'] + '/' + r['mode']:<22} {usage or '-'}")
+    lines.append("=" * 88)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用本地模拟服务测量流水线吞吐")
+    parser.add_argument("--scenarios", nargs="+", default=["baseline", "slow_tail", "flaky", "gemini_down"],
+                        choices=sorted(SCENARIOS), help="要运行的场景")
+    parser.add_argument("--papers", type=int, default=1, help="每个场景的论文数量")
+    parser.add_argument("--pages", type=int, default=10, help="每篇论文的页数")
+    parser.add_argument("--time-scale", type=float, default=0.2, help="模拟延迟缩放系数")
+    parser.add_argument("--retry-delay", type=float, default=0.2, help="覆盖 config.RETRY_DELAY")
+    parser.add_argument("--seed", type=int, default=42, help="模拟服务随机种子")
+    parser.add_argument("--modes", nargs="+", default=["image"], choices=["image", "pdf"],
+                        help="页面发送方式: image 渲染为图片 / pdf 原生 PDF，指定多个时逐一对比")
+    parser.add_argument("--uplink-kbps", type=float, default=0, help="模拟上行带宽 (kbit/s)，0 表示不限制")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    parser.add_argument("--verbose", action="store_true", help="显示流水线原始日志")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="pdf_trans_bench_")
+    results = []
+    try:
+        for name in args.scenarios:
+            for mode in args.modes:
+                print(f"运行场景: {name} ({mode}) ...")
+                results.append(run_scenario(name, work_dir, args.papers, args.pages, args.time_scale,
+                                            args.retry_delay, args.seed, args.verbose, mode, args.uplink_kbps))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(format_report(results))
+    report_dir = os.path.join(config.OUTPUT_DIR, 'benchmarks')
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"基准报告已保存至: {report_path}")
@@ -0,0 +1,166 @@
+# bench_render.py
+"""
+渲染/编码基准测试: 在合成语料上比较不同 DPI、编码格式和并行度下的
+pages/sec、bytes/page 与峰值内存 (RSS)，并可与历史报告对比以发现性能回退。
+
+用法:
+    python bench_render.py --layouts single double --pages 10 50 --dpis 150 300 --formats png jpeg --workers 1 4
+    python bench_render.py --baseline output/benchmarks/render_20250101_120000.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import fitz  # PyMuPDF
+import config
+from bench_corpus import LAYOUTS, ensure_corpus
+from pdf_processor import render_page_pixmap, encode_pixmap
+
+try:
+    import resource  # 仅类 Unix 系统可用
+except ImportError:
+    resource = None
+
+
+def _render_range(pdf_path, start, end, dpi, img_format, jpg_quality):
+    """渲染并编码 [start, end) 范围内的页面，返回 (页数, 总字节数)"""
+    doc = fitz.open(pdf_path)
+    total_bytes = 0
+    for page_num in range(start, end):
+        pix = render_page_pixmap(doc.load_page(page_num), dpi)
+        total_bytes += len(encode_pixmap(pix, img_format, jpg_quality))
+    doc.close()
+    return end - start, total_bytes
+
+
+def _peak_rss_mb():
+    """返回 (当前进程峰值, 子进程峰值) RSS，单位 MB"""
+    if resource is None:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS 以字节为单位，Linux 以 KB 为单位
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return self_rss, children_rss
+
+
+def _run_config(pdf_path, dpi, img_format, jpg_quality, workers, result_queue):
+    """在独立子进程中运行一组配置，保证峰值 RSS 互不干扰"""
+    doc = fitz.open(pdf_path)
+    num_pages = len(doc)
+    doc.close()
+
+    start = time.perf_counter()
+    if workers <= 1:
+        pages, total_bytes = _render_range(pdf_path, 0, num_pages, dpi, img_format, jpg_quality)
+    else:
+        step = (num_pages + workers - 1) // workers
+        ranges = [(s, min(s + step, num_pages)) for s in range(0, num_pages, step)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_render_range, pdf_path, s, e, dpi, img_format, jpg_quality) for s, e in ranges]
+            results = [f.result() for f in futures]
+        pages = sum(r[0] for r in results)
+        total_bytes = sum(r[1] for r in results)
+    elapsed = time.perf_counter() - start
+
+    self_rss, children_rss = _peak_rss_mb()
+    result_queue.put({
+        "pages": pages,
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed > 0 else 0,
+        "bytes_per_page": total_bytes / pages if pages else 0,
+        "peak_rss_mb": self_rss,
+        "peak_worker_rss_mb": children_rss if workers > 1 else None,
+    })
+
+
+def measure(pdf_path, dpi, img_format, jpg_quality=90, workers=1):
+    """运行一组配置并返回测量结果"""
+    result_queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_run_config, args=(pdf_path, dpi, img_format, jpg_quality, workers, result_queue))
+    proc.start()
+    result = result_queue.get()
+    proc.join()
+    return result
+
+
+def _config_key(row):
+    return f"{row['layout']}|{row['num_pages']}|{row['dpi']}|{row['format']}|{row['workers']}"
+
+
+def find_regressions(results, baseline_results, tolerance):
+    """对比历史报告，返回 pages/sec 下降或 bytes/page 上升超过阈值的配置"""
+    baseline = {_config_key(row): row for row in baseline_results}
+    regressions = []
+    for row in results:
+        old = baseline.get(_config_key(row))
+        if not old:
+            continue
+        if old["pages_per_sec"] and row["pages_per_sec"] < old["pages_per_sec"] * (1 - tolerance):
+            regressions.append((row, "pages_per_sec", old["pages_per_sec"], row["pages_per_sec"]))
+        if old["bytes_per_page"] and row["bytes_per_page"] > old["bytes_per_page"] * (1 + tolerance):
+            regressions.append((row, "bytes_per_page", old["bytes_per_page"], row["bytes_per_page"]))
+    return regressions
+
+
+def format_report(results):
+    header = f"{'版式':<8}{'页数':>6}{'DPI':>6}{'格式':>7}{'进程':>6}{'pages/s':>10}{'KB/page':>10}{'RSS(MB)':>9}{'工作进程RSS':>12}"
+    lines = ["=" * 84, header, "-" * 84]
+    for r in results:
+        worker_rss = f"{r['peak_worker_rss_mb']:.0f}" if r.get("peak_worker_rss_mb") else "-"
+        rss = f"{r['peak_rss_mb']:.0f}" if r.get("peak_rss_mb") else "-"
+        lines.append(
+            f"{r['layout']:<8}{r['num_pages']:>6}{r['dpi']:>6}{r['format']:>7}{r['workers']:>6}"
+            f"{r['pages_per_sec']:>10.2f}{r['bytes_per_page'] / 1024:>10.1f}{rss:>9}{worker_rss:>12}"
+        )
+    lines.append("=" * 84)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF 渲染/编码基准测试")
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=LAYOUTS)
+    parser.add_argument("--pages", nargs="+", type=int, default=[10, 50], help="合成论文页数 (最大可到 500)")
+    parser.add_argument("--dpis", nargs="+", type=int, default=[150, 200, 300])
+    parser.add_argument("--formats", nargs="+", default=["png", "jpeg"], choices=["png", "jpeg"])
+    parser.add_argument("--jpg-quality", type=int, default=90)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--corpus-dir", default=os.path.join(config.OUTPUT_DIR, 'benchmarks', 'corpus'))
+    parser.add_argument("--baseline", help="历史报告 JSON，用于检测性能回退")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="允许的回退比例")
+    args = parser.parse_args()
+
+    print("准备合成语料...")
+    corpus = ensure_corpus(args.corpus_dir, args.layouts, args.pages)
+
+    results = []
+    for (layout, num_pages), pdf_path in corpus.items():
+        for dpi in args.dpis:
+            for img_format in args.formats:
+                for workers in args.workers:
+                    print(f"  {layout} {num_pages}p @ {dpi}dpi {img_format} x{workers} ...")
+                    row = {"layout": layout, "num_pages": num_pages, "dpi": dpi, "format": img_format, "workers": workers}
+                    row.update(measure(pdf_path, dpi, img_format, args.jpg_quality, workers))
+                    results.append(row)
+
+    print(format_report(results))
+
+    report_dir = os.path.join(config.OUTPUT_DIR, 'benchmarks')
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"render_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"基准报告已保存至: {report_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n检测到 {len(regressions)} 项性能回退 (阈值 {args.tolerance:.0%}):")
+            for row, metric, old, new in regressions:
+                print(f"  {_config_key(row)}: {metric} {old:.2f} -> {new:.2f}")
+            sys.exit(1)
+        print("\n未检测到性能回退。")
@@ -0,0 +1,198 @@
+# cassette.py
+"""
+服务商流量的录制 / 回放 (cassette):
+  record - 正常调用服务商，同时按请求指纹 (模型 + 提示词 + 图片的 SHA-256) 保存完整响应，
+           Gemini SSE 响应逐行记录到达时间，错误响应 (HTTP 错误、网络异常) 同样记录
+  replay - 不访问网络，按指纹返回录制的响应，并按录制时的节奏 (可加速) 输出，
+           用于离线复现慢页面 / 失败页面，以及对解析、合并逻辑做可重复的基准测试
+
+目录结构:
+  <CASSETTE_DIR>/index.jsonl         每行一次录制: 指纹、模型、状态、时间轴、内容摘要
+  <CASSETTE_DIR>/blobs/ab/<摘要>.gz  响应内容 (gzip)，按内容摘要去重
+同一指纹录制了多次时按出现顺序依次回放 (超出录制次数时重复最后一次)。
+"""
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+import config
+
+RECORD, REPLAY = "record", "replay"
+
+
+class CassetteMissError(Exception):
+    """回放模式下没有找到对应请求的录制"""
+    pass
+
+
+class ReplayedAPIError(Exception):
+    """回放录制的 OpenAI 兼容接口错误 (保留状态码，供 Key 池判断)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def fingerprint(model_name, payload):
+    """请求指纹: 模型与完整请求内容 (提示词、base64 图片、续写内容) 的 SHA-256"""
+    raw = json.dumps({"model": model_name, "payload": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path, mode, speed=1.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.index_path = os.path.join(path, "index.jsonl")
+        self._lock = threading.Lock()
+        self._entries = {}   # 指纹 -> [录制条目]
+        self._replayed = {}  # 指纹 -> 已回放次数
+        os.makedirs(os.path.join(path, "blobs"), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["fp"], []).append(entry)
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    def count(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    # ---------- 内容存储 (按摘要去重) ----------
+    def _blob_path(self, digest):
+        return os.path.join(self.path, "blobs", digest[:2], f"{digest}.gz")
+
+    def _put_blob(self, content):
+        data = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(gzip.compress(data, mtime=0))
+            os.replace(tmp_path, path)
+        return digest
+
+    def _get_blob(self, digest):
+        with open(self._blob_path(digest), "rb") as f:
+            return json.loads(gzip.decompress(f.read()).decode("utf-8"))
+
+    # ---------- 录制 ----------
+    def record(self, fp, model_name, kind, content, status=None, offsets=None, latency=None, error=None):
+        """
+        kind: "sse" (content 为响应行列表，offsets 为各行相对请求开始的到达时间)、
+              "json" (content 为响应 JSON)、"error" (content 为错误响应正文)、"exception" (网络异常)
+        """
+        entry = {
+            "fp": fp, "model": model_name, "kind": kind, "status": status,
+            "blob": self._put_blob(content), "offsets": [round(t, 4) for t in offsets or []],
+            "latency": round(latency, 4) if latency is not None else None, "error": error,
+            "recorded_at": time.time(),
+        }
+        with self._lock:
+            self._entries.setdefault(fp, []).append(entry)
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    # ---------- 回放 ----------
+    def next(self, fp, model_name=None):
+        """取出该指纹下一次的录制，返回 (条目, 内容)"""
+        with self._lock:
+            entries = self._entries.get(fp)
+            if not entries:
+                raise CassetteMissError(f"回放模式下没有找到 {model_name or ''} 请求的录制 (指纹 {fp[:12]})")
+            count = self._replayed.get(fp, 0)
+            self._replayed[fp] = count + 1
+            entry = entries[min(count, len(entries) - 1)]
+        return entry, self._get_blob(entry["blob"])
+
+    def wait(self, seconds):
+        """按回放速度等待 (speed 为 0 时不等待)"""
+        if seconds and seconds > 0 and self.speed > 0:
+            time.sleep(seconds / self.speed)
+
+
+def open_cassette():
+    """根据 config.CASSETTE_MODE 打开 cassette，未启用时返回 None"""
+    if config.CASSETTE_MODE not in (RECORD, REPLAY):
+        return None
+    return Cassette(config.CASSETTE_DIR, config.CASSETTE_MODE, config.CASSETTE_REPLAY_SPEED)
+
+
+class RecordingSSEResponse:
+    """包装 requests 的流式响应: 透传给调用方的同时记录每一行及其到达时间"""
+
+    def __init__(self, response, cassette, fp, model_name, start_time):
+        self._response = response
+        self._cassette = cassette
+        self._fp = fp
+        self._model_name = model_name
+        self._start = start_time
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def raise_for_status(self):
+        import requests
+        try:
+            self._response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            self._cassette.record(self._fp, self._model_name, "error", self._response.text,
+                                  status=self._response.status_code, latency=time.time() - self._start)
+            raise
+
+    def iter_lines(self, *args, **kwargs):
+        lines, offsets, error = [], [], None
+        try:
+            for line in self._response.iter_lines(*args, **kwargs):
+                lines.append(line.decode("utf-8") if isinstance(line, bytes) else line)
+                offsets.append(time.time() - self._start)
+                yield line
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            raise
+        finally:
+            self._cassette.record(self._fp, self._model_name, "sse", lines, status=self._response.status_code,
+                                  offsets=offsets, latency=time.time() - self._start, error=error)
+
+
+class ReplayedSSEResponse:
+    """按录制的时间轴回放 Gemini SSE 响应，接口与 requests.Response 的常用部分一致"""
+
+    def __init__(self, cassette, entry, content):
+        self._cassette = cassette
+        self._entry = entry
+        self._content = content
+        self.status_code = entry["status"] or 200
+        self.text = content if entry["kind"] == "error" else "\n".join(content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            self._cassette.wait(self._entry["latency"])
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (replayed)", response=self)
+
+    def close(self):
+        pass
+
+    def iter_lines(self, *args, **kwargs):
+        import requests
+        elapsed = 0.0
+        for line, offset in zip(self._content, self._entry["offsets"]):
+            self._cassette.wait(offset - elapsed)
+            elapsed = offset
+            yield line.encode("utf-8")
+        if self._entry.get("error"):
+            raise requests.exceptions.ConnectionError(f"{self._entry['error']} (replayed)")
@@ -7,6 +7,10 @@ import os
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "你的_GOOGLE_API_KEY")
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", "你的_DASHSCOPE_API_KEY") # 阿里云 DashScope Key
 QWEN_API_KEY = os.getenv("QWEN_API_KEY", "你的_QWEN_API_KEY") # 硅基流动或其他兼容OpenAI的Key
+# 多个 Key (逗号分隔) 组成 Key 池，按进行中请求最少分配；未设置时使用上面的单个 Key
+GOOGLE_API_KEYS = [k.strip() for k in os.getenv("GOOGLE_API_KEYS", "").split(",") if k.strip()] or [GOOGLE_API_KEY]
+DASHSCOPE_API_KEYS = [k.strip() for k in os.getenv("DASHSCOPE_API_KEYS", "").split(",") if k.strip()] or [DASHSCOPE_API_KEY]
+QWEN_API_KEYS = [k.strip() for k in os.getenv("QWEN_API_KEYS", "").split(",") if k.strip()] or [QWEN_API_KEY]
 
 # 2. 路径配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,19 +22,185 @@ TRANS_DIR = os.path.join(BASE_DIR, 'Trans')
 # Gemini
 MODEL_GEMINI_PRO = "gemini-2.5-pro"  # 优先
 MODEL_GEMINI_FLASH = "gemini-2.5-flash"  # 备用
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")  # Gemini 地址 (可指向本地 mock_server)
+GEMINI_UPLOAD_BASE = os.getenv("GEMINI_UPLOAD_BASE", "https://generativelanguage.googleapis.com/upload/v1beta")  # Files API 上传地址
 # Aliyun
 MODEL_ALIYUN_QWEN = "qwen-vl-max" # 阿里云第一备用
-DASHSCOPE_API_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"  # 阿里云地址
+DASHSCOPE_API_URL = os.getenv("DASHSCOPE_API_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")  # 阿里云地址
 # SiliconFlow
 MODEL_QWEN = "Qwen/QVQ-72B-Preview" # 最终备用
-QWEN_API_URL = "https://api.siliconflow.cn/v1" # 硅基流动地址
+QWEN_API_URL = os.getenv("QWEN_API_URL", "https://api.siliconflow.cn/v1") # 硅基流动地址
 
 
 # 4. 网络与重试配置
-GOOGLE_TEST_URL = "https://www.google.com"
+GOOGLE_TEST_URL = os.getenv("GOOGLE_TEST_URL", "https://www.google.com")
 INITIAL_RETRY_LIMIT = 5  # 首次运行失败重试次数
 NETWORK_TIMEOUT = 30     # 请求超时时间(秒)
 RETRY_DELAY = 5          # 重试等待基数(秒)
+PAGE_DEADLINE_SECONDS = 300  # 单页端到端时间预算(秒): 重试、降级与等待网络共享，用尽后该页标记为失败；0 不限制
+REQUEST_TIMEOUT = 60     # 单次模型请求的超时上限(秒)，实际取该值与剩余预算的较小者
+MIN_ATTEMPT_SECONDS = 5  # 剩余预算少于此值时不再发起新的请求
+
+# 5. 性能追踪配置
+TRACE_ENABLED = True     # 记录各阶段耗时 (渲染、编码、上传、等待模型、解析、保存、合并)
+TRACE_DIR = os.path.join(OUTPUT_DIR, 'traces')  # Chrome trace-event JSON 保存目录，可用 Perfetto 打开
+TRACE_MAX_EVENTS = 200000  # 单次运行最多保留的事件数，超出后丢弃
+
+# 6. 模型选择与预算配置
+MODEL_SELECTION_ENABLED = True  # 按页估算 token 并选择最便宜且满足要求的模型
+# 降级顺序 (与 AIHandler 的重试/降级链一致)
+MODEL_CHAIN = [MODEL_GEMINI_PRO, MODEL_GEMINI_FLASH, MODEL_ALIYUN_QWEN, MODEL_QWEN]
+# 价格 (美元 / 百万 token)、质量等级 (越高越好) 与图片 token 计算方式；cached_input 为命中上下文缓存的输入价格 (未设置时按 input 计)
+MODEL_PRICING = {
+    MODEL_GEMINI_PRO: {"input": 1.25, "cached_input": 0.31, "output": 10.0, "quality": 3, "image_tokenizer": "gemini"},
+    MODEL_GEMINI_FLASH: {"input": 0.30, "cached_input": 0.075, "output": 2.50, "quality": 2, "image_tokenizer": "gemini"},
+    MODEL_ALIYUN_QWEN: {"input": 0.23, "cached_input": 0.046, "output": 0.57, "quality": 2, "image_tokenizer": "qwen"},
+    MODEL_QWEN: {"input": 1.20, "output": 1.20, "quality": 1, "image_tokenizer": "qwen"},
+}
+# 各类页面要求的最低质量等级 (sparse: 封面/空白/少量文字, dense: 公式表格密集)
+PAGE_QUALITY_REQUIREMENTS = {"sparse": 1, "normal": 3, "dense": 3}
+SPARSE_PAGE_CHARS = 300    # 文字层少于该字符数且无图片视为 sparse
+DENSE_PAGE_CHARS = 4000    # 文字层多于该字符数视为 dense
+CHARS_PER_TOKEN = 2.5      # 文本 token 估算系数
+QWEN_MAX_IMAGE_TOKENS = 1280  # Qwen-VL 单图最大 token (max_pixels = 该值 * 28 * 28)
+MAX_OUTPUT_TOKENS = 4000   # 单次调用输出上限
+MAX_CONTINUATIONS = 3      # 输出因长度上限被截断时最多续写的次数
+# 预算 (0 表示不限制)
+PAPER_TOKEN_BUDGET = 0
+PAPER_COST_BUDGET = 0      # 美元
+RUN_TOKEN_BUDGET = 0
+RUN_COST_BUDGET = 0        # 美元
+BUDGET_DOWNGRADE_RATIO = 0.8  # 预算使用超过该比例后降级到最便宜的模型
+
+# 7. 守护进程 (监听 Data 文件夹) 配置
+WATCH_POLL_INTERVAL = 5      # 扫描 Data 文件夹的间隔(秒)
+WATCH_STABLE_SECONDS = 10    # 文件大小与修改时间保持不变多久后才视为写入完成(秒)
+DAEMON_WORKERS = 2           # 同时处理的论文数量 (每篇论文内部仍按页顺序翻译以保留上下文)
+PROVIDER_LOCK_TTL = 1800     # 锁定备用模型多久后重新尝试 Gemini(秒)
+DAEMON_STATE_FILE = os.path.join(OUTPUT_DIR, 'daemon_state.json')  # 已处理文件的指纹记录
+DAEMON_FLUSH_INTERVAL = 3600  # 定期保存执行总结、性能历史与阶段耗时追踪并清空内存中的记录的间隔(秒)
+
+# 8. 任务队列 (SQLite) 配置
+JOB_DB_PATH = os.path.join(OUTPUT_DIR, 'jobs.sqlite3')  # 论文/页面状态数据库，多个进程可共享
+JOB_LEASE_SECONDS = 900        # 页面租约时长(秒)，进程崩溃后超过该时间页面会被重新领取
+JOB_LEASE_POLL_INTERVAL = 5    # 其他进程持有剩余页面时，重新检查的间隔(秒)
+JOB_REQUIRE_CONTEXT = True     # 只领取上一页已完成的页面以保证上下文衔接；设为 False 时多个进程可并行翻译同一篇论文
+REPAIR_WORKERS = 4             # --repair 修复失败页面时的并行线程数 (跨论文)
+
+# 9. 分布式协调 (coordinator.py / worker.py) 配置
+COORDINATOR_HOST = "127.0.0.1"  # 协调服务监听地址；监听其他地址 (如 0.0.0.0 供远程 worker 连接) 时必须设置 COORDINATOR_TOKEN
+COORDINATOR_PORT = 8700
+COORDINATOR_URL = os.getenv("COORDINATOR_URL", "http://127.0.0.1:8700")  # worker 连接的协调服务地址
+COORDINATOR_TOKEN = os.getenv("COORDINATOR_TOKEN", "")  # 共享口令，非空时所有请求需携带 X-Coordinator-Token
+COORDINATOR_LEASE_SECONDS = 180   # 远程页面租约时长(秒)，由 worker 心跳续租
+WORKER_HEARTBEAT_INTERVAL = 30    # worker 心跳间隔(秒)
+WORKER_POLL_INTERVAL = 5          # 队列为空时 worker 的等待间隔(秒)
+WORKER_OFFLINE_SECONDS = 120      # 超过该时间无心跳的 worker 在状态页中显示为离线
+
+# 10. 翻译服务 API (service.py) 配置
+SERVICE_HOST = "0.0.0.0"
+SERVICE_PORT = 8710
+SERVICE_UPLOAD_DIR = os.path.join(OUTPUT_DIR, 'uploads')  # 上传的 PDF 保存目录 (文件名带内容哈希)
+SERVICE_WORKERS = 2               # 同时翻译的论文数量
+SERVICE_MAX_QUEUE = 20            # 排队 + 翻译中的任务上限，超过后返回 503
+SERVICE_MAX_JOBS_PER_CLIENT = 3   # 每个客户端 (X-Client-Id 或 IP) 同时进行的任务上限，超过后返回 429
+SERVICE_MAX_UPLOAD_MB = 100       # 单个 PDF 大小上限
+SERVICE_RETRY_AFTER = 30          # 拒绝请求时建议的重试间隔(秒)
+SERVICE_STREAM_POLL_INTERVAL = 0.5  # SSE 推送检查页面状态的间隔(秒)
+
+# 11. 新版本增量翻译配置
+VERSION_DIFF_ENABLED = True       # 按 arXiv ID / 标题匹配旧版本，只翻译内容变化的页面
+VERSION_MATCH_MIN_TITLE_CHARS = 10  # 规范化标题少于该字符数时不按标题匹配，避免误匹配
+
+# 12. 启动配置
+OFFLINE_FAST_START = os.getenv("PDF_TRANS_OFFLINE", "0") == "1"  # 跳过启动时的网络探测 (也可用 main.py --offline)
+PREFLIGHT_TIMEOUT = 3        # 启动时探测各服务商端点的超时(秒)，各端点并发探测
+PREFLIGHT_CACHE_TTL = 300    # 探测结果缓存时长(秒)
+PREFLIGHT_CACHE_FILE = os.path.join(OUTPUT_DIR, 'preflight_cache.json')
+
+# 13. Key 池与多服务商分流配置
+# 同时启用多个服务商并按权重分流，例如 {"gemini": 3, "aliyun": 1}；为空时按降级顺序只用一个服务商
+PROVIDER_WEIGHTS = {}
+KEY_RATE_LIMIT_COOLDOWN = 60     # Key 被限流 (429) 后的冷却时间(秒)
+KEY_EXHAUSTED_COOLDOWN = 3600    # Key 额度耗尽 / 欠费后的冷却时间(秒)；无效的 Key (401/403) 直接移出
+
+# 14. 大文档章节切分配置
+SHARDING_ENABLED = True          # 页数较多的文档 (书籍、学位论文) 按目录切分为章节并行翻译
+SHARD_PAGE_THRESHOLD = 60        # 达到此页数才切分
+SHARD_TOC_LEVEL = 1              # 使用的目录层级 (顶层只有一个条目时自动使用下一层)
+SHARD_MIN_PAGES = 5              # 少于此页数的章节并入上一章
+SHARD_WINDOW_PAGES = 20          # 没有目录时按固定页数切分
+SHARD_WORKERS = 4                # 同一篇文档并行翻译的章节数
+
+# 15. 页面图片存储配置
+PAGE_STORE_ENABLED = True        # 每篇论文的页面图片写入单个容器文件 output/<论文>/pages.pts (mmap 随机读取)；
+                                 # False 时按旧方式每页保存一个 PNG。导出散装图片: python page_store.py <pages.pts>
+
+# 16. 缩略图预检配置 (跳过空白页与重复页，不渲染全分辨率图片也不调用模型)
+TRIAGE_ENABLED = True
+TRIAGE_DPI = 24                  # 预检缩略图分辨率
+TRIAGE_INK_LEVEL = 200           # 灰度低于此值的像素视为墨迹
+TRIAGE_BLANK_INK = 0.002         # 墨迹覆盖率低于此值...
+TRIAGE_BLANK_ENTROPY = 0.5       # ...且灰度熵 (bit) 低于此值时视为空白页
+TRIAGE_SKIP_DUPLICATES = True    # 跳过与前面某页 (近似) 重复的页面
+TRIAGE_DUPLICATE_DISTANCE = 4    # 感知哈希 (256 位) 汉明距离不超过此值...
+TRIAGE_DUPLICATE_INK_DELTA = 0.003  # ...且墨迹覆盖率相差不超过此值时视为重复页
+
+# 17. 自适应渲染 DPI 配置 (按页面最小字号与图片密度选择 DPI，减少上传的像素量)
+ADAPTIVE_DPI_ENABLED = True
+ADAPTIVE_DPI_MIN = 150           # DPI 下限 (正文页)
+ADAPTIVE_DPI_MAX = 300           # DPI 上限 (小字号下标、表格脚注)
+ADAPTIVE_DPI_PX_PER_EM = 24      # 最小字号每 em 至少需要的像素数 (10pt -> 173 DPI, 6pt -> 288 DPI)
+ADAPTIVE_DPI_FONT_PERCENTILE = 2 # 最小字号取按字符数计的百分位，忽略个别零散的小字 (如页眉符号)
+ADAPTIVE_DPI_IMAGE_COVERAGE = 0.3  # 图片覆盖率达到此比例的页面...
+ADAPTIVE_DPI_IMAGE_DPI = 220     # ...至少使用此 DPI
+
+# 18. 服务商流量录制 / 回放配置 (见 cassette.py，也可用 main.py --record / --replay)
+CASSETTE_MODE = os.getenv("PDF_TRANS_CASSETTE", "")  # "" 关闭 / "record" 录制 / "replay" 离线回放
+CASSETTE_DIR = os.getenv("PDF_TRANS_CASSETTE_DIR", os.path.join(OUTPUT_DIR, 'cassettes', 'default'))
+CASSETTE_REPLAY_SPEED = 1.0      # 回放速度倍数: 1 按录制时的节奏，10 加速 10 倍，0 不等待
+
+# 19. 跨运行性能历史配置 (见 perf_history.py，python perf_history.py report 查看趋势)
+PERF_HISTORY_ENABLED = True      # 每次运行结束时将页面级与调用级指标追加到历史数据库
+PERF_HISTORY_DB = os.path.join(OUTPUT_DIR, 'perf_history.sqlite3')
+PERF_BASELINE_RUNS = 5           # 滚动基线: 同类运行中最近 N 次的中位数
+PERF_BASELINE_MIN_RUNS = 3       # 历史不足 N 次时不判定回归
+PERF_REGRESSION_THRESHOLD = 0.2  # 吞吐、延迟、单页费用相对基线变差超过 20% 时标记为回归
+PERF_ERROR_RATE_DELTA = 0.05     # 失败率比基线高出 5 个百分点时标记为回归
+
+# 20. 日志配置 (也可用 main.py --log-level / --log-format / --log-file / --quiet)
+LOG_LEVEL = os.getenv("PDF_TRANS_LOG_LEVEL", "INFO")  # API < INFO = SUCCESS < RETRY < WARNING < ERROR < CRITICAL
+LOG_FORMAT = "text"  # 控制台输出格式: "text" 彩色文本 / "json" JSON Lines (含论文、页码、服务商等字段)
+LOG_QUIET = False    # 安静模式: 控制台只输出 WARNING 及以上 (日志文件不受影响)
+LOG_FILE = ""        # 同时以 JSON Lines 写入该文件，为空时不写
+LOG_ASYNC = True     # 翻译线程只入队，由单独的写线程格式化并输出；关闭后在调用线程同步输出
+
+# 21. 系统提示词缓存配置 (见 prompt_cache.py)
+# Gemini 的系统提示词通过 systemInstruction 发送；启用后为每个模型 / Key 创建服务端上下文缓存 (cachedContents)，
+# 请求只引用缓存名称。提示词低于模型的最小缓存 token 数等原因创建失败时退回 systemInstruction (仍可命中隐式缓存)。
+# OpenAI 兼容接口只能以 system 消息发送，命中服务端隐式缓存的 token 数同样会统计。录制 / 回放模式下不创建缓存。
+PROMPT_CACHE_ENABLED = True
+PROMPT_CACHE_TTL = 3600              # 缓存有效期(秒)
+PROMPT_CACHE_REFRESH_MARGIN = 300    # 距过期不足该秒数时重新创建
+PROMPT_CACHE_RETRY_SECONDS = 3600    # 某模型创建缓存失败后，多久内不再尝试
+PROMPT_CACHE_TIMEOUT = 10            # 创建缓存请求的超时(秒)
+
+# 22. 页面图片上传 (Gemini Files API)
+# 启用后较大的页面图片先上传一次 (原始字节，比 base64 小约 1/3)，请求中以 file_data 引用，
+# 同一页的重试、降级与续写请求复用同一个文件。上传失败时退回 inline_data。录制 / 回放模式下不上传。
+FILE_UPLOAD_ENABLED = True
+FILE_UPLOAD_MIN_KB = 256             # 小于此大小的图片直接 inline 发送 (省去一次上传往返)
+FILE_UPLOAD_TTL = 47 * 3600          # 已上传文件的有效期(秒)，服务端保留 48 小时 (以响应中的 expirationTime 为准)
+FILE_UPLOAD_REFRESH_MARGIN = 600     # 距过期不足该秒数时重新上传
+FILE_UPLOAD_RETRY_SECONDS = 600      # 某个 Key 上传失败后，多久内不再尝试
+FILE_UPLOAD_TIMEOUT = 60             # 上传请求的超时(秒)
+
+# 23. 原生 PDF 模式 (也可用 main.py --native-pdf 临时启用)
+# 启用后不再把页面渲染为 PNG，而是把每页切为独立的单页 PDF (保留矢量文字与公式，体积通常小得多)，
+# 以 application/pdf 发送给支持 PDF 输入的服务商；其他服务商 (或返回不支持的模型) 调用时按需渲染为图片。
+PDF_NATIVE_ENABLED = False
+PDF_NATIVE_PROVIDERS = ("gemini",)   # 可直接接收 PDF 的服务商
+PDF_PAGE_TOKENS = 258                # Gemini 每页 PDF 的图像 token 数 (文字层另计)，用于费用预估
 
 # ================= 提示词模板 =================
 
@@ -74,6 +244,12 @@ USER_PROMPT_TEMPLATE = """
 请详细分析并翻译这张图片里的内容。
 """
 
+# 输出被截断后的续写指令
+CONTINUATION_PROMPT = """
+你上一次的输出因长度限制被截断了。请从截断处继续输出剩余的翻译内容：
+不要重复已经输出的内容，不要添加任何说明，直接从最后一个字之后接着写。
+"""
+
 CONTEXT_INSTRUCTION = """
 【注意】：上一页的最后两句话是：
 “{prev_context}”
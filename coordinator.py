@@ -0,0 +1,323 @@
+# coordinator.py
+"""
+多机协调服务 (仅依赖标准库 http.server): 持有论文/页面队列，远程 worker 注册后
+领取页面租约 (图片 + 提示词上下文)，回传翻译结果并定期心跳续租。
+所有页面完成后，由协调服务统一合并为 Trans/翻译-*.md。
+
+用法:
+    python coordinator.py                    # 在本机启动，监听 config.COORDINATOR_PORT
+    python worker.py --threads 2             # 在任意机器上启动 worker (设置 COORDINATOR_URL)
+
+默认只监听 127.0.0.1；供其他机器的 worker 连接时把 COORDINATOR_HOST 改为 0.0.0.0，并且必须设置 COORDINATOR_TOKEN。
+
+接口 (JSON):
+    POST /workers/register   {"name", "worker_id"?}             -> {"worker_id", "lease_seconds", "heartbeat_interval"}
+    POST /workers/heartbeat  {"worker_id", "leases": [[paper_id, page_idx], ...]} -> {"lost": [...]}
+    POST /leases             {"worker_id"}                      -> 页面租约，队列为空时返回 204
+    POST /results            {"worker_id", "paper_id", "page_idx", "text", "provider", "latency"}
+    POST /failures           {"worker_id", "paper_id", "page_idx", "error"}
+    POST /leases/release     {"worker_id", "paper_id", "page_idx"}  (worker 退出前归还未翻译的页面)
+    GET  /status                                                -> 各论文进度与 worker 状态
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import base64
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import config
+from utils import Logger, ensure_directories, get_mime_type
+from job_store import JobStore, DONE, FAILED, PENDING, LEASED
+from pdf_processor import convert_pdf_to_images, get_page_text_stats
+from main import build_page_prompt, merge_translations, run_triage
+from daemon import PdfWatcher, reset_paper_cache
+from versioning import prepare_paper_version
+from sharding import apply_sharding
+from page_triage import apply_triage
+from page_store import read_page, page_filename
+
+
+class Coordinator:
+    """队列状态与调度逻辑，与 HTTP 层分离"""
+
+    def __init__(self, job_store=None):
+        self.job_store = job_store or JobStore()
+        self.workers = {}  # worker_id -> 信息
+        self.page_stats = {}  # paper_id -> 每页文字统计
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.watcher = PdfWatcher(config.DATA_DIR, config.WATCH_STABLE_SECONDS, {})
+
+    # ---------- 论文入队 ----------
+    def ingest(self, pdf_file):
+        """切分 PDF 并登记到队列"""
+        pdf_path = os.path.join(config.DATA_DIR, pdf_file)
+        pdf_name_no_ext = os.path.splitext(pdf_file)[0]
+        triage = run_triage(pdf_path)
+        try:
+            image_paths = convert_pdf_to_images(pdf_path, config.OUTPUT_DIR,
+                                                skip_pages={i for i, result in enumerate(triage) if result["skip"]})
+            stats = get_page_text_stats(pdf_path)
+        except Exception as e:
+            Logger.error(f"切分 \"{pdf_file}\" 失败，跳过: {e}")
+            return
+        paper_id = self.job_store.register_paper(pdf_name_no_ext, pdf_path, image_paths)
+        self.job_store.import_progress_json(paper_id, os.path.join(config.OUTPUT_DIR, pdf_name_no_ext))
+        if config.VERSION_DIFF_ENABLED:
+            try:
+                prepare_paper_version(self.job_store, paper_id, pdf_path, image_paths)
+            except Exception as e:
+                Logger.warning(f"版本比对失败，将完整翻译: {e}", indent=2)
+        try:
+            apply_sharding(self.job_store, paper_id, pdf_path, len(image_paths))
+        except Exception as e:
+            Logger.warning(f"章节切分失败，将按页顺序翻译: {e}", indent=2)
+        apply_triage(self.job_store, paper_id, triage)
+        self.page_stats[paper_id] = stats
+        Logger.info(f"论文已入队: {pdf_file} ({len(image_paths)} 页)")
+        self._merge_if_complete(paper_id)
+
+    def ingest_loop(self):
+        """后台线程: 持续扫描 Data 文件夹，写入完成的新 PDF 入队"""
+        while not self.stop_event.is_set():
+            for pdf_file, signature in self.watcher.poll():
+                if pdf_file in self.watcher.processed:
+                    # 已入队的 PDF 内容变化: 与守护进程相同，先归档 / 重置旧页面并清除旧的切分结果
+                    reset_paper_cache(self.job_store, pdf_file)
+                self.ingest(pdf_file)
+                self.watcher.processed[pdf_file] = signature
+            self.stop_event.wait(config.WATCH_POLL_INTERVAL)
+
+    def _merge_if_complete(self, paper_id):
+        if not self.job_store.is_paper_complete(paper_id):
+            return
+        with self.merge_lock:
+            paper_name = self.job_store._paper_name(paper_id)
+            merge_translations(paper_name, self.job_store.get_translated_texts(paper_id),
+                               self.job_store.get_chapters(paper_id))
+
+    # ---------- worker ----------
+    def register_worker(self, name, address, worker_id=None):
+        """
+        登记 worker，返回 worker ID。
+        worker_id 为 worker 之前使用的 ID 时 (协调服务重启后重新注册) 沿用该 ID，数据库中仍由它持有的租约继续有效
+        """
+        worker_id = worker_id or f"{name}-{uuid.uuid4().hex[:8]}"
+        with self.lock:
+            self.workers.setdefault(worker_id, {
+                "name": name, "address": address, "registered_at": time.time(),
+                "last_seen": time.time(), "completed": 0, "failed": 0,
+            })
+        Logger.info(f"worker 已注册: {worker_id} ({address})")
+        return worker_id
+
+    def _touch(self, worker_id):
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is None:
+                raise KeyError(worker_id)
+            worker["last_seen"] = time.time()
+            return worker
+
+    def heartbeat(self, worker_id, leases):
+        """续租，返回已被回收的租约列表"""
+        self._touch(worker_id)
+        lost = []
+        for paper_id, page_idx in leases:
+            if not self.job_store.renew_lease(paper_id, page_idx, worker_id, config.COORDINATOR_LEASE_SECONDS):
+                lost.append([paper_id, page_idx])
+        return lost
+
+    def lease(self, worker_id):
+        """为 worker 领取一个页面，返回包含图片与提示词的租约，队列为空时返回 None"""
+        self._touch(worker_id)
+        page = self.job_store.claim_page(worker_id, lease_seconds=config.COORDINATOR_LEASE_SECONDS)
+        if page is None:
+            return None
+        paper_id, page_idx = page["paper_id"], page["page_idx"]
+        image_b64 = base64.b64encode(read_page(page["image_path"])).decode("utf-8")
+        stats = self.page_stats.get(paper_id) or []
+        return {
+            "paper_id": paper_id,
+            "page_idx": page_idx,
+            "paper_name": self.job_store._paper_name(paper_id),
+            "attempt": page["attempts"],
+            "image_name": page_filename(page["image_path"]),
+            "mime_type": get_mime_type(page["image_path"]),
+            "image_b64": image_b64,
+            "prompt": build_page_prompt(self.job_store, paper_id, page_idx),
+            "page_info": stats[page_idx] if page_idx < len(stats) else None,
+        }
+
+    def complete(self, worker_id, paper_id, page_idx, text, provider, latency):
+        """保存 worker 回传的结果，返回 False 表示租约已被回收 (结果过期，已丢弃)"""
+        worker = self._touch(worker_id)
+        if not self.job_store.complete_page(paper_id, page_idx, worker_id, text, provider=provider, latency=latency):
+            return False
+        with self.lock:
+            worker["completed"] += 1
+        self._merge_if_complete(paper_id)
+        return True
+
+    def fail(self, worker_id, paper_id, page_idx, error, latency=None):
+        """记录 worker 回传的失败，返回 False 表示租约已被回收"""
+        worker = self._touch(worker_id)
+        if not self.job_store.fail_page(paper_id, page_idx, worker_id, error, latency=latency):
+            return False
+        with self.lock:
+            worker["failed"] += 1
+        self._merge_if_complete(paper_id)
+        return True
+
+    def release(self, worker_id, paper_id, page_idx):
+        self._touch(worker_id)
+        self.job_store.release_page(paper_id, page_idx, worker_id)
+
+    def status(self):
+        rows = self.job_store._conn().execute("SELECT id, name, num_pages FROM papers ORDER BY id").fetchall()
+        papers = []
+        for row in rows:
+            counts = self.job_store.paper_status_counts(row["id"])
+            papers.append({
+                "paper_id": row["id"], "name": row["name"], "num_pages": row["num_pages"],
+                **{status: counts.get(status, 0) for status in (PENDING, LEASED, DONE, FAILED)},
+            })
+        now = time.time()
+        with self.lock:
+            workers = {
+                worker_id: dict(info, online=now - info["last_seen"] < config.WORKER_OFFLINE_SECONDS)
+                for worker_id, info in self.workers.items()
+            }
+        return {"papers": papers, "workers": workers}
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PdfTransCoordinator/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        token = self.headers.get("X-Coordinator-Token") or ""
+        if config.COORDINATOR_TOKEN and not hmac.compare_digest(token.encode("utf-8"),
+                                                                config.COORDINATOR_TOKEN.encode("utf-8")):
+            self._send_json(401, {"error": "invalid token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path.split("?", 1)[0] == "/status":
+            self._send_json(200, self.server.coordinator.status())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._send_json(411, {"error": "Content-Length required"})
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._send_json(400, {"error": "invalid Content-Length"})
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+        except ValueError:
+            return self._send_json(400, {"error": "invalid json"})
+
+        coordinator = self.server.coordinator
+        path = self.path.split("?", 1)[0]
+        try:
+            if path == "/workers/register":
+                worker_id = coordinator.register_worker(body.get("name", "worker"), self.client_address[0],
+                                                        body.get("worker_id"))
+                self._send_json(200, {
+                    "worker_id": worker_id,
+                    "lease_seconds": config.COORDINATOR_LEASE_SECONDS,
+                    "heartbeat_interval": config.WORKER_HEARTBEAT_INTERVAL,
+                })
+            elif path == "/workers/heartbeat":
+                self._send_json(200, {"lost": coordinator.heartbeat(body["worker_id"], body.get("leases", []))})
+            elif path == "/leases":
+                lease = coordinator.lease(body["worker_id"])
+                if lease is None:
+                    self._send_json(204)
+                else:
+                    self._send_json(200, lease)
+            elif path == "/leases/release":
+                coordinator.release(body["worker_id"], body["paper_id"], body["page_idx"])
+                self._send_json(200, {"ok": True})
+            elif path == "/results":
+                if coordinator.complete(body["worker_id"], body["paper_id"], body["page_idx"], body["text"],
+                                        body.get("provider"), body.get("latency")):
+                    self._send_json(200, {"ok": True})
+                else:
+                    self._send_json(409, {"error": "lease lost"})
+            elif path == "/failures":
+                if coordinator.fail(body["worker_id"], body["paper_id"], body["page_idx"], body.get("error", ""),
+                                    body.get("latency")):
+                    self._send_json(200, {"ok": True})
+                else:
+                    self._send_json(409, {"error": "lease lost"})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except KeyError as e:
+            # 未注册的 worker (例如协调服务重启后)，worker 收到 410 后重新注册
+            self._send_json(410, {"error": f"unknown worker or missing field: {e}"})
+
+
+def is_loopback(host):
+    return host == "localhost" or host.startswith("127.") or host == "::1"
+
+
+def start_coordinator(host=None, port=None):
+    """启动协调服务 (后台线程)，返回 server"""
+    host = host or config.COORDINATOR_HOST
+    if not config.COORDINATOR_TOKEN and not is_loopback(host):
+        # 无口令时任何能访问该端口的人都可以领取页面、提交译文
+        raise RuntimeError(f"协调服务监听 {host} 时必须设置 COORDINATOR_TOKEN (或改为监听 127.0.0.1)")
+    ensure_directories([config.DATA_DIR, config.OUTPUT_DIR, config.TRANS_DIR])
+    coordinator = Coordinator()
+    server = ThreadingHTTPServer((host, port if port is not None else config.COORDINATOR_PORT),
+                                 CoordinatorHandler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    threading.Thread(target=coordinator.ingest_loop, name="coordinator-ingest", daemon=True).start()
+    threading.Thread(target=server.serve_forever, name="coordinator-http", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    try:
+        server = start_coordinator()
+    except RuntimeError as e:
+        Logger.critical(str(e))
+        sys.exit(1)
+    host, port = server.server_address[:2]
+    Logger.info(f"协调服务已启动: http://{host}:{port} (监听 '{config.DATA_DIR}'，按 Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.coordinator.stop_event.set()
+        server.shutdown()
+        Logger.info("协调服务已退出。")
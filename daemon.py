@@ -0,0 +1,198 @@
+# daemon.py
+"""
+守护进程模式: 持续监听 Data 文件夹，新增或变化的 PDF 写入完成后自动翻译。
+与 main.py 的一次性批处理不同，这里只做一次启动检查，AI 处理器 (连接池、模型锁定状态)
+和线程池在论文之间复用；收到 Ctrl+C / SIGTERM 后等待正在翻译的页面完成并保存进度再退出。
+
+用法:
+    python daemon.py
+"""
+import os
+import sys
+import json
+import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+from utils import Logger, ensure_directories
+from ai_handler import AIHandler
+from stats_manager import StatsManager
+from job_store import JobStore
+from page_store import STORE_FILENAME, PDF_STORE_FILENAME
+from main import pre_flight_checks, process_paper, finish_run, record_startup, save_run_records
+
+
+def reset_paper_cache(job_store, pdf_file):
+    """PDF 内容变化后，清除旧的切分结果 (图片或单页 PDF) 与翻译进度 (启用增量翻译时保留旧版本译文供复用)"""
+    pdf_name_no_ext = os.path.splitext(pdf_file)[0]
+    if config.VERSION_DIFF_ENABLED:
+        job_store.archive_paper(pdf_name_no_ext)
+    else:
+        job_store.reset_paper(pdf_name_no_ext)
+    paper_output_dir = os.path.join(config.OUTPUT_DIR, pdf_name_no_ext)
+    if not os.path.isdir(paper_output_dir):
+        return
+    for name in os.listdir(paper_output_dir):
+        if name in ("progress.json", STORE_FILENAME, PDF_STORE_FILENAME) or \
+                (name.startswith("page_") and name.endswith((".png", ".pdf"))):
+            os.remove(os.path.join(paper_output_dir, name))
+    Logger.info(f"检测到 \"{pdf_file}\" 已变化，已清除旧的切分结果与翻译进度。")
+
+
+class PdfWatcher:
+    """轮询 Data 文件夹，返回写入完成 (大小与修改时间在一段时间内保持不变) 的新增或变化的 PDF"""
+
+    def __init__(self, data_dir, stable_seconds, processed):
+        self.data_dir = data_dir
+        self.stable_seconds = stable_seconds
+        self.processed = processed  # 文件名 -> 已处理时的指纹 [size, mtime_ns]
+        self.failed = {}  # 文件名 -> 处理失败时的指纹，文件不变化就不再重试
+        self.pending = {}  # 文件名 -> (指纹, 指纹首次出现的时间)
+
+    def poll(self):
+        ready = []
+        now = time.time()
+        seen = set()
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith('.pdf'):
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                signature = [stat.st_size, stat.st_mtime_ns]
+                if stat.st_size == 0 or signature in (self.processed.get(entry.name), self.failed.get(entry.name)):
+                    continue
+                previous = self.pending.get(entry.name)
+                if previous is None or previous[0] != signature:
+                    # 新文件或仍在写入，重新计时
+                    self.pending[entry.name] = (signature, now)
+                elif now - previous[1] >= self.stable_seconds:
+                    ready.append((entry.name, signature))
+                    del self.pending[entry.name]
+        for name in list(self.pending):
+            if name not in seen:
+                del self.pending[name]
+        return ready
+
+
+class TranslationDaemon:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.stats_manager = StatsManager(config.OUTPUT_DIR)
+        self.ai_handler = None
+        self.job_store = None
+        self.executor = None
+        self.in_flight = {}  # 文件名 -> Future
+        self.state_lock = threading.Lock()
+        self.last_flush = time.time()
+        self.processed = self._load_state()
+        self.watcher = PdfWatcher(config.DATA_DIR, config.WATCH_STABLE_SECONDS, self.processed)
+
+    # ---------- 状态持久化 ----------
+    def _load_state(self):
+        if os.path.exists(config.DAEMON_STATE_FILE):
+            try:
+                with open(config.DAEMON_STATE_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("processed", {})
+            except Exception:
+                Logger.warning("守护进程状态文件损坏，将重新扫描所有论文。")
+        return {}
+
+    def _save_state(self):
+        with self.state_lock:
+            tmp_path = config.DAEMON_STATE_FILE + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"processed": self.processed}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, config.DAEMON_STATE_FILE)
+
+    # ---------- 信号处理 ----------
+    def _handle_signal(self, signum, frame):
+        if self.stop_event.is_set():
+            Logger.warning("正在等待进行中的页面完成，请稍候...")
+            return
+        Logger.warning(f"收到信号 {signum}，完成进行中的页面后退出...")
+        self.stop_event.set()
+
+    def _install_signal_handlers(self):
+        signal.signal(signal.SIGINT, self._handle_signal)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, self._handle_signal)
+
+    # ---------- 论文调度 ----------
+    def _run_paper(self, pdf_file, signature):
+        self.ai_handler.refresh_provider_health()
+        completed = process_paper(pdf_file, self.ai_handler, self.stats_manager, self.job_store,
+                                  stop_event=self.stop_event, label=" [守护进程]")
+        if completed:
+            with self.state_lock:
+                self.processed[pdf_file] = signature
+            self._save_state()
+        elif completed is False and not self.stop_event.is_set():
+            self.watcher.failed[pdf_file] = signature
+        # completed 为 None 时剩余页面由其他进程持有，文件未记为已处理，稍后会被重新检测
+        return completed
+
+    def _submit(self, pdf_file, signature):
+        if pdf_file in self.in_flight:
+            return  # 仍在处理中，完成后会因指纹不一致被重新检测
+        if pdf_file in self.processed:
+            reset_paper_cache(self.job_store, pdf_file)
+        Logger.info(f"检测到待翻译论文: {pdf_file}")
+        self.in_flight[pdf_file] = self.executor.submit(self._run_paper, pdf_file, signature)
+
+    def _reap(self):
+        for pdf_file, future in list(self.in_flight.items()):
+            if future.done():
+                del self.in_flight[pdf_file]
+                error = future.exception()
+                if error:
+                    Logger.error(f"论文 \"{pdf_file}\" 处理异常: {error}")
+
+    def _flush_records(self):
+        """定期将本区间的统计与追踪落盘并清空，守护进程长期运行时内存不会无限增长"""
+        if time.time() - self.last_flush < config.DAEMON_FLUSH_INTERVAL:
+            return
+        self.last_flush = time.time()
+        if not self.stats_manager.has_records():
+            return
+        save_run_records(self.stats_manager.rotate(), rotate=True)
+
+    def run(self):
+        Logger.separator('=', 50)
+        Logger.plain("[START] AI 论文翻译守护进程启动")
+        Logger.separator('=', 50)
+
+        if not pre_flight_checks():
+            Logger.plain("\n环境检查未通过，程序已终止。请根据提示修复问题后重试。")
+            sys.exit(1)
+        ensure_directories([config.DATA_DIR, config.OUTPUT_DIR, config.TRANS_DIR])
+
+        self.ai_handler = AIHandler(self.stats_manager)
+        self.job_store = JobStore()
+        self.executor = ThreadPoolExecutor(max_workers=config.DAEMON_WORKERS, thread_name_prefix="paper")
+        self._install_signal_handlers()
+        record_startup(self.stats_manager)
+        Logger.info(f"正在监听 '{config.DATA_DIR}' (每 {config.WATCH_POLL_INTERVAL} 秒扫描一次，按 Ctrl+C 退出)")
+
+        try:
+            while not self.stop_event.is_set():
+                for pdf_file, signature in self.watcher.poll():
+                    self._submit(pdf_file, signature)
+                self._reap()
+                self._flush_records()
+                self.stop_event.wait(config.WATCH_POLL_INTERVAL)
+        finally:
+            self.stop_event.set()
+            Logger.info(f"等待 {len(self.in_flight)} 篇进行中的论文保存进度...")
+            self.executor.shutdown(wait=True)
+            self._reap()
+            Logger.plain()
+            Logger.separator('=', 50)
+            Logger.plain("[END] 守护进程已退出。")
+            Logger.separator('=', 50)
+            finish_run(self.stats_manager)
+
+
+if __name__ == "__main__":
+    TranslationDaemon().run()
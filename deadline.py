@@ -0,0 +1,47 @@
+# deadline.py
+"""
+单页的端到端时间预算: 每页翻译开始时创建一个 Deadline，在重试、降级与等待网络的各个环节之间传递。
+每次请求的超时取 "单次请求上限" 与 "剩余预算" 的较小者，重试前的等待也不会超过剩余预算；
+预算用尽时抛出 DeadlineExceededError，该页标记为失败，不再拖住整个运行。
+"""
+import time
+import config
+
+
+class DeadlineExceededError(Exception):
+    """单页的时间预算已用尽"""
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        """seconds 为 None 时使用 config.PAGE_DEADLINE_SECONDS，为 0 时不限制"""
+        self.budget = config.PAGE_DEADLINE_SECONDS if seconds is None else seconds
+        self.started = time.monotonic()
+        self.expires = self.started + self.budget if self.budget else None
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        if self.expires is None:
+            return float("inf")
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, what="翻译"):
+        """剩余预算不足以发起一次请求时抛出 DeadlineExceededError"""
+        if self.remaining() < config.MIN_ATTEMPT_SECONDS:
+            raise DeadlineExceededError(f"{what}: 单页时间预算 {self.budget} 秒已用尽 (已用 {self.elapsed():.1f} 秒)")
+
+    def timeout(self, limit, what="请求"):
+        """本次调用的超时: limit 与剩余预算的较小者"""
+        self.check(what)
+        return min(limit, self.remaining())
+
+    def sleep(self, seconds, what="重试等待"):
+        """等待 seconds 秒，但不超过剩余预算；等待后预算不足时抛出 DeadlineExceededError"""
+        time.sleep(min(seconds, self.remaining()))
+        self.check(what)
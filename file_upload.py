@@ -0,0 +1,115 @@
+# file_upload.py
+"""
+页面图片的 "上传一次" 模式 (Gemini Files API): 较大的页面图片先以原始字节上传一次，请求中只以 file_data (URI) 引用，
+同一页的重试、降级到其他 Gemini 模型以及续写请求都复用同一个文件，不再在每个 JSON 请求体里重复发送 base64 图片
+(base64 比原始字节大约 1/3，上行带宽受限时差别明显)。
+
+  - 已上传的文件按 (内容 SHA-256, API Key) 缓存，服务端文件有保留期限，距过期不足 FILE_UPLOAD_REFRESH_MARGIN 时重新上传
+  - 上传失败、文件未就绪或图片小于 FILE_UPLOAD_MIN_KB 时退回 inline_data；某个 Key 上传失败后一段时间内不再尝试
+  - 引用的文件被服务端拒绝 (已过期或被删除) 时丢弃缓存，下次请求重新上传
+  - 本地测试可直接使用 mock_server.py 的 /upload/v1beta/files 接口
+"""
+import json
+import time
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+import config
+from utils import Logger, get_mime_type
+from page_store import read_page, page_filename
+from tracer import tracer
+
+
+def _parse_expiration(value):
+    """解析 Files API 返回的 expirationTime (RFC 3339)，失败时返回 None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class FileUploadCache:
+    def __init__(self, session_getter, stats_manager=None):
+        self._session = session_getter  # 返回 requests.Session 的函数 (与 AIHandler 共用连接池)
+        self.stats_manager = stats_manager
+        self._lock = threading.Lock()
+        self._entries = {}      # (内容摘要, Key) -> (文件 URI, 过期时间)
+        self._unsupported = {}  # Key -> 下次重新尝试上传的时间
+
+    @property
+    def enabled(self):
+        # 文件 URI 每次运行都不同，录制 / 回放时请求指纹无法复现，因此不上传
+        return config.FILE_UPLOAD_ENABLED and not config.CASSETTE_MODE
+
+    def gemini_part(self, image_path, api_key, deadline=None):
+        """
+        返回引用已上传文件的请求片段 {"file_data": {...}}；未启用、图片太小或上传失败时返回 None，
+        由调用方改用 inline_data
+        """
+        if not self.enabled:
+            return None
+        data = read_page(image_path)
+        if len(data) < config.FILE_UPLOAD_MIN_KB * 1024:
+            return None
+        mime_type = get_mime_type(image_path)
+        key = (hashlib.sha256(data).hexdigest(), api_key.secret)
+        now = time.time()
+        with self._lock:
+            if self._unsupported.get(api_key.secret, 0) > now:
+                return None
+            entry = self._entries.get(key)
+        if entry and entry[1] - config.FILE_UPLOAD_REFRESH_MARGIN > now:
+            if self.stats_manager:
+                self.stats_manager.record_file_upload(0, reused=True)
+            return {"file_data": {"mime_type": mime_type, "file_uri": entry[0]}}
+
+        timeout = config.FILE_UPLOAD_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        try:
+            with tracer.span("file_upload", image=page_filename(image_path), bytes=len(data)):
+                uri, expires = self._upload(data, mime_type, page_filename(image_path), api_key, timeout)
+        except Exception as e:
+            with self._lock:
+                self._unsupported[api_key.secret] = now + config.FILE_UPLOAD_RETRY_SECONDS
+            Logger.info(f"页面图片上传失败，改用 inline_data 发送: {e}", indent=3)
+            return None
+        with self._lock:
+            self._entries[key] = (uri, expires)
+        if self.stats_manager:
+            self.stats_manager.record_file_upload(len(data))
+        Logger.api_log(f"页面图片已上传 ({len(data) / 1024:.0f} KB): {uri}", indent=3)
+        return {"file_data": {"mime_type": mime_type, "file_uri": uri}}
+
+    def invalidate(self, file_uri):
+        """引用该文件的请求被拒绝 (文件已过期或被删除) 时丢弃缓存，下次请求重新上传"""
+        with self._lock:
+            self._entries = {key: entry for key, entry in self._entries.items() if entry[0] != file_uri}
+
+    def _upload(self, data, mime_type, display_name, api_key, timeout):
+        """以 multipart 方式上传 (元数据 + 原始字节，一次请求)，返回 (文件 URI, 过期时间)"""
+        if timeout <= 0:
+            raise TimeoutError("本页时间预算不足")
+        boundary = uuid.uuid4().hex
+        metadata = json.dumps({"file": {"display_name": display_name}})
+        body = (f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{metadata}\r\n"
+                f"--{boundary}\r\nContent-Type: {mime_type}\r\n\r\n").encode("utf-8") + data \
+            + f"\r\n--{boundary}--\r\n".encode("utf-8")
+        headers = {"X-Goog-Upload-Protocol": "multipart", "Content-Type": f"multipart/related; boundary={boundary}"}
+        response = self._session().post(f"{config.GEMINI_UPLOAD_BASE}/files?key={api_key.secret}",
+                                        headers=headers, data=body, timeout=timeout)
+        if response.status_code >= 400:
+            try:
+                message = response.json()["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = response.text[:200]
+            raise RuntimeError(f"HTTP {response.status_code}: {message}")
+        file_info = response.json()["file"]
+        if file_info.get("state", "ACTIVE") != "ACTIVE":
+            raise RuntimeError(f"文件 {file_info.get('name')} 尚未就绪 ({file_info.get('state')})")
+        expires = time.time() + config.FILE_UPLOAD_TTL
+        server_expires = _parse_expiration(file_info.get("expirationTime"))
+        return file_info["uri"], min(expires, server_expires) if server_expires else expires
@@ -0,0 +1,440 @@
+# job_store.py
+"""
+基于 SQLite (WAL) 的任务队列，记录每篇论文及其每一页的翻译状态。
+多个 main.py 进程可以共享同一个数据库: 页面通过带过期时间的租约领取，
+进程崩溃后租约到期，页面会被其他进程重新领取。
+翻译结果以文件形式保存在 output/<论文>/pages/page_N.md，数据库中只保存路径。
+"""
+import os
+import time
+import socket
+import sqlite3
+import threading
+import config
+from utils import Logger, load_progress
+from tracer import tracer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    name        TEXT NOT NULL UNIQUE,
+    pdf_path    TEXT,
+    num_pages   INTEGER NOT NULL DEFAULT 0,
+    title_key   TEXT,     -- 规范化后的标题，用于匹配同一论文的新版本
+    arxiv_id    TEXT,     -- 不含版本号的 arXiv ID
+    archived_at REAL,     -- 归档为旧版本的时间，NULL 表示当前版本
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    paper_id      INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE,
+    page_idx      INTEGER NOT NULL,
+    image_path    TEXT,
+    status        TEXT NOT NULL DEFAULT 'pending',  -- pending / leased / done / failed
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    provider      TEXT,
+    latency       REAL,
+    result_path   TEXT,
+    error         TEXT,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    text_hash     TEXT,   -- 文字层 (及嵌入图片) 的指纹
+    render_hash   TEXT,   -- 渲染图片的指纹
+    updated_at    REAL NOT NULL,
+    PRIMARY KEY (paper_id, page_idx)
+);
+CREATE INDEX IF NOT EXISTS idx_pages_status ON pages(status, lease_expires);
+CREATE TABLE IF NOT EXISTS chapters (
+    paper_id      INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE,
+    chapter_idx   INTEGER NOT NULL,
+    title         TEXT,
+    start_page    INTEGER NOT NULL,  -- 章节首页不需要上一页的上下文，可与其他章节并行翻译
+    end_page      INTEGER NOT NULL,
+    PRIMARY KEY (paper_id, chapter_idx)
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    content_hash  TEXT PRIMARY KEY,  -- PDF 内容的 SHA-256，相同文件只翻译一次
+    job_id        TEXT NOT NULL UNIQUE,
+    paper_name    TEXT NOT NULL,
+    filename      TEXT,
+    client_id     TEXT,
+    pdf_path      TEXT NOT NULL,
+    created_at    REAL NOT NULL
+);
+"""
+
+# 旧数据库补充的列 (表, 列, 类型, 补列后执行的回填语句)
+MIGRATIONS = [
+    ("papers", "title_key", "TEXT", None),
+    ("papers", "arxiv_id", "TEXT", None),
+    ("pages", "text_hash", "TEXT", None),
+    ("pages", "render_hash", "TEXT", None),
+    # 旧版本只以 name@时间戳 标记归档
+    ("papers", "archived_at", "REAL", "UPDATE papers SET archived_at = updated_at WHERE name GLOB '*@[0-9]*'"),
+]
+
+# 页面状态
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+def default_worker_id():
+    """主机名:进程号:线程号，用于标识租约持有者"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def failed_page_placeholder(page_num):
+    return f"\n\n> [ERROR] 第 {page_num} 页翻译失败，请检查日志。\n\n"
+
+
+class JobStore:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.JOB_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            for table, column, column_type, backfill in MIGRATIONS:
+                columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    if backfill:
+                        conn.execute(backfill)
+
+    def _conn(self):
+        """每个线程一个连接 (sqlite3 连接不能跨线程共享)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ---------- 论文 ----------
+    def register_paper(self, name, pdf_path, image_paths):
+        """登记论文及其页面 (已存在的页面保持原状态)，返回 paper_id"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO papers (name, pdf_path, num_pages, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET pdf_path = excluded.pdf_path, num_pages = excluded.num_pages, "
+                "updated_at = excluded.updated_at",
+                (name, pdf_path, len(image_paths), now, now))
+            paper_id = conn.execute("SELECT id FROM papers WHERE name = ?", (name,)).fetchone()["id"]
+            conn.executemany(
+                "INSERT INTO pages (paper_id, page_idx, image_path, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(paper_id, page_idx) DO UPDATE SET image_path = excluded.image_path",
+                [(paper_id, idx, path, now) for idx, path in enumerate(image_paths)])
+            conn.execute("DELETE FROM pages WHERE paper_id = ? AND page_idx >= ?", (paper_id, len(image_paths)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return paper_id
+
+    def get_paper(self, name):
+        row = self._conn().execute("SELECT * FROM papers WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def reset_paper(self, name):
+        """删除论文的全部页面状态 (PDF 内容变化时使用)"""
+        self._conn().execute("DELETE FROM papers WHERE name = ?", (name,))
+
+    def archive_paper(self, name):
+        """保留旧版本的页面记录与翻译结果 (改名为 name@时间戳)，供新版本增量翻译时复用"""
+        paper = self.get_paper(name)
+        if paper is None:
+            return
+        archived_name = f"{name}@{int(time.time())}"
+        pages_dir = os.path.dirname(self._result_path(name, 0))
+        archived_dir = os.path.dirname(self._result_path(archived_name, 0))
+        if os.path.isdir(pages_dir):
+            os.makedirs(os.path.dirname(archived_dir), exist_ok=True)
+            os.replace(pages_dir, archived_dir)
+        conn = self._conn()
+        conn.execute("UPDATE papers SET name = ?, archived_at = ? WHERE id = ?", (archived_name, time.time(), paper["id"]))
+        conn.execute("UPDATE pages SET result_path = replace(result_path, ?, ?) WHERE paper_id = ?",
+                     (pages_dir, archived_dir, paper["id"]))
+
+    # ---------- 版本识别 (versioning.py) ----------
+    def set_paper_identity(self, paper_id, title_key, arxiv_id):
+        self._conn().execute("UPDATE papers SET title_key = ?, arxiv_id = ? WHERE id = ?", (title_key, arxiv_id, paper_id))
+
+    def set_page_fingerprints(self, paper_id, fingerprints):
+        self._conn().executemany(
+            "UPDATE pages SET text_hash = ?, render_hash = ? WHERE paper_id = ? AND page_idx = ?",
+            [(fp["text_hash"], fp["render_hash"], paper_id, idx) for idx, fp in enumerate(fingerprints)])
+
+    def find_previous_version(self, paper_id, arxiv_id, title_key):
+        """按 arXiv ID 或标题查找同一论文最近一个有已完成页面的其他版本"""
+        if not arxiv_id and not title_key:
+            return None
+        row = self._conn().execute(
+            "SELECT pa.* FROM papers pa WHERE pa.id != ? AND ((pa.arxiv_id IS NOT NULL AND pa.arxiv_id = ?) "
+            "OR (pa.title_key IS NOT NULL AND pa.title_key = ?)) "
+            "AND EXISTS (SELECT 1 FROM pages pg WHERE pg.paper_id = pa.id AND pg.status = ?) "
+            "ORDER BY pa.updated_at DESC LIMIT 1",
+            (paper_id, arxiv_id, title_key, DONE)).fetchone()
+        return dict(row) if row else None
+
+    def paper_status_counts(self, paper_id):
+        """返回 {status: 页数}"""
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n FROM pages WHERE paper_id = ? GROUP BY status", (paper_id,)).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def papers_with_failures(self):
+        """返回含失败页面且没有待翻译页面的论文 (已归档的旧版本除外)，附带 failed 页数"""
+        rows = self._conn().execute(
+            "SELECT pa.*, SUM(pg.status = ?) AS failed FROM papers pa JOIN pages pg ON pg.paper_id = pa.id "
+            "WHERE pa.archived_at IS NULL GROUP BY pa.id "
+            "HAVING SUM(pg.status = ?) > 0 AND SUM(pg.status IN (?, ?)) = 0 ORDER BY pa.name",
+            (FAILED, FAILED, PENDING, LEASED)).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue_failed(self, paper_id):
+        """将论文的失败页面重新放回待翻译状态，返回页码索引列表"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            page_idxs = [row["page_idx"] for row in conn.execute(
+                "SELECT page_idx FROM pages WHERE paper_id = ? AND status = ? ORDER BY page_idx", (paper_id, FAILED))]
+            conn.execute(
+                "UPDATE pages SET status = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE paper_id = ? AND status = ?", (PENDING, time.time(), paper_id, FAILED))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return page_idxs
+
+    def is_paper_complete(self, paper_id):
+        counts = self.paper_status_counts(paper_id)
+        return counts.get(PENDING, 0) == 0 and counts.get(LEASED, 0) == 0
+
+    # ---------- 页面租约 ----------
+    def claim_page(self, worker_id, paper_id=None, lease_seconds=None, require_context=None):
+        """
+        领取一个待翻译页面 (或租约已过期的页面)，返回页面字典，无可领取页面时返回 None。
+        require_context 为 True 时只领取上一页已完成的页面 (或章节首页)，以保证上下文衔接。
+        """
+        lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        if require_context is None:
+            require_context = config.JOB_REQUIRE_CONTEXT
+        now = time.time()
+        query = (
+            "SELECT p.* FROM pages p WHERE (p.status = ? OR (p.status = ? AND p.lease_expires < ?))"
+            + (" AND p.paper_id = ?" if paper_id is not None else "")
+            + (" AND (p.page_idx = 0 OR EXISTS (SELECT 1 FROM chapters c WHERE c.paper_id = p.paper_id "
+               "AND c.start_page = p.page_idx) OR EXISTS (SELECT 1 FROM pages prev WHERE prev.paper_id = p.paper_id "
+               "AND prev.page_idx = p.page_idx - 1 AND prev.status IN (?, ?)))" if require_context else "")
+            + " ORDER BY p.paper_id, p.page_idx LIMIT 1"
+        )
+        params = [PENDING, LEASED, now]
+        if paper_id is not None:
+            params.append(paper_id)
+        if require_context:
+            params += [DONE, FAILED]
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(query, params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["status"] == LEASED:
+                Logger.warning(f"回收过期租约: 论文 {row['paper_id']} 第 {row['page_idx'] + 1} 页 (原持有者 {row['lease_owner']})", indent=2)
+            conn.execute(
+                "UPDATE pages SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE paper_id = ? AND page_idx = ?",
+                (LEASED, worker_id, now + lease_seconds, now, row["paper_id"], row["page_idx"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        page = dict(row)
+        page.update(status=LEASED, lease_owner=worker_id, attempts=row["attempts"] + 1)
+        return page
+
+    def renew_lease(self, paper_id, page_idx, worker_id, lease_seconds=None):
+        """续租，返回 False 表示租约已被他人回收"""
+        lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        cur = self._conn().execute(
+            "UPDATE pages SET lease_expires = ? WHERE paper_id = ? AND page_idx = ? AND status = ? AND lease_owner = ?",
+            (time.time() + lease_seconds, paper_id, page_idx, LEASED, worker_id))
+        return cur.rowcount == 1
+
+    def release_page(self, paper_id, page_idx, worker_id):
+        """放弃租约，页面回到待翻译状态 (例如收到停止信号)"""
+        self._conn().execute(
+            "UPDATE pages SET status = ?, lease_owner = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0), "
+            "updated_at = ? WHERE paper_id = ? AND page_idx = ? AND lease_owner = ?",
+            (PENDING, time.time(), paper_id, page_idx, worker_id))
+
+    def _result_path(self, paper_name, page_idx):
+        return os.path.join(config.OUTPUT_DIR, paper_name, "pages", f"page_{page_idx + 1}.md")
+
+    def _paper_name(self, paper_id):
+        return self._conn().execute("SELECT name FROM papers WHERE id = ?", (paper_id,)).fetchone()["name"]
+
+    def _fence(self, worker_id):
+        """worker_id 为 None 表示本地直接写入 (导入、跳过、复用旧版本)，不校验租约"""
+        if worker_id is None:
+            return "", ()
+        return " AND status = ? AND lease_owner = ?", (LEASED, worker_id)
+
+    def complete_page(self, paper_id, page_idx, worker_id, text, provider=None, latency=None):
+        """
+        保存翻译结果并将页面标记为完成。
+        返回: 更新的行数，0 表示租约已被回收 (该页已由他人领取或完成)，结果被丢弃
+        """
+        with tracer.span("save_progress", paper_id=paper_id, page=page_idx + 1):
+            result_path = self._result_path(self._paper_name(paper_id), page_idx)
+            os.makedirs(os.path.dirname(result_path), exist_ok=True)
+            # 每个写入者使用独立的临时文件，租约校验通过后才替换正式结果文件
+            tmp_path = f"{result_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            fence, fence_params = self._fence(worker_id)
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = conn.execute(
+                    "UPDATE pages SET status = ?, provider = ?, latency = ?, result_path = ?, error = NULL, "
+                    "lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE paper_id = ? AND page_idx = ?" + fence,
+                    (DONE, provider, latency, result_path, time.time(), paper_id, page_idx) + fence_params)
+                if cur.rowcount:
+                    os.replace(tmp_path, result_path)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return cur.rowcount
+
+    def fail_page(self, paper_id, page_idx, worker_id, error, latency=None):
+        """将页面标记为失败，返回更新的行数 (0 表示租约已被回收)"""
+        fence, fence_params = self._fence(worker_id)
+        cur = self._conn().execute(
+            "UPDATE pages SET status = ?, error = ?, latency = ?, lease_owner = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE paper_id = ? AND page_idx = ?" + fence,
+            (FAILED, str(error), latency, time.time(), paper_id, page_idx) + fence_params)
+        return cur.rowcount
+
+    # ---------- 读取结果 ----------
+    def get_pages(self, paper_id):
+        rows = self._conn().execute("SELECT * FROM pages WHERE paper_id = ? ORDER BY page_idx", (paper_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def read_result(page, placeholder=True):
+        """读取页面翻译结果，失败页返回占位符 (placeholder=False 时返回 None)，未完成返回 None"""
+        if page["status"] == DONE and page["result_path"] and os.path.exists(page["result_path"]):
+            with open(page["result_path"], 'r', encoding='utf-8') as f:
+                return f.read()
+        if page["status"] == FAILED and placeholder:
+            return failed_page_placeholder(page["page_idx"] + 1)
+        return None
+
+    def get_page_text(self, paper_id, page_idx):
+        """返回已完成页面的翻译结果，用于构建下一页的上下文"""
+        row = self._conn().execute(
+            "SELECT * FROM pages WHERE paper_id = ? AND page_idx = ?", (paper_id, page_idx)).fetchone()
+        return self.read_result(dict(row), placeholder=False) if row else None
+
+    def get_translated_texts(self, paper_id):
+        """按页码顺序返回所有页面的翻译结果 (未完成的页面为 None)"""
+        return [self.read_result(page) for page in self.get_pages(paper_id)]
+
+    # ---------- 章节 (sharding.py) ----------
+    def set_chapters(self, paper_id, chapters):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM chapters WHERE paper_id = ?", (paper_id,))
+            conn.executemany(
+                "INSERT INTO chapters (paper_id, chapter_idx, title, start_page, end_page) VALUES (?, ?, ?, ?, ?)",
+                [(paper_id, idx, c["title"], c["start_page"], c["end_page"]) for idx, c in enumerate(chapters)])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_chapters(self, paper_id):
+        rows = self._conn().execute(
+            "SELECT title, start_page, end_page FROM chapters WHERE paper_id = ? ORDER BY chapter_idx", (paper_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def is_chapter_start(self, paper_id, page_idx):
+        return self._conn().execute(
+            "SELECT 1 FROM chapters WHERE paper_id = ? AND start_page = ?", (paper_id, page_idx)).fetchone() is not None
+
+    # ---------- 上传记录 (service.py) ----------
+    def record_upload(self, content_hash, job_id, paper_name, filename, client_id, pdf_path):
+        self._conn().execute(
+            "INSERT OR IGNORE INTO uploads (content_hash, job_id, paper_name, filename, client_id, pdf_path, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, job_id, paper_name, filename, client_id, pdf_path, time.time()))
+
+    def find_upload(self, content_hash=None, job_id=None):
+        """按内容哈希或任务 ID 查找上传记录"""
+        column, value = ("content_hash", content_hash) if content_hash else ("job_id", job_id)
+        row = self._conn().execute(f"SELECT * FROM uploads WHERE {column} = ?", (value,)).fetchone()
+        return dict(row) if row else None
+
+    def list_uploads(self):
+        return [dict(row) for row in self._conn().execute("SELECT * FROM uploads ORDER BY created_at").fetchall()]
+
+    # ---------- 旧格式导入 ----------
+    def import_progress_json(self, paper_id, paper_output_dir):
+        """
+        将旧版 progress.json 中的翻译结果导入数据库 (仅当该论文尚无已完成页面时)。
+        返回: 导入的页数
+        """
+        progress_data = load_progress(paper_output_dir)
+        if not progress_data:
+            return 0
+        counts = self.paper_status_counts(paper_id)
+        if counts.get(DONE, 0) or counts.get(FAILED, 0):
+            return 0
+
+        imported = 0
+        for page_idx, text in enumerate(progress_data.get("translated_texts", [])):
+            if "> [ERROR]" in text:
+                self.fail_page(paper_id, page_idx, None, "imported from progress.json")
+            else:
+                self.complete_page(paper_id, page_idx, None, text, provider="progress.json")
+            imported += 1
+        if imported:
+            os.replace(os.path.join(paper_output_dir, "progress.json"),
+                       os.path.join(paper_output_dir, "progress.json.imported"))
+            Logger.info(f"已从旧版 progress.json 导入 {imported} 页翻译进度。", indent=2)
+        return imported
+
+
+def import_all_progress(store=None):
+    """扫描 output 目录，将所有旧版 progress.json 导入任务队列"""
+    store = store or JobStore()
+    total = 0
+    for name in sorted(os.listdir(config.OUTPUT_DIR)):
+        paper_output_dir = os.path.join(config.OUTPUT_DIR, name)
+        if not os.path.exists(os.path.join(paper_output_dir, "progress.json")):
+            continue
+        image_files = sorted((f for f in os.listdir(paper_output_dir) if f.startswith("page_") and f.endswith(".png")),
+                             key=lambda x: int(x.split('_')[1].split('.')[0]))
+        paper_id = store.register_paper(name, os.path.join(config.DATA_DIR, f"{name}.pdf"),
+                                        [os.path.join(paper_output_dir, f) for f in image_files])
+        total += store.import_progress_json(paper_id, paper_output_dir)
+    return total
+
+
+if __name__ == "__main__":
+    count = import_all_progress()
+    print(f"共导入 {count} 页旧版翻译进度至 {config.JOB_DB_PATH}")
@@ -0,0 +1,160 @@
+# key_pool.py
+"""
+API Key 池: 每个服务商可配置多个 Key，按“进行中请求最少”分配，
+无效的 Key 永久移出，限流 / 额度耗尽的 Key 冷却一段时间后再启用。
+同时支持按权重在多个服务商之间分流 (config.PROVIDER_WEIGHTS)。
+"""
+import time
+import threading
+import config
+
+# 服务商 -> (Key 列表, 占位符)
+PROVIDER_KEYS = {
+    "gemini": lambda: (config.GOOGLE_API_KEYS, "你的_GOOGLE_API_KEY"),
+    "aliyun": lambda: (config.DASHSCOPE_API_KEYS, "你的_DASHSCOPE_API_KEY"),
+    "siliconflow": lambda: (config.QWEN_API_KEYS, "你的_QWEN_API_KEY"),
+}
+
+# 服务商 -> 模型 (按降级顺序)
+PROVIDER_MODELS = {
+    "gemini": [config.MODEL_GEMINI_PRO, config.MODEL_GEMINI_FLASH],
+    "aliyun": [config.MODEL_ALIYUN_QWEN],
+    "siliconflow": [config.MODEL_QWEN],
+}
+
+# Key 被停用的原因
+INVALID, EXHAUSTED, RATE_LIMITED = "invalid", "exhausted", "rate_limited"
+
+
+class ProviderNotConfiguredError(Exception):
+    """服务商未配置 API Key，无需重试"""
+    pass
+
+
+class NoAvailableKeyError(ProviderNotConfiguredError):
+    """服务商的 Key 均已失效或处于冷却中"""
+    pass
+
+
+class KeyRejectedError(Exception):
+    """服务端拒绝了当前 Key (无效 / 限流 / 额度耗尽)，换一个 Key 可立即重试"""
+    pass
+
+
+def model_provider(model_name):
+    """返回模型所属的服务商，未知模型返回 None"""
+    return next((provider for provider, models in PROVIDER_MODELS.items() if model_name in models), None)
+
+
+def configured_keys(provider):
+    """返回服务商已配置的有效 Key (去掉占位符与重复项)"""
+    keys, placeholder = PROVIDER_KEYS[provider]()
+    keys = list(dict.fromkeys(k for k in keys if k and k != placeholder))
+    if not keys and config.CASSETTE_MODE == "replay":
+        return ["replay"]  # 回放录制的流量时不需要真实的 Key
+    return keys
+
+
+def provider_configured(provider):
+    return bool(configured_keys(provider))
+
+
+def mask_key(key):
+    """日志与统计中只显示 Key 的末 4 位"""
+    return f"...{key[-4:]}" if len(key) > 4 else "..."
+
+
+def classify_rejection(status, body=""):
+    """根据 HTTP 状态码与响应内容判断是否为 Key 的问题，返回停用原因或 None"""
+    body = (body or "").lower()
+    if status in (401, 403) or (status == 400 and ("api_key_invalid" in body or "api key not valid" in body)):
+        return INVALID
+    if status == 429 or "arrearage" in body:
+        if "perday" in body or "per day" in body or "insufficient_quota" in body or "arrearage" in body:
+            return EXHAUSTED
+        return RATE_LIMITED
+    return None
+
+
+class ApiKey:
+    def __init__(self, provider, secret):
+        self.provider = provider
+        self.secret = secret
+        self.label = mask_key(secret)
+        self.outstanding = 0      # 进行中的请求数
+        self.requests = 0
+        self.disabled_reason = None
+        self.cooldown_until = 0.0
+
+    def available(self, now):
+        return self.disabled_reason != INVALID and now >= self.cooldown_until
+
+
+class KeyPool:
+    def __init__(self, stats_manager=None, keys_by_provider=None):
+        self.stats_manager = stats_manager
+        if keys_by_provider is None:
+            keys_by_provider = {provider: configured_keys(provider) for provider in PROVIDER_KEYS}
+        self.keys = {provider: [ApiKey(provider, secret) for secret in secrets]
+                     for provider, secrets in keys_by_provider.items()}
+        self._lock = threading.Lock()
+
+    def has_available(self, provider):
+        now = time.time()
+        with self._lock:
+            return any(key.available(now) for key in self.keys.get(provider, []))
+
+    def acquire(self, provider):
+        """取出进行中请求最少的可用 Key (相同时取累计请求最少的)"""
+        now = time.time()
+        with self._lock:
+            candidates = [key for key in self.keys.get(provider, []) if key.available(now)]
+            if not candidates:
+                if not self.keys.get(provider):
+                    raise ProviderNotConfiguredError(f"{provider} API Key 未配置")
+                raise NoAvailableKeyError(f"{provider} 的 API Key 均已失效或处于冷却中")
+            key = min(candidates, key=lambda k: (k.outstanding, k.requests))
+            key.outstanding += 1
+            key.requests += 1
+            return key
+
+    def release(self, key, success, latency=None, status=None, body=""):
+        """
+        归还 Key 并记录结果。失败时根据状态码判断是否停用该 Key。
+        返回: 停用原因 (invalid / exhausted / rate_limited) 或 None
+        """
+        reason = None if success else classify_rejection(status, body)
+        with self._lock:
+            key.outstanding = max(0, key.outstanding - 1)
+            if reason == RATE_LIMITED and not any(
+                    other.available(time.time()) for other in self.keys[key.provider] if other is not key):
+                reason = None  # 没有其他可用 Key 时不冷却，沿用原有的等待重试 / 降级逻辑
+            if reason:
+                key.disabled_reason = reason
+                if reason == EXHAUSTED:
+                    key.cooldown_until = time.time() + config.KEY_EXHAUSTED_COOLDOWN
+                elif reason == RATE_LIMITED:
+                    key.cooldown_until = time.time() + config.KEY_RATE_LIMIT_COOLDOWN
+            elif success and key.disabled_reason != INVALID:
+                key.disabled_reason = None
+        if self.stats_manager:
+            self.stats_manager.record_key_usage(key.provider, key.label, success, latency, reason)
+        return reason
+
+    def provider_load(self, provider):
+        """返回服务商 (进行中请求数, 累计请求数)"""
+        with self._lock:
+            keys = self.keys.get(provider, [])
+            return sum(key.outstanding for key in keys), sum(key.requests for key in keys)
+
+    def pick_provider(self, weights):
+        """
+        按权重在多个服务商之间分流: 选择 进行中请求 / 权重 最小的服务商，
+        相同时比较 累计请求 / 权重 (串行处理时按权重比例轮流)。
+        只考虑有可用 Key 的服务商，都不可用时返回 None
+        """
+        candidates = [p for p, weight in weights.items() if weight > 0 and p in self.keys and self.has_available(p)]
+        if not candidates:
+            return None
+        loads = {p: self.provider_load(p) for p in candidates}
+        return min(candidates, key=lambda p: (loads[p][0] / weights[p], loads[p][1] / weights[p], -weights[p]))
@@ -2,79 +2,480 @@
 import os
 import sys
 import time
+STARTUP_PERF = time.perf_counter()  # 进程启动 (导入模块之前) 的时间点，用于统计启动耗时
+import argparse
+import threading
 import config
 import traceback
-import requests  # 添加导入
-from utils import Logger, ensure_directories, extract_last_sentences, save_progress, load_progress
-from pdf_processor import convert_pdf_to_images
+from utils import Logger, ensure_directories, extract_last_sentences, add_log_arguments, configure_logging
+from pdf_processor import convert_pdf_to_images, get_page_text_stats
 from ai_handler import AIHandler
+from key_pool import provider_configured, configured_keys
+from preflight import run_probes
 from stats_manager import StatsManager # 导入 StatsManager
-
-
-def pre_flight_checks():
-    """执行程序启动前的环境检查"""
+from job_store import JobStore, DONE, FAILED, default_worker_id
+from versioning import prepare_paper_version
+from sharding import apply_sharding
+from pdf_slicer import page_count, parse_ranges, format_ranges, range_pages
+from page_triage import triage_pages, apply_triage
+from tracer import tracer
+from datetime import datetime
+
+
+def pre_flight_checks(offline=None):
+    """执行程序启动前的环境检查。offline 为 True 时只检查 API Key，跳过网络探测"""
+    if offline is None:
+        offline = config.OFFLINE_FAST_START
     Logger.separator('-', 50)
-    print("执行启动前环境检查...")
+    Logger.plain("执行启动前环境检查...")
     
     # 检查 API Keys
-    google_key_ok = config.GOOGLE_API_KEY and config.GOOGLE_API_KEY != "你的_GOOGLE_API_KEY"
-    aliyun_key_ok = config.DASHSCOPE_API_KEY and config.DASHSCOPE_API_KEY != "你的_DASHSCOPE_API_KEY"
-    siliconflow_key_ok = config.QWEN_API_KEY and config.QWEN_API_KEY != "你的_QWEN_API_KEY"
+    google_key_ok = provider_configured("gemini")
+    aliyun_key_ok = provider_configured("aliyun")
+    siliconflow_key_ok = provider_configured("siliconflow")
 
     if not google_key_ok and not aliyun_key_ok and not siliconflow_key_ok:
         Logger.error("检查失败: 所有 API Key (Google, Aliyun, SiliconFlow) 均未配置。")
-        print("请至少在系统中设置一个有效的 API 密钥环境变量（如 GOOGLE_API_KEY），或在 config.py 中修改。")
+        Logger.plain("请至少在系统中设置一个有效的 API 密钥环境变量（如 GOOGLE_API_KEY），或在 config.py 中修改。")
         Logger.separator('-', 50)
         return False
 
     # 详细报告每个key的状态
     if google_key_ok:
-        Logger.success("检查通过: Google API Key 已配置。")
+        Logger.success(f"检查通过: Google API Key 已配置 ({len(configured_keys('gemini'))} 个)。")
     else:
         Logger.warning("注意: Google API Key 未配置，将依赖备用模型。")
 
     if aliyun_key_ok:
-        Logger.success("检查通过: Aliyun DashScope API Key 已配置。")
+        Logger.success(f"检查通过: Aliyun DashScope API Key 已配置 ({len(configured_keys('aliyun'))} 个)。")
     else:
         Logger.warning("注意: Aliyun API Key 未配置，第一备用模型将不可用。")
 
     if siliconflow_key_ok:
-        Logger.success("检查通过: SiliconFlow API Key 已配置。")
+        Logger.success(f"检查通过: SiliconFlow API Key 已配置 ({len(configured_keys('siliconflow'))} 个)。")
     else:
         Logger.warning("注意: SiliconFlow API Key 未配置，第二备用模型将不可用。")
 
-    # 如果配置了Google Key，则检查网络
+    if offline:
+        Logger.info("离线快速启动: 跳过网络连通性检查。")
+        Logger.separator('-', 50)
+        return True
+
+    # 并发探测已配置服务商的端点 (结果短时间缓存)
+    targets = {}
     if google_key_ok:
-        Logger.info("正在检查 Google 网络连通性...")
-        try:
-            response = requests.get(config.GOOGLE_TEST_URL, timeout=10)
-            if response.status_code == 200:
-                Logger.success("检查通过: 网络连接正常，可以访问 Google 服务。")
-            else:
-                Logger.warning(f"网络警告: 无法访问 Google 服务 (状态码: {response.status_code})，将依赖备用模型。")
-        except requests.exceptions.RequestException:
+        targets["google"] = config.GOOGLE_TEST_URL
+    if aliyun_key_ok:
+        targets["aliyun"] = config.DASHSCOPE_API_URL
+    if siliconflow_key_ok:
+        targets["siliconflow"] = config.QWEN_API_URL
+    Logger.info(f"正在检查网络连通性 ({', '.join(targets)})...")
+    results = run_probes(targets)
+
+    google = results.get("google")
+    if google:
+        if google["status"] == 200:
+            Logger.success("检查通过: 网络连接正常，可以访问 Google 服务。" + (" (缓存)" if google["cached"] else ""))
+        elif google["reachable"]:
+            Logger.warning(f"网络警告: 无法访问 Google 服务 (状态码: {google['status']})，将依赖备用模型。")
+        else:
             Logger.warning(f"网络警告: 无法连接到 {config.GOOGLE_TEST_URL}，将依赖备用模型。")
+    for name, label in (("aliyun", "Aliyun DashScope"), ("siliconflow", "SiliconFlow")):
+        result = results.get(name)
+        if result and not result["reachable"]:
+            Logger.warning(f"网络警告: 无法连接到 {label} ({result['url']}): {result['error']}")
     
     Logger.separator('-', 50)
     return True
 
 
-def main():
+def build_page_prompt(job_store, paper_id, page_idx):
+    """构建某一页的用户提示词，附加上一页最后两句话作为上下文 (章节首页不附加)"""
+    context_instruction = ""
+    if page_idx > 0 and not job_store.is_chapter_start(paper_id, page_idx):
+        prev_text = job_store.get_page_text(paper_id, page_idx - 1)
+        last_sentences = extract_last_sentences(prev_text)
+        if last_sentences:
+            context_instruction = config.CONTEXT_INSTRUCTION.format(prev_context=last_sentences)
+            Logger.api_log("附加前一页的最后两句话作为上下文。", indent=3)
+
+    return config.USER_PROMPT_TEMPLATE.format(
+        page_num=page_idx + 1,
+        context_instruction=context_instruction
+    )
+
+
+def merge_translations(pdf_name_no_ext, translated_texts, chapters=None, page_numbers=None):
+    """
+    将所有页面翻译合并为 Trans/翻译-<论文>.md (按章节切分时在章节首页前插入章节标题)，返回是否成功
+    page_numbers 为各页在原 PDF 中的页码 (只翻译部分页面时使用)，默认从 1 开始编号
+    """
+    Logger.info("开始合并所有页面翻译内容...", indent=2)
+
+    final_markdown_path = os.path.join(config.TRANS_DIR, f"翻译-{pdf_name_no_ext}.md")
+
+    try:
+        with tracer.span("merge", paper=pdf_name_no_ext, pages=len(translated_texts)):
+            # 先写临时文件再替换，多个进程同时合并时不会产生半截文件
+            tmp_markdown_path = f"{final_markdown_path}.{os.getpid()}.tmp"
+            with open(tmp_markdown_path, 'w', encoding='utf-8') as f:
+                f.write(f"# {pdf_name_no_ext}\n\n")
+                chapter_titles = {c["start_page"]: c["title"] for c in chapters or []}
+                for page_idx, text in enumerate(translated_texts):
+                    if page_idx in chapter_titles:
+                        f.write(f"\n\n## {chapter_titles[page_idx]}\n")
+                    page_num = page_numbers[page_idx] if page_numbers else page_idx + 1
+                    f.write(f"\n\n--- Page {page_num} ---\n\n")
+                    f.write(text)
+            os.replace(tmp_markdown_path, final_markdown_path)
+
+        Logger.success(f"合并完成, '{os.path.basename(final_markdown_path)}' 已保存至 'Trans' 文件夹。", indent=2)
+        return True
+
+    except Exception as e:
+        Logger.error(f"文件写入失败: {e}", indent=2)
+        return False
+
+
+def run_triage(pdf_path, pages=None):
+    """缩略图预检 (见 page_triage.py)，未启用或出错时返回空列表"""
+    if not config.TRIAGE_ENABLED:
+        return []
+    try:
+        with tracer.span("triage", pages=len(pages) if pages is not None else None):
+            return triage_pages(pdf_path, pages)
+    except Exception as e:
+        Logger.warning(f"缩略图预检失败，将翻译所有页面: {e}", indent=2)
+        return []
+
+
+def _claim_pages(pdf_file, ai_handler, stats_manager, job_store, paper_id, image_paths, page_stats, stop_event=None):
+    """
+    逐个领取并翻译论文的页面，直到没有可领取的页面。
+    返回: True 表示论文已全部完成，False 表示收到停止信号，None 表示剩余页面正由其他进程/线程翻译
+    """
+    pdf_name_no_ext = os.path.splitext(pdf_file)[0]
+    worker_id = default_worker_id()
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            Logger.warning(f"收到停止信号，论文 \"{pdf_file}\" 的进度已保存，下次启动时继续。", indent=2)
+            return False
+
+        page = job_store.claim_page(worker_id, paper_id=paper_id)
+        if page is None:
+            return True if job_store.is_paper_complete(paper_id) else None
+
+        page_start_time = time.time() # 记录页面开始时间
+        i = page["page_idx"]
+        img_path = page["image_path"]
+        current_page_num = i + 1
+        Logger.info(f"翻译第 {current_page_num}/{len(image_paths)} 页...", indent=2)
+
+        prompt = build_page_prompt(job_store, paper_id, i)
+
+        try:
+            # 调用 AI
+            with tracer.span("page", paper=pdf_name_no_ext, page=current_page_num), \
+                    Logger.bind(paper=pdf_name_no_ext, page=current_page_num):
+                page_info = page_stats[i] if i < len(page_stats) else None
+                page_content = ai_handler.translate_page(img_path, prompt, page_info)
+
+            # 实时保存结果
+            page_end_time = time.time() # 记录页面结束时间
+            if not job_store.complete_page(paper_id, i, worker_id, page_content,
+                                           provider=ai_handler.last_served_model(), latency=page_end_time - page_start_time):
+                Logger.warning(f"页面 {current_page_num} 的租约已被回收，本次结果已丢弃。", indent=3)
+            stats_manager.record_page_time(page_end_time - page_start_time, True, ai_handler.last_served_model()) # 记录页面耗时
+
+        except Exception as e:
+            Logger.critical(f"页面 {current_page_num} 翻译彻底失败: {e}", indent=3)
+            # 标记为失败，合并时插入占位符，避免整体失败
+            page_end_time = time.time() # 记录页面结束时间
+            job_store.fail_page(paper_id, i, worker_id, e, latency=page_end_time - page_start_time)
+            # 这里选择继续下一页，而不是终止程序
+            stats_manager.record_page_time(page_end_time - page_start_time, False) # 记录页面耗时 (即使失败也记录)
+
+
+def process_paper(pdf_file, ai_handler, stats_manager, job_store, stop_event=None, label="", data_dir=None, page_spec=None):
+    """
+    处理单篇论文: 切分 -> 逐页翻译 (通过任务队列领取页面，支持断点续传与多进程协作) -> 合并
+    stop_event 被设置时，在当前页完成并保存后停止，不合并。
+    data_dir 为 PDF 所在目录，默认 config.DATA_DIR。
+    page_spec 为页码范围 (如 "3-7,10") 时只翻译这些页，结果保存为 翻译-<论文>_p<范围>.md。
+    返回: True 表示论文处理完成，False 表示被跳过或中断，None 表示剩余页面正由其他进程翻译
+    """
+    paper_start_time = time.time() # 记录论文开始时间
+    paper_trace_start = time.perf_counter()
+    Logger.plain()
+    Logger.separator()
+    Logger.info(f"开始处理论文{label}: {pdf_file}")
+    Logger.separator()
+
+    pdf_path = os.path.join(data_dir or config.DATA_DIR, pdf_file)
+    pdf_name_no_ext = os.path.splitext(pdf_file)[0]
+    paper_output_dir = os.path.join(config.OUTPUT_DIR, pdf_name_no_ext)
+
+    # --- 步骤 1: 切分 PDF ---
+    Logger.info("步骤 1/3: 切分 PDF 为图片", indent=1)
+    pages = None
+    try:
+        if page_spec:
+            # 只渲染指定页，无需先写出切割后的 PDF
+            ranges = parse_ranges(page_spec, page_count(pdf_path))
+            pages = range_pages(ranges)
+            pdf_name_no_ext = f"{pdf_name_no_ext}_p{format_ranges(ranges)}"
+            paper_output_dir = os.path.join(config.OUTPUT_DIR, pdf_name_no_ext)
+            Logger.info(f"只翻译第 {format_ranges(ranges)} 页 (共 {len(pages)} 页)。", indent=2)
+        triage = run_triage(pdf_path, pages)
+        page_nums = pages if pages is not None else range(len(triage))
+        skip_pages = {page_nums[i] for i, result in enumerate(triage) if result["skip"]}
+        with tracer.span("convert_pdf", paper=pdf_name_no_ext):
+            image_paths = convert_pdf_to_images(pdf_path, config.OUTPUT_DIR, pages=pages, name=pdf_name_no_ext,
+                                                skip_pages=skip_pages, stats_manager=stats_manager)
+        Logger.info(f"PDF 切分结果: image_paths 包含 {len(image_paths)} 张图片。", indent=2) # Debug log
+        page_stats = get_page_text_stats(pdf_path, pages) if ai_handler.model_selector else []
+    except Exception as e:
+        Logger.error(f"处理 PDF 失败，跳过此论文。错误: {e}", indent=2)
+        Logger.info("PDF 切分异常捕获，跳过当前论文。", indent=2) # Debug log
+        return False
+
+    # --- 步骤 2: 逐页翻译 (支持断点续传) ---
+    Logger.info("步骤 2/3: 逐页翻译", indent=1)
+    if ai_handler.model_selector:
+        ai_handler.model_selector.begin_paper(pdf_name_no_ext)
+
+    # 登记论文并加载进度 (兼容旧版 progress.json)
+    paper_id = job_store.register_paper(pdf_name_no_ext, pdf_path, image_paths)
+    job_store.import_progress_json(paper_id, paper_output_dir)
+    # 版本比对与章节切分都基于整篇 PDF，只翻译部分页面时跳过
+    if config.VERSION_DIFF_ENABLED and pages is None:
+        try:
+            prepare_paper_version(job_store, paper_id, pdf_path, image_paths)
+        except Exception as e:
+            Logger.warning(f"版本比对失败，将完整翻译: {e}", indent=2)
+    chapters = []
+    if pages is None:
+        try:
+            chapters = apply_sharding(job_store, paper_id, pdf_path, len(image_paths))
+        except Exception as e:
+            Logger.warning(f"章节切分失败，将按页顺序翻译: {e}", indent=2)
+    apply_triage(job_store, paper_id, triage, [i + 1 for i in pages] if pages is not None else None, stats_manager)
+    counts = job_store.paper_status_counts(paper_id)
+    finished_pages = counts.get(DONE, 0) + counts.get(FAILED, 0)
+    if finished_pages >= len(image_paths):
+        Logger.success("该论文所有页面已翻译，直接合并。", indent=2)
+    elif finished_pages > 0:
+        Logger.info(f"检测到上次翻译进度，已完成 {finished_pages}/{len(image_paths)} 页，继续翻译。", indent=2)
+
+    # 开始翻译循环: 逐个领取页面租约 (按章节切分时多个线程并行领取不同章节的页面)
+    claim_args = (pdf_file, ai_handler, stats_manager, job_store, paper_id, image_paths, page_stats, stop_event)
+    if chapters and config.SHARD_WORKERS > 1:
+        results = []
+
+        def shard_worker():
+            if ai_handler.model_selector:
+                ai_handler.model_selector.use_paper(pdf_name_no_ext)  # 与其他章节线程共用本论文的预算
+            while True:
+                result = _claim_pages(*claim_args)
+                # 暂时没有可领取的页面 (等待其他线程完成上一页) 时，只要还有其他线程在翻译就继续等待
+                if result is not None or not any(t.is_alive() for t in threads if t is not threading.current_thread()):
+                    results.append(result)
+                    return
+                time.sleep(1)
+
+        threads = [threading.Thread(target=shard_worker, name=f"shard-{n}")
+                   for n in range(min(config.SHARD_WORKERS, len(chapters)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = False if False in results else (True if job_store.is_paper_complete(paper_id) else None)
+    else:
+        result = _claim_pages(*claim_args)
+    if result is None:
+        Logger.info("剩余页面正由其他进程翻译，稍后再检查。", indent=2)
+    if result is not True:
+        return result
+
+    translated_texts = job_store.get_translated_texts(paper_id)
+
+    # --- 步骤 3: 合并结果 ---
+    Logger.info("步骤 3/3: 合并翻译结果", indent=1)
+    if merge_translations(pdf_name_no_ext, translated_texts, chapters,
+                          page_numbers=[i + 1 for i in pages] if pages is not None else None):
+        Logger.success(f"论文 \"{pdf_file}\" 处理完成。", indent=0)
+
+    paper_end_time = time.time() # 记录论文结束时间
+    stats_manager.record_paper_time(paper_end_time - paper_start_time) # 记录论文耗时
+    tracer.add_span("paper", paper_trace_start, time.perf_counter() - paper_trace_start, paper=pdf_name_no_ext, pages=len(image_paths))
+    return True
+
+
+def _paper_page_range(paper):
+    """只翻译部分页面的论文 (名称形如 <论文>_p3-7,10) 返回其在原 PDF 中的页码索引列表，否则返回 None"""
+    stem = os.path.splitext(os.path.basename(paper["pdf_path"]))[0]
+    spec = paper["name"][len(stem) + 2:] if paper["name"].startswith(f"{stem}_p") else None
+    if not spec:
+        return None
+    try:
+        return range_pages(parse_ranges(spec, page_count(paper["pdf_path"])))
+    except Exception:
+        return None
+
+
+def repair_failed_pages(ai_handler, stats_manager, job_store):
+    """
+    修复模式: 扫描任务队列中已处理完但含失败页面的论文，只重新翻译失败页面
+    (上一页的译文照常作为上下文，连续失败的页面按顺序修复)，多个线程跨论文并行，最后重新合并受影响的论文。
+    返回: 修复成功的页数
+    """
+    papers = job_store.papers_with_failures()
+    if not papers:
+        Logger.info("没有需要修复的失败页面。")
+        return 0
+    total_failed = sum(paper["failed"] for paper in papers)
+    Logger.info(f"发现 {len(papers)} 篇论文共 {total_failed} 个失败页面，开始修复...")
+
+    jobs = []
+    for paper in papers:
+        if ai_handler.model_selector:
+            ai_handler.model_selector.begin_paper(paper["name"])  # 每篇论文只重置一次预算，修复线程共用
+        page_idxs = job_store.requeue_failed(paper["id"])
+        pages = _paper_page_range(paper)
+        page_stats = []
+        if ai_handler.model_selector and os.path.exists(paper["pdf_path"]):
+            try:
+                page_stats = get_page_text_stats(paper["pdf_path"], pages)
+            except Exception:
+                page_stats = []
+        Logger.info(f"{paper['name']}: 第 {', '.join(str(i + 1) for i in page_idxs)} 页", indent=1)
+        image_paths = [page["image_path"] for page in job_store.get_pages(paper["id"])]
+        jobs.append((paper, pages, (f"{paper['name']}.pdf", ai_handler, stats_manager, job_store,
+                                    paper["id"], image_paths, page_stats)))
+
+    def repair_worker():
+        while True:
+            waiting = False
+            for paper, _, claim_args in jobs:
+                if ai_handler.model_selector:
+                    ai_handler.model_selector.use_paper(paper["name"])
+                # 上一页也在修复中时暂时领取不到，先处理其他论文
+                if _claim_pages(*claim_args) is None:
+                    waiting = True
+            if not waiting:
+                return
+            time.sleep(1)
+
+    threads = [threading.Thread(target=repair_worker, name=f"repair-{n}")
+               for n in range(max(1, min(config.REPAIR_WORKERS, total_failed)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 重新合并受影响的论文
+    repaired = 0
+    for paper, pages, _ in jobs:
+        still_failed = job_store.paper_status_counts(paper["id"]).get(FAILED, 0)
+        repaired += paper["failed"] - still_failed
+        Logger.info(f"{paper['name']}: 修复 {paper['failed'] - still_failed}/{paper['failed']} 页", indent=1)
+        merge_translations(paper["name"], job_store.get_translated_texts(paper["id"]), job_store.get_chapters(paper["id"]),
+                           page_numbers=[i + 1 for i in pages] if pages is not None else None)
+    if repaired == total_failed:
+        Logger.success(f"修复完成: {repaired}/{total_failed} 页翻译成功。")
+    else:
+        Logger.warning(f"修复完成: {repaired}/{total_failed} 页翻译成功，仍失败的页面可再次运行 --repair。")
+    return repaired
+
+
+def record_startup(stats_manager):
+    """记录从进程启动到可以开始翻译的耗时"""
+    startup_seconds = time.perf_counter() - STARTUP_PERF
+    stats_manager.record_startup_time(startup_seconds)
+    tracer.add_span("startup", STARTUP_PERF, startup_seconds)
+    Logger.info(f"启动耗时: {startup_seconds * 1000:.0f} ms")
+
+
+def finish_run(stats_manager):
+    """打印并保存总结报告，导出阶段耗时追踪"""
+    Logger.plain(stats_manager.get_summary_string())
+    save_run_records(stats_manager)
+    Logger.flush()
+
+
+def save_run_records(stats_manager, rotate=False):
+    """保存总结报告、追加性能历史并导出阶段耗时追踪；rotate 为 True 时导出后清空追踪事件 (守护进程定期落盘)"""
+    summary_file_path = stats_manager.save_summary()
+    Logger.info(f"详细执行总结已保存至: {summary_file_path}")
+
+    # 追加到跨运行的性能历史 (失败不影响本次运行)
+    if config.PERF_HISTORY_ENABLED:
+        try:
+            import perf_history
+            run_id = perf_history.record_run(stats_manager)
+            if run_id is not None:
+                Logger.info(f"性能指标已追加至历史 (运行 #{run_id})，可用 python perf_history.py report 查看趋势")
+        except Exception as e:
+            Logger.warning(f"性能历史写入失败: {e}")
+
+    # 导出阶段耗时追踪
+    if tracer.enabled and tracer.has_events():
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        trace_file_path = tracer.export_chrome_trace(os.path.join(config.TRACE_DIR, f"trace_{timestamp}.json"), rotate)
+        Logger.info(f"阶段耗时追踪已保存至: {trace_file_path} (可用 Perfetto 打开)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI 论文翻译")
+    parser.add_argument("--offline", action="store_true", default=config.OFFLINE_FAST_START,
+                        help="离线快速启动: 跳过启动时的网络探测")
+    parser.add_argument("--pages", default=None,
+                        help="只翻译指定页码范围，例如 3-7,10 (对 Data 下的每篇 PDF 生效)")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="DIR", default=None,
+                                help="录制服务商的请求与响应到 DIR (用于离线复现与基准测试)")
+    cassette_group.add_argument("--replay", metavar="DIR", default=None,
+                                help="离线回放 DIR 中录制的响应，不访问网络")
+    parser.add_argument("--replay-speed", type=float, default=None,
+                        help="回放速度倍数 (默认 1 按录制节奏，0 不等待)")
+    parser.add_argument("--native-pdf", action="store_true", default=config.PDF_NATIVE_ENABLED,
+                        help="原生 PDF 模式: 每页切为单页 PDF 直接发送给模型，不渲染图片")
+    parser.add_argument("--repair", action="store_true",
+                        help="只重新翻译 output 中各论文的失败页面，并重新合并受影响的论文")
+    add_log_arguments(parser)
+    args = parser.parse_args(argv)
+    configure_logging(args)
+    if args.record or args.replay:
+        config.CASSETTE_MODE = "record" if args.record else "replay"
+        config.CASSETTE_DIR = args.record or args.replay
+    if args.replay_speed is not None:
+        config.CASSETTE_REPLAY_SPEED = args.replay_speed
+    config.PDF_NATIVE_ENABLED = args.native_pdf
+    if config.CASSETTE_MODE == "replay":
+        args.offline = True  # 回放时不需要网络探测
+
     Logger.separator('=', 50)
-    print("[START] AI 论文翻译程序启动")
+    Logger.plain("[START] AI 论文翻译程序启动")
     Logger.separator('=', 50)
 
     stats_manager = StatsManager(config.OUTPUT_DIR) # 实例化 StatsManager
 
     try:
         # 0. 执行启动前检查
-        if not pre_flight_checks():
-            print("\n环境检查未通过，程序已终止。请根据提示修复问题后重试。")
+        if not pre_flight_checks(offline=args.offline):
+            Logger.plain("\n环境检查未通过，程序已终止。请根据提示修复问题后重试。")
             sys.exit(1)
 
         # 1. 初始化目录
         ensure_directories([config.DATA_DIR, config.OUTPUT_DIR, config.TRANS_DIR])
 
+        if args.repair:
+            ai_handler = AIHandler(stats_manager)
+            job_store = JobStore()
+            record_startup(stats_manager)
+            repair_failed_pages(ai_handler, stats_manager, job_store)
+            return
+
         # 2. 扫描论文
         Logger.info('扫描 "Data" 文件夹...')
         pdf_files = [f for f in os.listdir(config.DATA_DIR) if f.lower().endswith('.pdf')]
@@ -85,124 +486,30 @@ def main():
 
         Logger.info(f"发现 {len(pdf_files)} 篇待翻译论文: {pdf_files}")
 
-        # 初始化 AI 处理器
+        # 初始化 AI 处理器与任务队列
         ai_handler = AIHandler(stats_manager) # 传递 stats_manager 实例
-
-        # 3. 循环处理每一篇论文
-        for idx, pdf_file in enumerate(pdf_files):
-            paper_start_time = time.time() # 记录论文开始时间
-            print()
-            Logger.separator()
-            Logger.info(f"开始处理论文 ({idx + 1}/{len(pdf_files)}): {pdf_file}")
-            Logger.separator()
-
-            pdf_path = os.path.join(config.DATA_DIR, pdf_file)
-            pdf_name_no_ext = os.path.splitext(pdf_file)[0]
-            paper_output_dir = os.path.join(config.OUTPUT_DIR, pdf_name_no_ext)
-
-            # --- 步骤 1: 切分 PDF ---
-            Logger.info("步骤 1/3: 切分 PDF 为图片", indent=1)
-            try:
-                image_paths = convert_pdf_to_images(pdf_path, config.OUTPUT_DIR)
-                Logger.info(f"PDF 切分结果: image_paths 包含 {len(image_paths)} 张图片。", indent=2) # Debug log
-            except Exception as e:
-                Logger.error(f"处理 PDF 失败，跳过此论文。错误: {e}", indent=2)
-                Logger.info("PDF 切分异常捕获，跳过当前论文。", indent=2) # Debug log
-                continue
-
-            # --- 步骤 2: 逐页翻译 (支持断点续传) ---
-            Logger.info("步骤 2/3: 逐页翻译", indent=1)
-
-            # 加载进度
-            progress_data = load_progress(paper_output_dir)
-            translated_texts = []
-            start_page_idx = 0
-
-            if progress_data:
-                translated_texts = progress_data.get("translated_texts", [])
-                start_page_idx = len(translated_texts)
-                if start_page_idx > 0:
-                    Logger.info(f"检测到上次翻译进度，从第 {start_page_idx + 1} 页继续。", indent=2)
-
-                # 如果已经全部翻译完
-                if start_page_idx >= len(image_paths):
-                    Logger.success("该论文所有页面已翻译，直接合并。", indent=2)
-
-            # 开始翻译循环
-            for i in range(start_page_idx, len(image_paths)):
-                page_start_time = time.time() # 记录页面开始时间
-                img_path = image_paths[i]
-                current_page_num = i + 1
-                Logger.info(f"翻译第 {current_page_num}/{len(image_paths)} 页...", indent=2)
-
-                # 构建提示词上下文
-                context_instruction = ""
-                if i > 0 and translated_texts:
-                    prev_text = translated_texts[-1]
-                    last_sentences = extract_last_sentences(prev_text)
-                    if last_sentences:
-                        context_instruction = config.CONTEXT_INSTRUCTION.format(prev_context=last_sentences)
-                        Logger.api_log("附加前一页的最后两句话作为上下文。", indent=3)
-
-                prompt = config.USER_PROMPT_TEMPLATE.format(
-                    page_num=current_page_num,
-                    context_instruction=context_instruction
-                )
-
-                try:
-                    # 调用 AI
-                    page_content = ai_handler.translate_page(img_path, prompt)
-
-                    # 记录结果
-                    translated_texts.append(page_content)
-
-                    # 实时保存进度
-                    save_progress(paper_output_dir, {"translated_texts": translated_texts})
-                    page_end_time = time.time() # 记录页面结束时间
-                    stats_manager.record_page_time(page_end_time - page_start_time) # 记录页面耗时
-
-                except Exception as e:
-                    Logger.critical(f"页面 {current_page_num} 翻译彻底失败: {e}", indent=3)
-                    # 插入占位符，避免整体失败
-                    error_placeholder = f"\n\n> [ERROR] 第 {current_page_num} 页翻译失败，请检查日志。\n\n"
-                    translated_texts.append(error_placeholder)
-                    save_progress(paper_output_dir, {"translated_texts": translated_texts})
-                    # 这里选择继续下一页，而不是终止程序
-                    page_end_time = time.time() # 记录页面结束时间
-                    stats_manager.record_page_time(page_end_time - page_start_time) # 记录页面耗时 (即使失败也记录)
-
-
-            # --- 步骤 3: 合并结果 ---
-            Logger.info("步骤 3/3: 合并翻译结果", indent=1)
-            Logger.info("开始合并所有页面翻译内容...", indent=2)
-
-            final_markdown_path = os.path.join(config.TRANS_DIR, f"翻译-{pdf_name_no_ext}.md")
-
-            try:
-                with open(final_markdown_path, 'w', encoding='utf-8') as f:
-                    f.write(f"# {pdf_name_no_ext}\n\n")
-                    for page_idx, text in enumerate(translated_texts):
-                        f.write(f"\n\n--- Page {page_idx + 1} ---\n\n")
-                        f.write(text)
-
-                Logger.success(f"合并完成, '{os.path.basename(final_markdown_path)}' 已保存至 'Trans' 文件夹。", indent=2)
-                Logger.success(f"论文 \"{pdf_file}\" 处理完成。", indent=0)
-
-            except Exception as e:
-                Logger.error(f"文件写入失败: {e}", indent=2)
-            
-            paper_end_time = time.time() # 记录论文结束时间
-            stats_manager.record_paper_time(paper_end_time - paper_start_time) # 记录论文耗时
+        job_store = JobStore()
+        record_startup(stats_manager)
+
+        # 3. 循环处理每一篇论文；剩余页面被其他进程持有的论文稍后再检查
+        remaining = list(pdf_files)
+        while remaining:
+            busy = []
+            for idx, pdf_file in enumerate(remaining):
+                if process_paper(pdf_file, ai_handler, stats_manager, job_store,
+                                 label=f" ({idx + 1}/{len(remaining)})", page_spec=args.pages) is None:
+                    busy.append(pdf_file)
+            if busy:
+                time.sleep(config.JOB_LEASE_POLL_INTERVAL)
+            remaining = busy
     finally:
-        print()
+        Logger.plain()
         Logger.separator('=', 50)
-        print("[END] 所有任务已完成, 程序正常退出。")
+        Logger.plain("[END] 所有任务已完成, 程序正常退出。")
         Logger.separator('=', 50)
-        
+
         # 打印并保存总结报告
-        print(stats_manager.get_summary_string())
-        summary_file_path = stats_manager.save_summary()
-        Logger.info(f"详细执行总结已保存至: {summary_file_path}")
+        finish_run(stats_manager)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,515 @@
+# mock_server.py
+"""
+本地模拟服务端，同时模拟 Gemini streamGenerateContent (SSE) 和 OpenAI chat-completions 协议
+(以及 Gemini 的 cachedContents 与 Files API 上传接口)，
+用于在不消耗真实额度的情况下测量整条流水线的吞吐。
+
+用法:
+    python mock_server.py --scenario flaky --port 8765
+然后按照启动时打印的环境变量设置 GEMINI_API_BASE / GEMINI_UPLOAD_BASE / DASHSCOPE_API_URL / QWEN_API_URL / GOOGLE_TEST_URL。
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ==================================================
+# ||                场景配置                     ||
+# ==================================================
+# 每个场景分别描述 gemini 与 openai 兼容接口 (阿里云 / 硅基流动) 的行为:
+#   latency:        ("fixed", 秒) / ("uniform", 下限, 上限) / ("lognormal", 中位数, sigma)
+#   chunks:         SSE 分块数量 (总延迟平均分摊到各分块之间)
+#   error_rate:     返回 500 的概率
+#   rate_limit_rate: 返回 429 的概率
+#   stall_rate:     发送响应头后卡住 stall_seconds 秒的概率
+#   truncate_rate:  首次请求 (非续写) 只返回一半内容并标记为长度截断 (MAX_TOKENS / length) 的概率
+#   cache_min_tokens: 创建 cachedContents 所需的最少 token 数，低于该值返回 400 (模拟真实服务的最小缓存限制)
+#   file_ttl:       上传文件 (Files API) 的保留时间(秒)，过期后引用该文件的请求返回 403
+#   upload_error_rate: 上传文件返回 500 的概率
+#   pdf_input:      是否接受 application/pdf 输入 (原生 PDF 模式)，False 时返回 400 Unsupported MIME type
+#   models:         按模型名覆盖以上字段，例如只让 gemini-2.5-pro 出错
+# 上下文缓存: 引用 cachedContents 的请求、以及系统提示词 (systemInstruction / system 消息) 与之前的请求相同时，
+# usage 中报告命中缓存的 token 数 (Gemini cachedContentTokenCount / OpenAI prompt_tokens_details.cached_tokens)
+
+DEFAULT_PROFILE = {
+    "latency": ("lognormal", 1.0, 0.4),
+    "chunks": 8,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "stall_rate": 0.0,
+    "stall_seconds": 10.0,
+    "truncate_rate": 0.0,
+    "output_chars": 1500,
+    "cache_min_tokens": 0,
+    "file_ttl": 172800.0,
+    "upload_error_rate": 0.0,
+    "pdf_input": True,
+    "models": {},
+}
+
+SCENARIOS = {
+    "baseline": {
+        "gemini": {},
+        "openai": {},
+    },
+    "slow_tail": {
+        "gemini": {"latency": ("lognormal", 1.5, 0.9)},
+        "openai": {"latency": ("lognormal", 2.0, 0.9)},
+    },
+    "rate_limited": {
+        "gemini": {"rate_limit_rate": 0.5},
+        "openai": {"rate_limit_rate": 0.2},
+    },
+    "flaky": {
+        "gemini": {"error_rate": 0.2},
+        "openai": {"error_rate": 0.1},
+    },
+    "stalls": {
+        "gemini": {"stall_rate": 0.1, "stall_seconds": 8.0},
+        "openai": {"stall_rate": 0.05, "stall_seconds": 8.0},
+    },
+    "gemini_pro_down": {
+        "gemini": {"models": {"gemini-2.5-pro": {"error_rate": 1.0}}},
+        "openai": {},
+    },
+    "truncated": {
+        "gemini": {"truncate_rate": 0.5},
+        "openai": {"truncate_rate": 0.5},
+    },
+    "gemini_down": {
+        "gemini": {"error_rate": 1.0},
+        "openai": {"latency": ("lognormal", 2.0, 0.5)},
+    },
+    "no_pdf_input": {
+        "gemini": {"pdf_input": False},
+        "openai": {},
+    },
+}
+
+GEMINI_PATH_RE = re.compile(r"^/v1beta/models/(?P<model>[^:]+):streamGenerateContent")
+OPENAI_PATH_RE = re.compile(r"^(/.*)?/chat/completions$")
+CACHE_PATH_RE = re.compile(r"^/v1beta/cachedContents$")
+UPLOAD_PATH_RE = re.compile(r"^/upload/v1beta/files$")
+
+MOCK_TEXT = "这是模拟服务返回的翻译内容。模型在本地被替换，用于测量流水线吞吐。"
+
+
+def build_profile(scenario, provider, model_name, time_scale=1.0):
+    """合并默认配置、场景配置和按模型覆盖的配置"""
+    profile = dict(DEFAULT_PROFILE)
+    provider_conf = dict(scenario.get(provider, {}))
+    model_overrides = provider_conf.pop("models", {})
+    profile.update(provider_conf)
+    profile.update(model_overrides.get(model_name, {}))
+    profile["time_scale"] = time_scale
+    return profile
+
+
+def sample_latency(latency, rng):
+    """根据分布描述采样一次延迟(秒)"""
+    kind = latency[0]
+    if kind == "fixed":
+        return latency[1]
+    if kind == "uniform":
+        return rng.uniform(latency[1], latency[2])
+    if kind == "lognormal":
+        return rng.lognormvariate(math.log(latency[1]), latency[2])
+    raise ValueError(f"未知的延迟分布: {kind}")
+
+
+class MockStats:
+    """线程安全的请求计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def incr(self, provider, model, outcome):
+        key = f"{provider}:{model}:{outcome}"
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PdfTransMock/1.0"
+
+    def log_message(self, format, *args):
+        pass  # 静默，避免干扰流水线输出
+
+    # ---------- 通用 ----------
+    def _read_raw(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if length and self.server.uplink_kbps:
+            time.sleep(length * 8 / 1000 / self.server.uplink_kbps)  # 模拟受限的上行带宽
+        return self.rfile.read(length) if length else b""
+
+    def _read_body(self):
+        raw = self._read_raw()
+        try:
+            return json.loads(raw.decode("utf-8")) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reject_key(self, provider, model, api_key):
+        """模拟 Key 校验: 以 invalid 开头的 Key 返回 401/400，以 exhausted 开头的返回额度耗尽的 429"""
+        if api_key.startswith("invalid"):
+            self.server.stats.incr(provider, model, "invalid_key")
+            if provider == "gemini":
+                self._send_json(400, {"error": {"code": 400, "message": "API key not valid. (mock)", "status": "INVALID_ARGUMENT",
+                                                "details": [{"reason": "API_KEY_INVALID"}]}})
+            else:
+                self._send_json(401, {"error": {"message": "Invalid API key (mock)", "type": "invalid_request_error"}})
+            return True
+        if api_key.startswith("exhausted"):
+            self.server.stats.incr(provider, model, "exhausted_key")
+            self._send_json(429, {"error": {"code": 429, "message": "Quota exceeded for GenerateRequestsPerDay (mock)",
+                                            "status": "RESOURCE_EXHAUSTED"}})
+            return True
+        return False
+
+    def _inject_failure(self, profile, provider, model):
+        """按概率注入 429 / 500，返回 True 表示已响应错误"""
+        rng = self.server.rng
+        with self.server.rng_lock:
+            roll_rate_limit = rng.random()
+            roll_error = rng.random()
+        if roll_rate_limit < profile["rate_limit_rate"]:
+            self.server.stats.incr(provider, model, "429")
+            self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (mock)", "status": "RESOURCE_EXHAUSTED"}})
+            return True
+        if roll_error < profile["error_rate"]:
+            self.server.stats.incr(provider, model, "500")
+            self._send_json(500, {"error": {"code": 500, "message": "Internal error (mock)", "status": "INTERNAL"}})
+            return True
+        return False
+
+    def _plan_response(self, profile, partial=None):
+        """
+        采样本次请求的总延迟、是否卡住、分块内容以及是否截断。
+        partial 为续写请求携带的已输出内容: 续写不会再被截断，并像真实模型一样重复截断处的几个字
+        """
+        with self.server.rng_lock:
+            latency = sample_latency(profile["latency"], self.server.rng)
+            stall = self.server.rng.random() < profile["stall_rate"]
+            truncated = partial is None and self.server.rng.random() < profile["truncate_rate"]
+        latency *= profile["time_scale"]
+        stall_seconds = profile["stall_seconds"] * profile["time_scale"] if stall else 0.0
+        text = (MOCK_TEXT * (profile["output_chars"] // len(MOCK_TEXT) + 1))[:profile["output_chars"]]
+        if partial is not None:
+            text = text[max(0, len(partial) - 6):] if text.startswith(partial) else text
+        chunk_count = max(1, profile["chunks"])
+        size = len(text) // chunk_count + 1
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        if truncated:
+            chunks = chunks[:max(1, len(chunks) // 2)]
+        return latency, stall_seconds, chunks, truncated
+
+    # ---------- 路由 ----------
+    def do_GET(self):
+        if self.path.startswith("/__stats"):
+            self._send_json(200, self.server.stats.snapshot())
+        else:
+            # 供 GOOGLE_TEST_URL 连通性检查使用
+            self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if CACHE_PATH_RE.match(path):
+            return self._handle_gemini_cache()
+        if UPLOAD_PATH_RE.match(path):
+            return self._handle_gemini_upload()
+        gemini_match = GEMINI_PATH_RE.match(path)
+        if gemini_match:
+            return self._handle_gemini(gemini_match.group("model"))
+        if OPENAI_PATH_RE.match(path):
+            return self._handle_openai()
+        self._send_json(404, {"error": {"code": 404, "message": f"unknown path {path}"}})
+
+    # ---------- 上下文缓存 ----------
+    @staticmethod
+    def _token_count(value):
+        return len(json.dumps(value, ensure_ascii=False)) // 4
+
+    def _prefix_cached_tokens(self, prefix):
+        """隐式前缀缓存: 相同的系统提示词第二次出现时视为命中缓存"""
+        if not prefix:
+            return 0
+        key = json.dumps(prefix, sort_keys=True, ensure_ascii=False)
+        with self.server.rng_lock:
+            seen = key in self.server.seen_prefixes
+            self.server.seen_prefixes.add(key)
+        return self._token_count(prefix) if seen else 0
+
+    def _handle_gemini_cache(self):
+        body = self._read_body()
+        model = body.get("model", "").split("/")[-1]
+        profile = build_profile(self.server.scenario, "gemini", model, self.server.time_scale)
+        api_key = parse_qs(urlparse(self.path).query).get("key", [""])[0]
+        if self._reject_key("gemini", model, api_key):
+            return
+        tokens = self._token_count({"systemInstruction": body.get("systemInstruction"), "contents": body.get("contents")})
+        if tokens < profile["cache_min_tokens"]:
+            self.server.stats.incr("gemini", model, "cache_too_small")
+            self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                            "message": f"Cached content is too small. total_token_count={tokens}, "
+                                                       f"min_total_token_count={profile['cache_min_tokens']} (mock)"}})
+            return
+        with self.server.rng_lock:
+            name = f"cachedContents/mock-{len(self.server.caches) + 1}"
+            self.server.caches[name] = {"model": model, "tokens": tokens}
+        self.server.stats.incr("gemini", model, "cache_created")
+        self._send_json(200, {"name": name, "model": f"models/{model}", "usageMetadata": {"totalTokenCount": tokens}})
+
+    # ---------- 文件上传 (Files API) ----------
+    def _handle_gemini_upload(self):
+        """multipart/related 上传: 第一部分为 JSON 元数据，第二部分为文件内容"""
+        raw = self._read_raw()
+        profile = build_profile(self.server.scenario, "gemini", "files", self.server.time_scale)
+        api_key = parse_qs(urlparse(self.path).query).get("key", [""])[0]
+        if self._reject_key("gemini", "files", api_key):
+            return
+        with self.server.rng_lock:
+            failed = self.server.rng.random() < profile["upload_error_rate"]
+        if failed:
+            self.server.stats.incr("gemini", "files", "500")
+            self._send_json(500, {"error": {"code": 500, "message": "Internal error (mock)", "status": "INTERNAL"}})
+            return
+        boundary = self.headers.get("Content-Type", "").partition("boundary=")[2].encode("utf-8")
+        # 首尾分别为前导内容与结束标记 "--"，每部分去掉分隔行后与下一分隔行前的 CRLF
+        parts = [part[2:-2] for part in raw.split(b"--" + boundary)[1:-1]] if boundary else []
+        if len(parts) != 2:
+            self._send_json(400, {"error": {"code": 400, "message": "Expected metadata and media parts (mock)",
+                                            "status": "INVALID_ARGUMENT"}})
+            return
+        headers, _, content = parts[1].partition(b"\r\n\r\n")
+        mime_type = headers.decode("utf-8").partition("Content-Type:")[2].strip() or "application/octet-stream"
+        now = time.time()
+        with self.server.rng_lock:
+            name = f"files/mock-{len(self.server.files) + 1}"
+            self.server.files[name] = {"mime_type": mime_type, "size": len(content), "expires": now + profile["file_ttl"]}
+        self.server.stats.incr("gemini", "files", "uploaded")
+        expiration = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now + profile["file_ttl"]))
+        self._send_json(200, {"file": {"name": name, "uri": f"{self.server.base_url}/v1beta/{name}", "mimeType": mime_type,
+                                       "sizeBytes": str(len(content)), "state": "ACTIVE", "expirationTime": expiration}})
+
+    def _referenced_file_tokens(self, contents):
+        """返回请求引用的已上传文件折算的输入 token 数；引用的文件不存在或已过期时返回 None"""
+        tokens = 0
+        for content in contents:
+            for part in content.get("parts", []):
+                file_data = part.get("file_data") or part.get("fileData")
+                if not file_data:
+                    continue
+                name = "files/" + file_data.get("file_uri", file_data.get("fileUri", "")).rsplit("/files/", 1)[-1]
+                info = self.server.files.get(name)
+                if info is None or info["expires"] < time.time():
+                    return None
+                tokens += info["size"] * 4 // 3 // 4  # 与 inline base64 的计数方式一致
+        return tokens
+
+    # ---------- Gemini SSE ----------
+    def _handle_gemini(self, model):
+        body = self._read_body()
+        profile = build_profile(self.server.scenario, "gemini", model, self.server.time_scale)
+        api_key = parse_qs(urlparse(self.path).query).get("key", [""])[0]
+        if self._reject_key("gemini", model, api_key) or self._inject_failure(profile, "gemini", model):
+            return
+        cache_name = body.get("cachedContent")
+        if cache_name:
+            cache = self.server.caches.get(cache_name)
+            if cache is None or cache["model"] != model:
+                self.server.stats.incr("gemini", model, "cache_not_found")
+                # 与真实服务一致: 缓存过期或被删除时返回 403 (而不是 404)
+                self._send_json(403, {"error": {"code": 403, "message": f"CachedContent not found (or permission denied): "
+                                                f"{cache_name} (mock)", "status": "PERMISSION_DENIED"}})
+                return
+            cached_tokens = cache["tokens"]
+        else:
+            cached_tokens = self._prefix_cached_tokens(body.get("systemInstruction"))
+
+        contents = body.get("contents", [])
+        mime_types = {(part.get("inline_data") or part.get("file_data") or {}).get("mime_type")
+                      for content in contents for part in content.get("parts", [])}
+        if "application/pdf" in mime_types and not profile["pdf_input"]:
+            self.server.stats.incr("gemini", model, "pdf_unsupported")
+            self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                            "message": "Unsupported MIME type: application/pdf (mock)"}})
+            return
+        file_tokens = self._referenced_file_tokens(contents)
+        if file_tokens is None:
+            self.server.stats.incr("gemini", model, "file_not_found")
+            self._send_json(403, {"error": {"code": 403, "status": "PERMISSION_DENIED",
+                                            "message": "You do not have permission to access the File or it may not exist. (mock)"}})
+            return
+        partial = contents[1]["parts"][0].get("text", "") if len(contents) > 1 else None
+        latency, stall_seconds, chunks, truncated = self._plan_response(profile, partial)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            if stall_seconds:
+                self.server.stats.incr("gemini", model, "stall")
+                time.sleep(stall_seconds)
+            interval = latency / len(chunks)
+            # 引用显式缓存时，缓存内容不在请求体中，但同样计入输入 token
+            prompt_tokens = len(json.dumps(body)) // 4 + (cached_tokens if cache_name else 0) + file_tokens
+            for i, chunk in enumerate(chunks):
+                time.sleep(interval)
+                event = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}, "index": 0}]}
+                if i == len(chunks) - 1:
+                    event["candidates"][0]["finishReason"] = "MAX_TOKENS" if truncated else "STOP"
+                    event["usageMetadata"] = {
+                        "promptTokenCount": prompt_tokens,
+                        "candidatesTokenCount": profile["output_chars"],
+                        "totalTokenCount": prompt_tokens + profile["output_chars"],
+                    }
+                    if cached_tokens:
+                        event["usageMetadata"]["cachedContentTokenCount"] = cached_tokens
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            self.server.stats.incr("gemini", model, "200")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.stats.incr("gemini", model, "client_disconnect")
+
+    # ---------- OpenAI chat-completions ----------
+    def _handle_openai(self):
+        body = self._read_body()
+        model = body.get("model", "unknown")
+        profile = build_profile(self.server.scenario, "openai", model, self.server.time_scale)
+        api_key = self.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        if self._reject_key("openai", model, api_key) or self._inject_failure(profile, "openai", model):
+            return
+
+        partial = next((m.get("content", "") for m in body.get("messages", []) if m.get("role") == "assistant"), None)
+        latency, stall_seconds, chunks, truncated = self._plan_response(profile, partial)
+        finish_reason = "length" if truncated else "stop"
+        prompt_tokens = len(json.dumps(body)) // 4
+        completion_tokens = profile["output_chars"]
+        cached_tokens = self._prefix_cached_tokens(
+            [m for m in body.get("messages", []) if m.get("role") == "system"])
+        created = int(time.time())
+
+        try:
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                if stall_seconds:
+                    self.server.stats.incr("openai", model, "stall")
+                    time.sleep(stall_seconds)
+                interval = latency / len(chunks)
+                for i, chunk in enumerate(chunks):
+                    time.sleep(interval)
+                    event = {
+                        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": chunk},
+                                     "finish_reason": finish_reason if i == len(chunks) - 1 else None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            else:
+                if stall_seconds:
+                    self.server.stats.incr("openai", model, "stall")
+                time.sleep(latency + stall_seconds)
+                self._send_json(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(chunks)}, "finish_reason": finish_reason}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens,
+                              "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+                })
+            self.server.stats.incr("openai", model, "200")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.stats.incr("openai", model, "client_disconnect")
+
+
+class MockProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, scenario, time_scale=1.0, seed=None, uplink_kbps=0):
+        super().__init__(address, MockProviderHandler)
+        self.scenario = scenario
+        self.time_scale = time_scale
+        self.uplink_kbps = uplink_kbps  # 请求体的接收速率 (kbit/s)，0 表示不限制
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = MockStats()
+        self.caches = {}           # cachedContents 名称 -> {"model", "tokens"}
+        self.seen_prefixes = set()  # 出现过的系统提示词 (隐式缓存)
+        self.files = {}            # 上传的文件名称 -> {"mime_type", "size", "expires"}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def endpoint_env(self):
+        """指向本服务的 config.py 端点配置"""
+        return {
+            "GEMINI_API_BASE": f"{self.base_url}/v1beta",
+            "GEMINI_UPLOAD_BASE": f"{self.base_url}/upload/v1beta",
+            "DASHSCOPE_API_URL": f"{self.base_url}/dashscope/v1",
+            "QWEN_API_URL": f"{self.base_url}/siliconflow/v1",
+            "GOOGLE_TEST_URL": f"{self.base_url}/",
+        }
+
+
+def start_mock_server(scenario_name="baseline", host="127.0.0.1", port=0, time_scale=1.0, seed=None, uplink_kbps=0):
+    """在后台线程启动模拟服务，port=0 表示自动分配端口"""
+    if scenario_name not in SCENARIOS:
+        raise ValueError(f"未知场景: {scenario_name}，可选: {list(SCENARIOS)}")
+    server = MockProviderServer((host, port), SCENARIOS[scenario_name], time_scale=time_scale, seed=seed,
+                                uplink_kbps=uplink_kbps)
+    thread = threading.Thread(target=server.serve_forever, name=f"mock-server-{scenario_name}", daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟 Gemini / OpenAI 兼容接口的本地服务")
+    parser.add_argument("--scenario", default="baseline", choices=sorted(SCENARIOS), help="模拟场景")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有延迟乘以该系数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现")
+    parser.add_argument("--uplink-kbps", type=float, default=0, help="模拟上行带宽 (kbit/s)，0 表示不限制")
+    args = parser.parse_args()
+
+    mock = start_mock_server(args.scenario, args.host, args.port, args.time_scale, args.seed, args.uplink_kbps)
+    print(f"模拟服务已启动: {mock.base_url} (场景: {args.scenario})")
+    print("将 config.py 的端点指向本服务:")
+    for key, value in mock.endpoint_env().items():
+        print(f"  export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.shutdown()
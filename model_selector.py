@@ -0,0 +1,170 @@
+# model_selector.py
+import io
+import math
+import threading
+import config
+from utils import Logger
+from page_store import read_page, page_mime_type, PDF_MIME_TYPE
+from key_pool import model_provider
+
+
+class BudgetExceededError(Exception):
+    """论文或本次运行的 token / 费用预算已用尽"""
+    pass
+
+
+def estimate_image_tokens(width, height, tokenizer):
+    """根据分辨率估算图片 token 数"""
+    if tokenizer == "gemini":
+        # Gemini: 两边都不超过 384px 记 258 token，否则按 768x768 切片，每片 258 token
+        if width <= 384 and height <= 384:
+            return 258
+        return math.ceil(width / 768) * math.ceil(height / 768) * 258
+    # Qwen-VL: 每 28x28 像素一个 token，超过 max_pixels 时先等比缩小
+    pixels = width * height
+    max_pixels = config.QWEN_MAX_IMAGE_TOKENS * 28 * 28
+    if pixels > max_pixels:
+        pixels = max_pixels
+    return max(4, pixels // (28 * 28))
+
+
+def estimate_text_tokens(text):
+    """粗略估算文本 token 数 (中英文混合)"""
+    return int(len(text) / config.CHARS_PER_TOKEN) + 1
+
+
+def classify_page(page_info):
+    """根据文字密度把页面分为 sparse / normal / dense"""
+    if not page_info:
+        return "normal"
+    chars = page_info.get("text_chars", 0)
+    if chars < config.SPARSE_PAGE_CHARS and page_info.get("image_count", 0) == 0:
+        return "sparse"
+    if chars > config.DENSE_PAGE_CHARS:
+        return "dense"
+    return "normal"
+
+
+class ModelSelector:
+    """按页估算 token，在配置的模型链中挑选最便宜且满足质量要求的模型，并执行论文/运行级预算"""
+
+    def __init__(self, stats_manager, available_models):
+        self.stats_manager = stats_manager
+        # 保持 config 中的降级顺序，只保留已配置 Key 的模型
+        self.chain = [m for m in config.MODEL_CHAIN if m in available_models]
+        self.run_spend = {"tokens": 0, "cost": 0.0}
+        self._lock = threading.Lock()
+        # 论文级预算按论文名称记账 (由 _lock 保护)，同一篇论文的多个章节线程共用一份预算；
+        # 每个线程只记录自己正在翻译哪篇论文
+        self._paper_spend = {}
+        self._local = threading.local()
+
+    @property
+    def paper_spend(self):
+        """当前线程所翻译论文的已用预算"""
+        paper_name = getattr(self._local, "current_paper", None)
+        with self._lock:
+            return self._paper_spend.setdefault(paper_name, {"tokens": 0, "cost": 0.0})
+
+    def begin_paper(self, paper_name):
+        """开始一篇新论文: 重置该论文的预算，并让当前线程记账到该论文 (每篇论文只调用一次)"""
+        with self._lock:
+            self._paper_spend[paper_name] = {"tokens": 0, "cost": 0.0}
+        self._local.current_paper = paper_name
+
+    def use_paper(self, paper_name):
+        """让当前线程记账到已开始的论文 (章节线程、修复线程使用，不重置预算)"""
+        self._local.current_paper = paper_name
+
+    def estimate(self, model_name, image_path, prompt, page_info=None):
+        """估算一次调用的 (输入 token, 输出 token, 费用)"""
+        pricing = config.MODEL_PRICING[model_name]
+        text_chars = (page_info or {}).get("text_chars", config.DENSE_PAGE_CHARS // 2)
+        if page_mime_type(image_path) == PDF_MIME_TYPE:
+            if model_provider(model_name) in config.PDF_NATIVE_PROVIDERS:
+                # 原生 PDF: 每页固定的图像 token 加上文字层
+                image_tokens = config.PDF_PAGE_TOKENS + int(text_chars / config.CHARS_PER_TOKEN)
+            else:
+                # 不支持 PDF 的模型实际发送渲染后的图片，按页面尺寸与 DPI 计算像素，不在预估时渲染
+                from pdf_processor import page_render_size  # 延迟导入 (fitz)
+                width, height = page_render_size(image_path)
+                image_tokens = estimate_image_tokens(width, height, pricing["image_tokenizer"])
+        else:
+            from PIL import Image  # 延迟导入，缩短启动时间
+            with Image.open(io.BytesIO(read_page(image_path))) as img:
+                width, height = img.size
+            image_tokens = estimate_image_tokens(width, height, pricing["image_tokenizer"])
+        input_tokens = image_tokens + estimate_text_tokens(config.SYSTEM_PROMPT + prompt)
+        output_tokens = min(config.MAX_OUTPUT_TOKENS, int(text_chars / config.CHARS_PER_TOKEN) + 200)
+        return input_tokens, output_tokens, self.cost_of(model_name, input_tokens, output_tokens)
+
+    @staticmethod
+    def cost_of(model_name, input_tokens, output_tokens, cached_tokens=0):
+        """cached_tokens 为输入中命中上下文缓存的部分，按 cached_input 价格计费"""
+        pricing = config.MODEL_PRICING.get(model_name)
+        if not pricing:
+            return 0.0
+        cached_tokens = min(cached_tokens, input_tokens)
+        return ((input_tokens - cached_tokens) * pricing["input"]
+                + cached_tokens * pricing.get("cached_input", pricing["input"])
+                + output_tokens * pricing["output"]) / 1_000_000
+
+    def _budget_ratio(self, extra_tokens, extra_cost):
+        """返回加上本次估算后，各项预算中最高的使用比例"""
+        ratios = [0.0]
+        paper_spend = self.paper_spend
+        with self._lock:
+            for spend, token_budget, cost_budget in (
+                (paper_spend, config.PAPER_TOKEN_BUDGET, config.PAPER_COST_BUDGET),
+                (self.run_spend, config.RUN_TOKEN_BUDGET, config.RUN_COST_BUDGET),
+            ):
+                if token_budget:
+                    ratios.append((spend["tokens"] + extra_tokens) / token_budget)
+                if cost_budget:
+                    ratios.append((spend["cost"] + extra_cost) / cost_budget)
+        return max(ratios)
+
+    def select(self, image_path, prompt, page_info=None, allowed_models=None):
+        """
+        为当前页选择起始模型。
+        返回: 模型名称 (在模型链中的位置决定了后续的降级路径)
+        """
+        candidates = [m for m in self.chain if allowed_models is None or m in allowed_models]
+        if not candidates:
+            raise BudgetExceededError("没有可用的模型")
+
+        page_class = classify_page(page_info)
+        required_quality = config.PAGE_QUALITY_REQUIREMENTS[page_class]
+        estimates = {m: self.estimate(m, image_path, prompt, page_info) for m in candidates}
+
+        adequate = [m for m in candidates if config.MODEL_PRICING[m]["quality"] >= required_quality] or candidates[:1]
+        cheapest_adequate = min(adequate, key=lambda m: (estimates[m][2], candidates.index(m)))
+        cheapest_overall = min(candidates, key=lambda m: (estimates[m][2], candidates.index(m)))
+
+        input_tokens, output_tokens, cost = estimates[cheapest_adequate]
+        ratio = self._budget_ratio(input_tokens + output_tokens, cost)
+        chosen = cheapest_adequate
+        if ratio >= config.BUDGET_DOWNGRADE_RATIO and cheapest_overall != cheapest_adequate:
+            chosen = cheapest_overall
+            Logger.warning(f"预算已使用 {ratio:.0%}，降级使用 {chosen}。", indent=3)
+
+        input_tokens, output_tokens, cost = estimates[chosen]
+        if self._budget_ratio(input_tokens + output_tokens, cost) > 1.0:
+            raise BudgetExceededError(
+                f"预算不足: 论文已用 {self.paper_spend['tokens']} token / ${self.paper_spend['cost']:.4f}，"
+                f"本次运行已用 {self.run_spend['tokens']} token / ${self.run_spend['cost']:.4f}")
+
+        self.stats_manager.record_usage_estimate(chosen, input_tokens, output_tokens, cost)
+        Logger.api_log(f"页面类型 {page_class}，预估 {input_tokens}+{output_tokens} token (${cost:.4f})，选择 {chosen}。", indent=3)
+        return chosen
+
+    def record_actual(self, model_name, input_tokens, output_tokens, cached_tokens=0):
+        """按服务端返回的实际用量记账"""
+        tokens = input_tokens + output_tokens
+        cost = self.cost_of(model_name, input_tokens, output_tokens, cached_tokens)
+        paper_spend = self.paper_spend
+        with self._lock:
+            for spend in (paper_spend, self.run_spend):
+                spend["tokens"] += tokens
+                spend["cost"] += cost
+        return cost
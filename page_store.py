@@ -0,0 +1,206 @@
+# page_store.py
+"""
+单文件页面图片存储: 每篇论文的所有页面图片顺序写入一个容器文件 (output/<论文>/pages.pts)，
+文件末尾保存偏移索引；读取时通过 mmap 随机访问，直接返回内存视图而不复制数据。
+页面以 "<容器路径>#<页码>" 形式的引用在任务队列与各模块之间传递，普通图片路径仍然可用。
+原生 PDF 模式下，同样格式的容器 pages_pdf.pts 保存每页切出的单页 PDF (application/pdf)。
+
+文件格式:
+    MAGIC | 图片数据 ... | 索引 (JSON) | 索引偏移 (uint64, 小端) | MAGIC
+
+用法 (导出为散装 PNG，兼容旧工具):
+    python page_store.py output/<论文>/pages.pts [输出目录]
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import threading
+import mimetypes
+
+MAGIC = b"PTPAGES1"
+FOOTER = struct.Struct("<Q8s")
+STORE_FILENAME = "pages.pts"
+PDF_STORE_FILENAME = "pages_pdf.pts"  # 原生 PDF 模式: 每页一个单页 PDF
+PDF_MIME_TYPE = "application/pdf"
+REF_SEPARATOR = "#"
+
+
+class PageStoreError(Exception):
+    """容器文件损坏或页面不存在"""
+    pass
+
+
+class PageStoreWriter:
+    """
+    顺序写入页面图片，关闭时写入索引。先写临时文件再替换，中断时不会留下半截容器。
+    with PageStoreWriter(path) as writer:
+        writer.add(1, png_bytes)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.index = {}
+        self._file = open(self.tmp_path, "wb")
+        self._file.write(MAGIC)
+
+    def add(self, page_num, data, mime_type="image/png", dpi=None):
+        offset = self._file.tell()
+        self._file.write(data)
+        self.index[str(page_num)] = [offset, len(data), mime_type, dpi]
+
+    def close(self):
+        index_offset = self._file.tell()
+        self._file.write(json.dumps({"pages": self.index}).encode("utf-8"))
+        self._file.write(FOOTER.pack(index_offset, MAGIC))
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        _forget(self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class PageStore:
+    """只读容器，get() 返回指向 mmap 的 memoryview (不复制)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PageStoreError(f"容器文件为空: {path}")
+        self._view = memoryview(self._mmap)
+        if len(self._mmap) < len(MAGIC) + FOOTER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            raise PageStoreError(f"不是页面容器文件: {path}")
+        index_offset, magic = FOOTER.unpack_from(self._mmap, len(self._mmap) - FOOTER.size)
+        if magic != MAGIC:
+            raise PageStoreError(f"容器文件不完整: {path}")
+        index = json.loads(bytes(self._view[index_offset:len(self._mmap) - FOOTER.size]).decode("utf-8"))
+        self.index = {int(page_num): tuple(entry) for page_num, entry in index["pages"].items()}
+
+    def page_numbers(self):
+        return sorted(self.index)
+
+    def get(self, page_num):
+        try:
+            offset, length = self.index[page_num][:2]
+        except KeyError:
+            raise PageStoreError(f"容器中没有第 {page_num} 页: {self.path}")
+        return self._view[offset:offset + length]
+
+    def mime_type(self, page_num):
+        return self.index[page_num][2] if page_num in self.index else "application/octet-stream"
+
+    def dpi(self, page_num):
+        """渲染该页时使用的 DPI (旧容器没有记录时返回 None)"""
+        entry = self.index.get(page_num, ())
+        return entry[3] if len(entry) > 3 else None
+
+    def refs(self):
+        return [make_ref(self.path, page_num) for page_num in self.page_numbers()]
+
+
+# 已打开的容器 (路径 -> (文件修改时间, PageStore))，文件被重写后自动重新打开
+_open_stores = {}
+_open_lock = threading.Lock()
+
+
+def _forget(path):
+    with _open_lock:
+        _open_stores.pop(os.path.abspath(path), None)
+
+
+def open_store(path):
+    key = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    with _open_lock:
+        cached = _open_stores.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        store = PageStore(path)
+        _open_stores[key] = (mtime, store)
+        return store
+
+
+def make_ref(store_path, page_num):
+    return f"{store_path}{REF_SEPARATOR}{page_num}"
+
+
+def split_ref(ref):
+    """"<容器>#<页码>" -> (容器路径, 页码)；普通文件路径返回 None"""
+    path, sep, page = str(ref).rpartition(REF_SEPARATOR)
+    if sep and page.isdigit() and path.endswith(".pts"):
+        return path, int(page)
+    return None
+
+
+def read_page(ref):
+    """读取页面图片: 容器引用返回 memoryview，普通路径返回 bytes"""
+    parts = split_ref(ref)
+    if parts is None:
+        with open(ref, "rb") as f:
+            return f.read()
+    return open_store(parts[0]).get(parts[1])
+
+
+def page_mime_type(ref):
+    parts = split_ref(ref)
+    if parts is None:
+        mime_type, _ = mimetypes.guess_type(ref)
+        return mime_type or "application/octet-stream"
+    return open_store(parts[0]).mime_type(parts[1])
+
+
+def page_filename(ref):
+    """页面对应的散装文件名，例如 page_3.png"""
+    parts = split_ref(ref)
+    if parts is None:
+        return os.path.basename(ref)
+    extension = mimetypes.guess_extension(page_mime_type(ref)) or ".bin"
+    return f"page_{parts[1]}{extension}"
+
+
+def load_refs(store_path):
+    """读取已存在的完整容器，返回页面引用列表；文件不存在或损坏时返回 None"""
+    if not os.path.exists(store_path):
+        return None
+    try:
+        return open_store(store_path).refs()
+    except (PageStoreError, ValueError, OSError):
+        return None
+
+
+def export_images(store_path, output_dir=None):
+    """将容器导出为散装图片 (page_N.png)，返回文件路径列表"""
+    output_dir = output_dir or os.path.dirname(store_path)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for ref in open_store(store_path).refs():
+        path = os.path.join(output_dir, page_filename(ref))
+        with open(path, "wb") as f:
+            f.write(read_page(ref))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python page_store.py <pages.pts> [输出目录]")
+        sys.exit(1)
+    exported = export_images(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"已导出 {len(exported)} 张图片至 '{os.path.dirname(exported[0]) if exported else ''}'")
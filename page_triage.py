@@ -0,0 +1,107 @@
+# page_triage.py
+"""
+低分辨率缩略图预检: 在 300 DPI 渲染之前先以 TRIAGE_DPI 渲染灰度缩略图，
+直接在 pix.samples 缓冲区上 (不复制) 用 NumPy 计算墨迹覆盖率、灰度熵与感知哈希，
+识别空白页与 (近似) 重复页。被跳过的页面不做全分辨率渲染，也不调用模型。
+"""
+import config
+from utils import Logger
+from job_store import PENDING
+
+BLANK, DUPLICATE = "blank", "duplicate"
+
+# 感知哈希的网格大小 (差值哈希，HASH_SIZE x HASH_SIZE 位)
+HASH_SIZE = 16
+
+
+def _gray_array(pix):
+    """将灰度 Pixmap 的像素缓冲区包装为 (高, 宽) 的 uint8 数组 (零拷贝)"""
+    import numpy as np
+    data = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    return np.lib.stride_tricks.as_strided(data, shape=(pix.height, pix.width), strides=(pix.stride, 1))
+
+
+def _block_means(gray, rows, cols):
+    """按网格求各块的平均灰度 (reduceat 一次完成，无 Python 循环)"""
+    import numpy as np
+    height, width = gray.shape
+    row_edges = np.linspace(0, height, rows + 1).astype(int)[:-1]
+    col_edges = np.linspace(0, width, cols + 1).astype(int)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray.astype(np.float32), row_edges, axis=0), col_edges, axis=1)
+    counts = np.outer(np.diff(np.append(row_edges, height)), np.diff(np.append(col_edges, width)))
+    return sums / counts
+
+
+def image_stats(gray):
+    """
+    计算缩略图统计量
+    返回: {"ink": 墨迹覆盖率 (0-1), "entropy": 灰度熵 (bit), "phash": 差值哈希 (int)}
+    """
+    import numpy as np
+    ink = float(np.count_nonzero(gray < config.TRIAGE_INK_LEVEL)) / gray.size
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64) / gray.size
+    nonzero = histogram[histogram > 0]
+    entropy = max(0.0, float(-(nonzero * np.log2(nonzero)).sum()))
+    blocks = _block_means(gray, HASH_SIZE, HASH_SIZE + 1)
+    bits = (blocks[:, 1:] > blocks[:, :-1]).ravel()
+    phash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return {"ink": ink, "entropy": entropy, "phash": phash}
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def triage_pages(pdf_path, pages=None):
+    """
+    预检 PDF 的页面 (pages 为 0 起始的页码索引列表，默认全部)。
+    返回: 与页面一一对应的列表 [{"ink", "entropy", "phash", "skip": None|"blank"|"duplicate", "duplicate_of": 位置索引}]
+    """
+    import fitz  # PyMuPDF (延迟导入，缩短启动时间)
+    results = []
+    kept = []  # (位置索引, 统计量)，只与未跳过的页面比较
+    with fitz.open(pdf_path) as doc:
+        page_nums = pages if pages is not None else range(doc.page_count)
+        zoom = config.TRIAGE_DPI / 72
+        for position, page_num in enumerate(page_nums):
+            pix = doc.load_page(page_num).get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+            stats = image_stats(_gray_array(pix))
+            stats.update(skip=None, duplicate_of=None)
+            if stats["ink"] < config.TRIAGE_BLANK_INK and stats["entropy"] < config.TRIAGE_BLANK_ENTROPY:
+                stats["skip"] = BLANK
+            elif config.TRIAGE_SKIP_DUPLICATES:
+                for other_position, other in kept:
+                    if (hamming(stats["phash"], other["phash"]) <= config.TRIAGE_DUPLICATE_DISTANCE
+                            and abs(stats["ink"] - other["ink"]) <= config.TRIAGE_DUPLICATE_INK_DELTA):
+                        stats.update(skip=DUPLICATE, duplicate_of=other_position)
+                        break
+            if stats["skip"] is None:
+                kept.append((position, stats))
+            results.append(stats)
+    return results
+
+
+def skipped_page_text(result, page_numbers):
+    """被跳过页面写入译文的占位内容"""
+    if result["skip"] == BLANK:
+        return "\n\n> [空白页，已跳过]\n\n"
+    return f"\n\n> [与第 {page_numbers[result['duplicate_of']]} 页内容相同，已跳过]\n\n"
+
+
+def apply_triage(job_store, paper_id, triage, page_numbers=None, stats_manager=None):
+    """将预检判定跳过且尚未翻译的页面直接标记为完成，返回本次跳过的页数"""
+    page_numbers = page_numbers or list(range(1, len(triage) + 1))
+    pages = job_store.get_pages(paper_id)
+    skipped = {BLANK: 0, DUPLICATE: 0}
+    for page_idx, result in enumerate(triage):
+        if result["skip"] is None or page_idx >= len(pages) or pages[page_idx]["status"] != PENDING:
+            continue
+        job_store.complete_page(paper_id, page_idx, None, skipped_page_text(result, page_numbers),
+                                provider=f"skipped:{result['skip']}")
+        if stats_manager:
+            stats_manager.record_page_skip(result["skip"])
+        skipped[result["skip"]] += 1
+    total = sum(skipped.values())
+    if total:
+        Logger.info(f"缩略图预检: 跳过 {total} 页 (空白 {skipped[BLANK]} 页，重复 {skipped[DUPLICATE]} 页)。", indent=2)
+    return total
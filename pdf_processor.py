@@ -1,22 +1,89 @@
 # pdf_processor.py
 import os
-import fitz  # PyMuPDF
+import functools
+import config
 from utils import Logger
+from tracer import tracer
+from page_store import STORE_FILENAME, PDF_STORE_FILENAME, PDF_MIME_TYPE, PageStoreWriter, load_refs, make_ref, read_page
 
 
-def convert_pdf_to_images(pdf_path, output_root_dir, dpi=300):
+def render_page_pixmap(page, dpi):
+    """按指定 DPI 将单页渲染为 Pixmap"""
+    import fitz  # PyMuPDF (延迟导入，缩短启动时间)
+    zoom = dpi / 72
+    mat = fitz.Matrix(zoom, zoom)
+    return page.get_pixmap(matrix=mat)
+
+
+def encode_pixmap(pix, img_format='png', jpg_quality=90):
+    """将 Pixmap 编码为图片字节 (png / jpeg)"""
+    if img_format in ('jpg', 'jpeg'):
+        return pix.tobytes('jpeg', jpg_quality=jpg_quality)
+    return pix.tobytes(img_format)
+
+
+def choose_page_dpi(page, default_dpi=300):
+    """
+    根据页面最小字号与图片覆盖率选择渲染 DPI (ADAPTIVE_DPI_MIN ~ ADAPTIVE_DPI_MAX):
+    最小字号 (按字符数取 ADAPTIVE_DPI_FONT_PERCENTILE 分位，忽略个别零散小字) 每 em 至少 ADAPTIVE_DPI_PX_PER_EM 像素，
+    图片覆盖率较高的页面至少 ADAPTIVE_DPI_IMAGE_DPI。没有文字层的页面 (扫描件) 使用 default_dpi。
+    """
+    sizes = []  # (字号, 字符数)
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                chars = len(span["text"].strip())
+                if chars:
+                    sizes.append((span["size"], chars))
+    if not sizes:
+        return default_dpi
+
+    sizes.sort()
+    threshold = sum(chars for _, chars in sizes) * config.ADAPTIVE_DPI_FONT_PERCENTILE / 100
+    seen = 0
+    for size, chars in sizes:
+        seen += chars
+        if seen >= threshold:
+            break
+    page_dpi = config.ADAPTIVE_DPI_PX_PER_EM * 72 / max(size, 1.0)
+
+    page_area = abs(page.rect)
+    image_area = sum(abs(page.rect & info["bbox"]) for info in page.get_image_info())
+    if page_area and image_area / page_area >= config.ADAPTIVE_DPI_IMAGE_COVERAGE:
+        page_dpi = max(page_dpi, config.ADAPTIVE_DPI_IMAGE_DPI)
+
+    page_dpi = int(round(page_dpi / 12) * 12)
+    return min(config.ADAPTIVE_DPI_MAX, max(config.ADAPTIVE_DPI_MIN, page_dpi))
+
+
+def convert_pdf_to_images(pdf_path, output_root_dir, dpi=300, pages=None, name=None, skip_pages=None,
+                          stats_manager=None):
     """
     将PDF转换为图片，保存到 output_root_dir/PDF文件名/ 目录下
-    返回: 图片路径列表 (按页码排序)
+    pages 为 0 起始的页码索引列表时只转换这些页；name 可替代 PDF 文件名作为目录名
+    启用 PAGE_STORE_ENABLED 时所有页面写入单个容器文件 pages.pts (见 page_store.py)
+    skip_pages 中的页 (预检判定为空白/重复，不会被翻译) 只以 TRIAGE_DPI 渲染缩略图占位
+    启用 ADAPTIVE_DPI_ENABLED 时每页按 choose_page_dpi 选择 DPI (dpi 作为无文字层页面的默认值)，
+    所用 DPI 记录在容器索引与 PNG 元数据中，并通过 stats_manager 计入统计
+    启用 PDF_NATIVE_ENABLED 时不渲染图片，改为切出单页 PDF (见 slice_pdf_pages)
+    返回: 图片路径 (或容器页面引用) 列表 (按页码排序)
     """
+    if config.PDF_NATIVE_ENABLED:
+        return slice_pdf_pages(pdf_path, output_root_dir, pages=pages, name=name)
     try:
         pdf_filename = os.path.basename(pdf_path)
-        pdf_name_no_ext = os.path.splitext(pdf_filename)[0]
+        pdf_name_no_ext = name or os.path.splitext(pdf_filename)[0]
         save_dir = os.path.join(output_root_dir, pdf_name_no_ext)
 
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
 
+        store_path = os.path.join(save_dir, STORE_FILENAME)
+        refs = load_refs(store_path)
+        if refs:
+            Logger.info(f"检测到 '{store_path}' 已包含 {len(refs)} 页图片，跳过转换。", indent=2)
+            return refs
+
         # 检查是否已经存在图片，如果存在且数量合理，可能跳过（这里为了保险起见，简单检查是否有文件）
         existing_files = [f for f in os.listdir(save_dir) if f.endswith('.png')]
         if existing_files:
@@ -30,24 +97,138 @@ def convert_pdf_to_images(pdf_path, output_root_dir, dpi=300):
                 pass  # 文件名格式不对，重新转换
 
         Logger.info("开始切分...", indent=2)
+        import fitz
         doc = fitz.open(pdf_path)
         image_paths = []
+        writer = PageStoreWriter(store_path) if config.PAGE_STORE_ENABLED else None
+        rendered_pixels, baseline_pixels = 0, 0
 
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            zoom = dpi / 72
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
+        try:
+            for page_num in (pages if pages is not None else range(len(doc))):
+                page = doc.load_page(page_num)
+                if skip_pages and page_num in skip_pages:
+                    page_dpi = config.TRIAGE_DPI
+                elif config.ADAPTIVE_DPI_ENABLED:
+                    page_dpi = choose_page_dpi(page, dpi)
+                else:
+                    page_dpi = dpi
+                with tracer.span("render", page=page_num + 1, dpi=page_dpi):
+                    pix = render_page_pixmap(page, page_dpi)
+                    pix.set_dpi(page_dpi, page_dpi)
+                rendered_pixels += pix.width * pix.height
+                baseline_pixels += abs(page.rect) * (dpi / 72) ** 2
+                if stats_manager:
+                    stats_manager.record_render(page_dpi, pix.width * pix.height)
 
-            img_filename = f"page_{page_num + 1}.png"
-            img_path = os.path.join(save_dir, img_filename)
-            pix.save(img_path)
-            image_paths.append(img_path)
-
-        doc.close()
-        Logger.success(f"切分完成, 共 {len(image_paths)} 页图片已保存至 '{save_dir}'", indent=2)
+                with tracer.span("encode_png", page=page_num + 1):
+                    img_bytes = encode_pixmap(pix, 'png')
+                if writer is not None:
+                    writer.add(page_num + 1, img_bytes, "image/png", dpi=page_dpi)
+                    image_paths.append(make_ref(store_path, page_num + 1))
+                    continue
+                img_filename = f"page_{page_num + 1}.png"
+                img_path = os.path.join(save_dir, img_filename)
+                with open(img_path, 'wb') as f:
+                    f.write(img_bytes)
+                image_paths.append(img_path)
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            raise
+        finally:
+            doc.close()
+        if config.ADAPTIVE_DPI_ENABLED and baseline_pixels:
+            Logger.info(f"自适应 DPI: 像素总量为固定 {dpi} DPI 的 {rendered_pixels / baseline_pixels:.0%}。", indent=2)
+        if writer is not None:
+            writer.close()
+            Logger.success(f"切分完成, 共 {len(image_paths)} 页图片已保存至 '{store_path}'", indent=2)
+        else:
+            Logger.success(f"切分完成, 共 {len(image_paths)} 页图片已保存至 '{save_dir}'", indent=2)
         return image_paths
 
     except Exception as e:
         Logger.error(f"PDF 切分失败: {e}", indent=2)
-        raise e
\ No newline at end of file
+        raise e
+
+
+def slice_pdf_pages(pdf_path, output_root_dir, pages=None, name=None):
+    """
+    原生 PDF 模式: 把每页切为独立的单页 PDF (保留矢量文字与公式，通常比 300 DPI 的 PNG 小得多)，
+    写入 output_root_dir/<论文>/pages_pdf.pts (未启用 PAGE_STORE_ENABLED 时保存为 page_N.pdf)，不渲染图片。
+    返回: 页面引用 (或文件路径) 列表 (按页码排序)
+    """
+    from pdf_slicer import page_count, slice_pdf_bytes
+    pdf_name_no_ext = name or os.path.splitext(os.path.basename(pdf_path))[0]
+    save_dir = os.path.join(output_root_dir, pdf_name_no_ext)
+    os.makedirs(save_dir, exist_ok=True)
+
+    store_path = os.path.join(save_dir, PDF_STORE_FILENAME)
+    refs = load_refs(store_path)
+    if refs:
+        Logger.info(f"检测到 '{store_path}' 已包含 {len(refs)} 页，跳过切分。", indent=2)
+        return refs
+    existing_files = [f for f in os.listdir(save_dir) if f.startswith("page_") and f.endswith(".pdf")]
+    if existing_files and not config.PAGE_STORE_ENABLED:
+        existing_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+        Logger.info(f"检测到 '{save_dir}' 下已有 {len(existing_files)} 个单页 PDF，跳过切分。", indent=2)
+        return [os.path.join(save_dir, f) for f in existing_files]
+
+    Logger.info("开始切分 (原生 PDF 模式，不渲染图片)...", indent=2)
+    page_nums = list(pages) if pages is not None else list(range(page_count(pdf_path)))
+    with tracer.span("slice_pdf", pages=len(page_nums)):
+        page_bytes = slice_pdf_bytes(pdf_path, [(page_num + 1, page_num + 1) for page_num in page_nums])
+
+    if config.PAGE_STORE_ENABLED:
+        with PageStoreWriter(store_path) as writer:
+            for page_num, data in zip(page_nums, page_bytes):
+                writer.add(page_num + 1, data, PDF_MIME_TYPE)
+        refs = [make_ref(store_path, page_num + 1) for page_num in page_nums]
+    else:
+        refs = []
+        for page_num, data in zip(page_nums, page_bytes):
+            path = os.path.join(save_dir, f"page_{page_num + 1}.pdf")
+            with open(path, 'wb') as f:
+                f.write(data)
+            refs.append(path)
+    Logger.success(f"切分完成, 共 {len(refs)} 页 ({sum(len(data) for data in page_bytes) / 1024:.0f} KB) "
+                   f"已保存至 '{store_path if config.PAGE_STORE_ENABLED else save_dir}'", indent=2)
+    return refs
+
+
+def page_render_size(ref, dpi=300):
+    """rasterize_page 渲染该单页 PDF 时的像素尺寸 (由页面尺寸与所选 DPI 计算，不渲染)，用于预估图片 token"""
+    import fitz
+    with fitz.open(stream=bytes(read_page(ref)), filetype="pdf") as doc:
+        page = doc.load_page(0)
+        page_dpi = choose_page_dpi(page, dpi) if config.ADAPTIVE_DPI_ENABLED else dpi
+        return round(page.rect.width * page_dpi / 72), round(page.rect.height * page_dpi / 72)
+
+
+@functools.lru_cache(maxsize=16)
+def rasterize_page(ref, dpi=300):
+    """
+    将原生 PDF 模式的单页 PDF 渲染为 PNG 字节，供不支持 PDF 输入的模型使用 (DPI 选择与图片模式一致)。
+    同一页的重试与降级复用最近的渲染结果
+    """
+    import fitz
+    with fitz.open(stream=bytes(read_page(ref)), filetype="pdf") as doc:
+        page = doc.load_page(0)
+        page_dpi = choose_page_dpi(page, dpi) if config.ADAPTIVE_DPI_ENABLED else dpi
+        with tracer.span("render", dpi=page_dpi, fallback=True):
+            return encode_pixmap(render_page_pixmap(page, page_dpi), 'png')
+
+
+def get_page_text_stats(pdf_path, pages=None):
+    """
+    读取每页文字层的字符数和图片数量，用于估算 token 与判断页面复杂度
+    返回: [{"text_chars": int, "image_count": int}, ...] (按页码排序，pages 指定时只包含这些页)
+    """
+    import fitz
+    stats = []
+    with fitz.open(pdf_path) as doc:
+        for page in (doc[i] for i in pages) if pages is not None else doc:
+            stats.append({
+                "text_chars": len(page.get_text("text").strip()),
+                "image_count": len(page.get_images(full=False)),
+            })
+    return stats
@@ -1,5 +1,16 @@
+# pdf_slicer.py
+"""
+PDF 页面切割: 一次打开文档即可切出多个页码范围，批量处理时多个 PDF 并行切割。
+优先使用 PyMuPDF 的 insert_pdf (直接复制页面对象，无需重新解析)，不可用时回退到 PyPDF2。
+
+用法:
+    python pdf_slicer.py paper.pdf --ranges 1-5,8,10-
+    python pdf_slicer.py Data/ --ranges 1-3,4- --output output/sliced --workers 4
+不带参数运行时使用下方配置区域的设置。
+"""
 import os
-from PyPDF2 import PdfReader, PdfWriter
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # ==================================================
 # ||                配置区域                     ||
@@ -8,7 +19,7 @@ from PyPDF2 import PdfReader, PdfWriter
 
 # 1. 输入PDF文件的路径
 # 请将 'sample.pdf' 替换为您的PDF文件路径
-INPUT_PDF_PATH = 'D:\paper\Class Integration Test order\强化学习Q-learing  Integration test order generation based on reinforcement learning considering class importance\Integration test order generationbasedonreinforcementlearning.pdf'
+INPUT_PDF_PATH = r'D:\paper\Class Integration Test order\强化学习Q-learing  Integration test order generation based on reinforcement learning considering class importance\Integration test order generationbasedonreinforcementlearning.pdf'
 
 # 2. 输出PDF文件的保存目录
 OUTPUT_DIR = 'output'
@@ -26,6 +37,165 @@ END_PAGE = 5
 # ||         通常无需修改以下内容               ||
 # ==================================================
 
+def parse_ranges(spec, num_pages):
+    """
+    解析页码范围字符串 (页码从 1 开始，闭区间)，例如 "1-5,8,10-" 或 "-3"。
+    省略的起止页分别视为第 1 页与最后一页。
+    返回: [(start, end), ...]；范围无效时抛出 ValueError
+    """
+    ranges = []
+    for part in str(spec).replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                start_text, end_text = part.split("-", 1)
+                start = int(start_text) if start_text else 1
+                end = int(end_text) if end_text else num_pages
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"无法解析页码范围 '{part}'")
+        if start < 1 or end > num_pages or start > end:
+            raise ValueError(f"无效的页码范围 '{part}'，该 PDF 共有 {num_pages} 页")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError("页码范围为空")
+    return ranges
+
+
+def format_ranges(ranges):
+    """[(1, 5), (8, 8)] -> "1-5,8" """
+    return ",".join(f"{start}-{end}" if start != end else str(start) for start, end in ranges)
+
+
+def range_pages(ranges):
+    """展开为去重且按顺序排列的 0 起始页码索引列表"""
+    return sorted({page - 1 for start, end in ranges for page in range(start, end + 1)})
+
+
+def _output_path(input_path, output_dir, start, end):
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{name}_p{start}-{end}.pdf")
+
+
+def _slice_with_fitz(input_path, jobs):
+    import fitz  # PyMuPDF
+    with fitz.open(input_path) as src:
+        for start, end, output_path in jobs:
+            with fitz.open() as dst:
+                dst.insert_pdf(src, from_page=start - 1, to_page=end - 1)
+                dst.save(output_path, garbage=3, deflate=True)
+
+
+def _slice_with_pypdf2(input_path, jobs):
+    from PyPDF2 import PdfReader, PdfWriter
+    reader = PdfReader(input_path)
+    for start, end, output_path in jobs:
+        writer = PdfWriter()
+        for i in range(start - 1, end):
+            writer.add_page(reader.pages[i])
+        with open(output_path, 'wb') as output_file:
+            writer.write(output_file)
+
+
+def _slice_bytes_with_fitz(input_path, ranges):
+    import fitz  # PyMuPDF
+    results = []
+    with fitz.open(input_path) as src:
+        for start, end in ranges:
+            with fitz.open() as dst:
+                dst.insert_pdf(src, from_page=start - 1, to_page=end - 1)
+                # 不生成随机的文件 ID，同一页每次切出的字节相同 (便于去重、版本比对与录制回放)
+                results.append(dst.tobytes(garbage=3, deflate=True, no_new_id=True))
+    return results
+
+
+def _slice_bytes_with_pypdf2(input_path, ranges):
+    import io
+    from PyPDF2 import PdfReader, PdfWriter
+    reader = PdfReader(input_path)
+    results = []
+    for start, end in ranges:
+        writer = PdfWriter()
+        for i in range(start - 1, end):
+            writer.add_page(reader.pages[i])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        results.append(buffer.getvalue())
+    return results
+
+
+def page_count(input_path):
+    try:
+        import fitz
+        with fitz.open(input_path) as doc:
+            return doc.page_count
+    except ImportError:
+        from PyPDF2 import PdfReader
+        return len(PdfReader(input_path).pages)
+
+
+def slice_pdf_ranges(input_path, ranges, output_dir=OUTPUT_DIR, output_paths=None):
+    """
+    将一个 PDF 按多个页码范围切割，整个过程只解析一次源文件。
+    :param ranges: 页码范围字符串 (如 "1-5,8") 或 [(start, end), ...] (页码从 1 开始)
+    :param output_paths: 可选，与范围一一对应的输出路径；默认 output_dir/<文件名>_p<起>-<止>.pdf
+    返回: 输出文件路径列表
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"找不到输入文件 '{input_path}'")
+    if isinstance(ranges, str):
+        ranges = parse_ranges(ranges, page_count(input_path))
+    if output_paths is None:
+        output_paths = [_output_path(input_path, output_dir, start, end) for start, end in ranges]
+    for path in output_paths:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    jobs = [(start, end, path) for (start, end), path in zip(ranges, output_paths)]
+    try:
+        _slice_with_fitz(input_path, jobs)
+    except ImportError:
+        _slice_with_pypdf2(input_path, jobs)
+    return output_paths
+
+
+def slice_pdf_bytes(input_path, ranges):
+    """
+    与 slice_pdf_ranges 相同，但切出的 PDF 只保存在内存中，不写文件 (原生 PDF 模式直接发送给模型)。
+    返回: 与范围一一对应的 PDF 字节列表
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"找不到输入文件 '{input_path}'")
+    if isinstance(ranges, str):
+        ranges = parse_ranges(ranges, page_count(input_path))
+    try:
+        return _slice_bytes_with_fitz(input_path, ranges)
+    except ImportError:
+        return _slice_bytes_with_pypdf2(input_path, ranges)
+
+
+def _slice_one(args):
+    input_path, ranges, output_dir = args
+    try:
+        return input_path, slice_pdf_ranges(input_path, ranges, output_dir), None
+    except Exception as e:
+        return input_path, [], str(e)
+
+
+def slice_batch(input_paths, ranges, output_dir=OUTPUT_DIR, workers=None):
+    """
+    并行切割多个 PDF (每个 PDF 使用相同的页码范围字符串，开放范围按各自页数解析)。
+    返回: {输入路径: (输出路径列表, 错误信息或 None)}
+    """
+    tasks = [(path, ranges, output_dir) for path in input_paths]
+    if len(tasks) <= 1 or workers == 1:
+        results = map(_slice_one, tasks)
+        return {path: (outputs, error) for path, outputs, error in results}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return {path: (outputs, error) for path, outputs, error in executor.map(_slice_one, tasks)}
+
+
 def slice_pdf(input_path, output_path, start, end):
     """
     切割PDF文件从指定的起始页到结束页。
@@ -36,52 +206,56 @@ def slice_pdf(input_path, output_path, start, end):
     :param end: 结束页码（包含此页）。
     """
     try:
-        # 检查输入文件是否存在
-        if not os.path.exists(input_path):
-            print(f"错误：找不到输入文件 '{input_path}'")
-            print("请确保 'INPUT_PDF_PATH' 配置正确，并且文件存在。")
-            return
-
-        # 创建PdfReader对象
-        reader = PdfReader(input_path)
-        writer = PdfWriter()
-        
-        num_pages = len(reader.pages)
-
-        # 验证页码范围
+        num_pages = page_count(input_path)
         if start < 1 or end > num_pages or start > end:
             print(f"错误：无效的页码范围。该PDF共有 {num_pages} 页。")
             print(f"您设置的范围是从 {start} 到 {end}。请确保起始页不小于1，结束页不大于总页数，并且起始页不大于结束页。")
             return
-
-        # PyPDF2的页码是从0开始的，所以需要将用户的输入（从1开始）转换为0索引
-        start_index = start - 1
-        end_index = end - 1
-
-        # 遍历指定范围的页面并添加到writer中
-        for i in range(start_index, end_index + 1):
-            writer.add_page(reader.pages[i])
-
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"创建输出目录：'{output_dir}'")
-
-        # 写入到新的PDF文件
-        with open(output_path, 'wb') as output_file:
-            writer.write(output_file)
-
+        slice_pdf_ranges(input_path, [(start, end)], output_paths=[output_path])
         print(f"成功！PDF已切割并保存为 '{output_path}'")
         print(f"共切割了 {end - start + 1} 页（从第 {start} 页到第 {end} 页）。")
 
+    except FileNotFoundError:
+        print(f"错误：找不到输入文件 '{input_path}'")
+        print("请确保 'INPUT_PDF_PATH' 配置正确，并且文件存在。")
     except Exception as e:
         print(f"处理PDF时发生错误：{e}")
         print("请检查PDF文件是否已损坏或被密码保护。")
 
+
+def _collect_pdfs(inputs):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(os.path.join(item, f) for f in sorted(os.listdir(item)) if f.lower().endswith('.pdf'))
+        else:
+            paths.append(item)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF 多范围切割")
+    parser.add_argument("inputs", nargs="*", help="PDF 文件或包含 PDF 的目录")
+    parser.add_argument("--ranges", default=f"{START_PAGE}-{END_PAGE}", help="页码范围，例如 1-5,8,10-")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="输出目录")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数 (默认 CPU 核数)")
+    args = parser.parse_args(argv)
+
+    if not args.inputs:
+        # 兼容旧用法: 使用配置区域的设置
+        slice_pdf(INPUT_PDF_PATH, os.path.join(OUTPUT_DIR, OUTPUT_FILENAME), START_PAGE, END_PAGE)
+        return
+
+    results = slice_batch(_collect_pdfs(args.inputs), args.ranges, args.output, args.workers)
+    failed = 0
+    for path, (outputs, error) in results.items():
+        if error:
+            failed += 1
+            print(f"[ERROR] {path}: {error}")
+        else:
+            print(f"[OK] {path} -> {len(outputs)} 个文件")
+    print(f"完成: {len(results) - failed}/{len(results)} 个 PDF 切割成功，输出目录 '{args.output}'")
+
+
 if __name__ == '__main__':
-    # 拼接完整的输出路径
-    full_output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILENAME)
-    
-    # 执行切割功能
-    slice_pdf(INPUT_PDF_PATH, full_output_path, START_PAGE, END_PAGE)
+    main()
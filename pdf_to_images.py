@@ -1,5 +1,6 @@
 import os
 import fitz  # PyMuPDF
+from page_store import STORE_FILENAME, PageStoreWriter
 
 # ==================================================
 # ||                配置区域                     ||
@@ -24,12 +25,16 @@ IMAGE_FORMAT = 'png'
 # DPI越高，图片越清晰，文件也越大。300 DPI 是印刷质量。
 IMAGE_DPI = 300
 
+# 5. 是否将所有页面写入单个容器文件 (output/mydoc/pages.pts)
+# 页数很多时可避免产生大量小文件；需要散装图片时运行 python page_store.py output/mydoc/pages.pts
+SINGLE_FILE_STORE = False
+
 # ==================================================
 # ||                脚本核心逻辑                  ||
 # ||         通常无需修改以下内容               ||
 # ==================================================
 
-def convert_pdf_to_images(input_path, output_dir, img_format='png', dpi=300):
+def convert_pdf_to_images(input_path, output_dir, img_format='png', dpi=300, single_file=False):
     """
     将PDF的每一页转换为图片。
 
@@ -37,6 +42,7 @@ def convert_pdf_to_images(input_path, output_dir, img_format='png', dpi=300):
     :param output_dir: 图片的保存目录。
     :param img_format: 图片格式 (例如 'png', 'jpg')。
     :param dpi: 图片分辨率。
+    :param single_file: 是否写入单个容器文件而不是每页一个图片文件。
     """
     try:
         # 检查输入文件是否存在
@@ -59,6 +65,18 @@ def convert_pdf_to_images(input_path, output_dir, img_format='png', dpi=300):
 
         print(f"开始转换 '{pdf_filename}'...")
 
+        if single_file:
+            store_path = os.path.join(image_output_dir, STORE_FILENAME)
+            mime_type = "image/jpeg" if img_format in ('jpg', 'jpeg') else f"image/{img_format}"
+            with PageStoreWriter(store_path) as writer:
+                for page_num in range(len(doc)):
+                    zoom = dpi / 72
+                    pix = doc.load_page(page_num).get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                    writer.add(page_num + 1, pix.tobytes(img_format), mime_type)
+            doc.close()
+            print(f"\n成功！{len(writer.index)} 页图片已写入容器文件 '{store_path}'。")
+            return
+
         # 遍历每一页
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
@@ -84,4 +102,4 @@ def convert_pdf_to_images(input_path, output_dir, img_format='png', dpi=300):
 
 if __name__ == '__main__':
     # 执行PDF到图片的转换功能
-    convert_pdf_to_images(INPUT_PDF_PATH, OUTPUT_DIR, IMAGE_FORMAT, IMAGE_DPI)
+    convert_pdf_to_images(INPUT_PDF_PATH, OUTPUT_DIR, IMAGE_FORMAT, IMAGE_DPI, SINGLE_FILE_STORE)
@@ -0,0 +1,354 @@
+# perf_history.py
+"""
+跨运行的性能历史: 每次运行结束时把页面级与调用级指标追加到 SQLite 数据库 (PERF_HISTORY_DB)，
+而不是只留下一个孤立的 summary_<时间>.json，便于观察吞吐、延迟、失败率与费用随时间的变化。
+
+运行按 "入口脚本/模式" 分类 (例如 main/live、main/replay、worker/live)，
+每次运行只与同类运行的滚动基线 (最近 PERF_BASELINE_RUNS 次的中位数) 比较，超出阈值时标记为回归。
+
+用法:
+    python perf_history.py report                 # 最近 20 次运行的趋势与回归标记
+    python perf_history.py report --last 50 --kind main/live --model gemini-2.5-flash
+    python perf_history.py report --check         # 最近一次运行存在回归时退出码为 1 (用于 CI)
+"""
+import os
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import statistics
+import subprocess
+import config
+from stats_manager import _percentile
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind             TEXT NOT NULL,   -- 入口脚本/模式，只与同类运行比较
+    started_at       REAL NOT NULL,
+    ended_at         REAL NOT NULL,
+    duration         REAL NOT NULL,
+    host             TEXT,
+    git_commit       TEXT,
+    papers           INTEGER NOT NULL DEFAULT 0,
+    pages            INTEGER NOT NULL DEFAULT 0,
+    failed_pages     INTEGER NOT NULL DEFAULT 0,
+    skipped_pages    INTEGER NOT NULL DEFAULT 0,
+    deadline_misses  INTEGER NOT NULL DEFAULT 0,  -- 单页时间预算用尽而失败的页数
+    pages_per_minute REAL,
+    p50              REAL,
+    p90              REAL,
+    p99              REAL,
+    total_cost       REAL,
+    startup_seconds  REAL
+);
+CREATE TABLE IF NOT EXISTS page_metrics (
+    run_id    INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    seq       INTEGER NOT NULL,
+    latency   REAL NOT NULL,
+    success   INTEGER NOT NULL,
+    model     TEXT
+);
+CREATE TABLE IF NOT EXISTS call_metrics (
+    run_id     INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    model      TEXT NOT NULL,
+    success    INTEGER NOT NULL,
+    latency    REAL NOT NULL,
+    started_at REAL
+);
+CREATE TABLE IF NOT EXISTS model_metrics (
+    run_id        INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    model         TEXT NOT NULL,
+    calls         INTEGER NOT NULL,
+    failures      INTEGER NOT NULL,
+    p50           REAL,
+    p90           REAL,
+    input_tokens  INTEGER,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,  -- 输入中命中服务端缓存的 token 数
+    output_tokens INTEGER,
+    cost          REAL,
+    PRIMARY KEY (run_id, model)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_kind ON runs(kind, started_at);
+"""
+
+# 旧数据库补充的列 (表, 列, 类型)
+MIGRATIONS = [
+    ("runs", "deadline_misses", "INTEGER NOT NULL DEFAULT 0"),
+    ("model_metrics", "cached_tokens", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def connect(path=None):
+    path = path or config.PERF_HISTORY_DB
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    for table, column, column_type in MIGRATIONS:
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    return conn
+
+
+def run_kind():
+    """入口脚本名/模式，例如 main/live、main/replay"""
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "main"))[0] or "main"
+    return f"{script}/{config.CASSETTE_MODE or 'live'}"
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=config.BASE_DIR,
+                                capture_output=True, text=True, timeout=5)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def record_run(stats_manager, summary=None, path=None, kind=None):
+    """
+    将一次运行的指标追加到历史数据库。
+    没有翻译任何页面、也没有调用模型的运行不记录，返回 None；否则返回运行 ID
+    """
+    if not stats_manager.page_records and not stats_manager.api_calls:
+        return None
+    summary = summary or stats_manager.generate_summary()
+    exec_summary = summary["execution_summary"]
+    percentiles = exec_summary["page_time_percentiles_seconds"]
+    ended_at = time.time()
+
+    conn = connect(path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (kind, started_at, ended_at, duration, host, git_commit, papers, pages, failed_pages,"
+                " skipped_pages, deadline_misses, pages_per_minute, p50, p90, p99, total_cost, startup_seconds)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind or run_kind(), stats_manager.start_time, ended_at, exec_summary["total_duration_seconds"],
+                 socket.gethostname(), _git_commit(), exec_summary["translated_papers"],
+                 exec_summary["translated_pages"], sum(1 for _, ok, _ in stats_manager.page_records if not ok),
+                 sum(exec_summary["skipped_pages"].values()), exec_summary["deadline_misses"],
+                 exec_summary["pages_per_minute"],
+                 percentiles["p50"], percentiles["p90"], percentiles["p99"],
+                 summary["total_cost"], exec_summary["startup_seconds"]))
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO page_metrics (run_id, seq, latency, success, model) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, seq, latency, int(ok), model)
+                 for seq, (latency, ok, model) in enumerate(stats_manager.page_records)])
+            conn.executemany(
+                "INSERT INTO call_metrics (run_id, model, success, latency, started_at) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, model, int(ok), latency, started)
+                 for model, ok, latency, started in stats_manager.api_calls])
+
+            calls_by_model = {}
+            for model, ok, latency, _ in stats_manager.api_calls:
+                calls_by_model.setdefault(model, []).append((ok, latency))
+            for model in set(calls_by_model) | set(summary["token_usage_stats"]):
+                calls = calls_by_model.get(model, [])
+                latencies = [latency for _, latency in calls]
+                usage = summary["token_usage_stats"].get(model, {})
+                conn.execute(
+                    "INSERT INTO model_metrics (run_id, model, calls, failures, p50, p90, input_tokens, cached_tokens,"
+                    " output_tokens, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, model, len(calls), sum(1 for ok, _ in calls if not ok),
+                     _percentile(latencies, 50), _percentile(latencies, 90),
+                     usage.get("input_tokens", 0), usage.get("cached_input_tokens", 0),
+                     usage.get("output_tokens", 0), usage.get("cost", 0.0)))
+        return run_id
+    finally:
+        conn.close()
+
+
+# ---------- 趋势与回归判定 ----------
+
+def _relative_change(value, base, higher_is_worse):
+    """相对基线变差的比例 (正数表示变差)"""
+    if value is None or not base:
+        return 0.0
+    return (value - base) / base if higher_is_worse else (base - value) / base
+
+
+# (字段, 名称, 变差方向: True 表示越高越差, 判定方式: "relative" 相对变化 / "delta" 绝对差值)
+RUN_METRICS = [
+    ("pages_per_minute", "吞吐", False, "relative"),
+    ("p50", "P50", True, "relative"),
+    ("p90", "P90", True, "relative"),
+    ("error_rate", "失败率", True, "delta"),
+    ("cost_per_page", "单页费用", True, "relative"),
+]
+MODEL_METRICS = [
+    ("p90", "P90", True, "relative"),
+    ("error_rate", "失败率", True, "delta"),
+    ("cost_per_call", "单次费用", True, "relative"),
+]
+
+
+def find_regressions(history, metrics, window=None, threshold=None, delta=None):
+    """
+    history: 按时间顺序排列的指标字典列表 (同一类运行)
+    返回: 与 history 一一对应的回归说明列表，例如 ["吞吐 -35%", "失败率 +8.0pt"]
+    """
+    window = window or config.PERF_BASELINE_RUNS
+    threshold = config.PERF_REGRESSION_THRESHOLD if threshold is None else threshold
+    delta = config.PERF_ERROR_RATE_DELTA if delta is None else delta
+    flags = []
+    for idx, row in enumerate(history):
+        previous = history[max(0, idx - window):idx]
+        row_flags = []
+        if len(previous) >= min(window, config.PERF_BASELINE_MIN_RUNS):
+            for field, label, higher_is_worse, mode in metrics:
+                values = [p[field] for p in previous if p[field] is not None]
+                if not values or row[field] is None:
+                    continue
+                base = statistics.median(values)
+                if mode == "delta":
+                    if row[field] - base > delta:
+                        row_flags.append(f"{label} +{(row[field] - base) * 100:.1f}pt")
+                elif _relative_change(row[field], base, higher_is_worse) > threshold:
+                    row_flags.append(f"{label} {(row[field] - base) / base * 100:+.0f}%")
+        flags.append(row_flags)
+    return flags
+
+
+def load_runs(conn, kind=None, last=20):
+    """读取最近 last 次运行 (按时间顺序)，附带失败率与单页费用"""
+    query = "SELECT * FROM runs WHERE pages > 0"
+    params = []
+    if kind:
+        query += " AND kind = ?"
+        params.append(kind)
+    query += " ORDER BY started_at DESC LIMIT ?"
+    params.append(last)
+    runs = []
+    for row in reversed(conn.execute(query, params).fetchall()):
+        run = dict(row)
+        run["error_rate"] = run["failed_pages"] / run["pages"]
+        run["cost_per_page"] = run["total_cost"] / run["pages"] if run["total_cost"] else None
+        runs.append(run)
+    return runs
+
+
+def load_model_history(conn, run_ids, model=None):
+    """读取这些运行的分模型指标，返回 {模型: [指标字典 (按时间顺序)]}"""
+    if not run_ids:
+        return {}
+    placeholders = ",".join("?" * len(run_ids))
+    query = (f"SELECT m.*, r.started_at, r.kind FROM model_metrics m JOIN runs r ON r.id = m.run_id"
+             f" WHERE m.run_id IN ({placeholders}) AND m.calls > 0")
+    params = list(run_ids)
+    if model:
+        query += " AND m.model = ?"
+        params.append(model)
+    history = {}
+    for row in conn.execute(query + " ORDER BY r.started_at", params):
+        entry = dict(row)
+        entry["error_rate"] = entry["failures"] / entry["calls"]
+        entry["cost_per_call"] = entry["cost"] / entry["calls"] if entry["cost"] else None
+        history.setdefault(entry["model"], []).append(entry)
+    return history
+
+
+def _flag_rows(rows, metrics, **kwargs):
+    """按运行类型分组判定回归，结果与 rows 一一对应"""
+    flags = [None] * len(rows)
+    groups = {}
+    for idx, row in enumerate(rows):
+        groups.setdefault(row["kind"], []).append(idx)
+    for indices in groups.values():
+        for idx, row_flags in zip(indices, find_regressions([rows[i] for i in indices], metrics, **kwargs)):
+            flags[idx] = row_flags
+    return flags
+
+
+def _fmt_time(ts):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+
+
+def _fmt_cost(value):
+    return f"${value:.4f}" if value else "-"
+
+
+def report(kind=None, model=None, last=20, window=None, threshold=None, path=None):
+    """
+    生成趋势报告字符串。
+    返回: (报告字符串, 最近一次运行是否存在回归)
+    """
+    window = window or config.PERF_BASELINE_RUNS
+    conn = connect(path)
+    try:
+        # 多读取 window 次运行，使显示的第一次运行也有基线
+        runs = load_runs(conn, kind, last + window)
+        models = load_model_history(conn, [run["id"] for run in runs], model)
+    finally:
+        conn.close()
+    if not runs:
+        return "性能历史为空: 完成一次翻译后再查看。", False
+
+    options = {"window": window, "threshold": threshold}
+    run_flags = _flag_rows(runs, RUN_METRICS, **options)
+    runs, run_flags = runs[-last:], run_flags[-last:]
+    shown_ids = {run["id"] for run in runs}
+    lines = [
+        "=" * 100,
+        f"  性能历史: 最近 {len(runs)} 次运行 (基线: 同类运行最近 {window} 次的中位数)",
+        "=" * 100,
+        f"  {'ID':>4}  {'时间':<16}  {'类型':<14} {'提交':<8} {'页数':>5} {'失败率':>7} {'页/分钟':>8}"
+        f" {'P50':>7} {'P90':>7} {'P99':>7} {'单页费用':>9}  回归",
+    ]
+    for run, flags in zip(runs, run_flags):
+        lines.append(
+            f"  {run['id']:>4}  {_fmt_time(run['started_at']):<16}  {run['kind']:<14} {run['git_commit'] or '-':<8}"
+            f" {run['pages']:>5} {run['error_rate'] * 100:>6.1f}% {run['pages_per_minute']:>8.1f}"
+            f" {run['p50']:>6.2f}s {run['p90']:>6.2f}s {run['p99']:>6.2f}s {_fmt_cost(run['cost_per_page']):>9}"
+            f"  {'⚠ ' + ', '.join(flags) if flags else ''}")
+
+    latest_regressed = bool(run_flags[-1])
+    latest_id = runs[-1]["id"]
+    for model_name, history in sorted(models.items()):
+        model_flags = _flag_rows(history, MODEL_METRICS, **options)
+        lines.append("-" * 100)
+        lines.append(f"  模型: {model_name}")
+        lines.append(f"  {'ID':>4}  {'时间':<16}  {'调用':>5} {'失败率':>7} {'P50':>7} {'P90':>7}"
+                     f" {'输入 Token':>10} {'缓存命中':>8} {'输出 Token':>10} {'费用':>9}  回归")
+        for entry, flags in zip(history, model_flags):
+            if entry["run_id"] not in shown_ids:
+                continue
+            lines.append(
+                f"  {entry['run_id']:>4}  {_fmt_time(entry['started_at']):<16}  {entry['calls']:>5}"
+                f" {entry['error_rate'] * 100:>6.1f}% {entry['p50']:>6.2f}s {entry['p90']:>6.2f}s"
+                f" {entry['input_tokens'] or 0:>10} {entry['cached_tokens'] or 0:>8} {entry['output_tokens'] or 0:>10}"
+                f" {_fmt_cost(entry['cost']):>9}"
+                f"  {'⚠ ' + ', '.join(flags) if flags else ''}")
+            if flags and entry["run_id"] == latest_id:
+                latest_regressed = True
+    lines.append("=" * 100)
+    return "\n".join(lines), latest_regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="跨运行性能历史")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="显示吞吐、延迟、失败率与费用的趋势，并标记回归")
+    report_parser.add_argument("--last", type=int, default=20, help="显示最近 N 次运行 (默认 20)")
+    report_parser.add_argument("--kind", default=None, help="只显示某类运行，例如 main/live")
+    report_parser.add_argument("--model", default=None, help="只显示某个模型的分模型指标")
+    report_parser.add_argument("--window", type=int, default=None, help="滚动基线的运行次数")
+    report_parser.add_argument("--threshold", type=float, default=None, help="回归阈值 (相对变化，例如 0.2)")
+    report_parser.add_argument("--check", action="store_true", help="最近一次运行存在回归时以退出码 1 结束")
+    report_parser.add_argument("--db", default=None, help="历史数据库路径 (默认 PERF_HISTORY_DB)")
+    args = parser.parse_args(argv)
+
+    text, regressed = report(args.kind, args.model, args.last, args.window, args.threshold, args.db)
+    print(text)
+    if args.check and regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
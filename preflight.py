@@ -0,0 +1,77 @@
+# preflight.py
+"""
+启动前的网络探测: 并发检查各服务商端点是否可达，结果缓存一小段时间 (PREFLIGHT_CACHE_TTL)，
+短时间内多次启动 (小任务、脚本批量调用) 不必每次都等待网络超时。
+使用标准库 urllib，避免在启动阶段导入 requests。
+"""
+import os
+import json
+import time
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+
+def probe_url(url, timeout):
+    """
+    请求一次 url。收到任何 HTTP 响应 (包括 4xx) 都视为可达。
+    返回: {"url", "reachable", "status", "error", "elapsed", "checked_at"}
+    """
+    start = time.perf_counter()
+    status, error = None, None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="GET"), timeout=timeout) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    return {"url": url, "reachable": status is not None, "status": status, "error": error,
+            "elapsed": time.perf_counter() - start, "checked_at": time.time()}
+
+
+def _load_cache():
+    try:
+        with open(config.PREFLIGHT_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    os.makedirs(os.path.dirname(config.PREFLIGHT_CACHE_FILE), exist_ok=True)
+    tmp_path = f"{config.PREFLIGHT_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, config.PREFLIGHT_CACHE_FILE)
+
+
+def run_probes(targets, timeout=None, use_cache=True):
+    """
+    并发探测 {名称: url}，未过期的缓存结果直接复用。
+    返回: {名称: 探测结果}，结果中 "cached" 表示是否来自缓存
+    """
+    timeout = timeout or config.PREFLIGHT_TIMEOUT
+    cache = _load_cache() if use_cache else {}
+    now = time.time()
+    results, pending = {}, {}
+    for name, url in targets.items():
+        entry = cache.get(name)
+        if entry and entry.get("url") == url and now - entry.get("checked_at", 0) < config.PREFLIGHT_CACHE_TTL:
+            results[name] = dict(entry, cached=True)
+        else:
+            pending[name] = url
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="preflight") as executor:
+            futures = {name: executor.submit(probe_url, url, timeout) for name, url in pending.items()}
+            for name, future in futures.items():
+                results[name] = dict(future.result(), cached=False)
+                cache[name] = future.result()
+        if use_cache:
+            try:
+                _save_cache(cache)
+            except OSError:
+                pass  # 缓存写入失败不影响启动
+    return results
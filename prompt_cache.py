@@ -0,0 +1,136 @@
+# prompt_cache.py
+"""
+系统提示词缓存: 每页请求都带着相同的 SYSTEM_PROMPT，不再把它拼进用户文本，而是作为固定前缀发送，
+让服务端缓存这部分 token (命中缓存的输入按 cached_input 价格计费)。
+
+  Gemini      - 启用 PROMPT_CACHE_ENABLED 时为每个 (模型, API Key) 创建 cachedContents，请求只引用缓存名称，
+                过期前自动重建；服务端明确拒绝 (HTTP 400，例如提示词低于模型的最小缓存 token 数) 时退回
+                systemInstruction 字段，一段时间内不再尝试该模型；超时、5xx 等临时错误只影响本次请求。
+  OpenAI 兼容 - 协议只能以 system 消息发送，服务端的隐式前缀缓存由各服务商自行处理。
+
+两种接口命中缓存的 token 数都从响应的 usage 中读取并计入统计。
+"""
+import json
+import time
+import threading
+import config
+from utils import Logger
+
+
+class CacheUnsupportedError(Exception):
+    """服务端明确拒绝为该模型创建缓存 (HTTP 400)"""
+
+
+def system_instruction():
+    """Gemini 请求体中的 systemInstruction 字段"""
+    return {"parts": [{"text": config.SYSTEM_PROMPT}]}
+
+
+def gemini_cached_tokens(usage):
+    """Gemini usageMetadata 中命中缓存的输入 token 数"""
+    return (usage or {}).get("cachedContentTokenCount", 0) or 0
+
+
+def openai_cached_tokens(usage):
+    """OpenAI 兼容接口 usage 中命中缓存的输入 token 数 (prompt_tokens_details.cached_tokens)"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+class PromptCache:
+    def __init__(self, session_getter):
+        self._session = session_getter  # 返回 requests.Session 的函数 (与 AIHandler 共用连接池)
+        self._lock = threading.Lock()
+        self._entries = {}      # (模型, Key) -> (缓存名称, 过期时间)
+        self._key_locks = {}    # (模型, Key) -> 创建缓存时持有的锁 (同一 Key 只创建一次，不阻塞其他 Key)
+        self._unsupported = {}  # 模型 -> 下次重新尝试创建缓存的时间
+
+    @property
+    def enabled(self):
+        # 缓存名称每次运行都不同，录制 / 回放时请求指纹无法复现，因此不创建缓存
+        return config.PROMPT_CACHE_ENABLED and not config.CASSETTE_MODE
+
+    def gemini_fields(self, model_name, api_key, deadline=None):
+        """
+        返回并入 Gemini 请求体的字段: {"cachedContent": 缓存名称} 或 {"systemInstruction": ...}。
+        创建缓存失败不影响翻译，直接退回 systemInstruction
+        """
+        name = self._gemini_cache(model_name, api_key, deadline) if self.enabled else None
+        if name:
+            return {"cachedContent": name}
+        return {"systemInstruction": system_instruction()}
+
+    def invalidate(self, model_name, api_key):
+        """引用缓存的请求被拒绝 (缓存已过期或被删除) 时丢弃该缓存，下次请求重新创建"""
+        with self._lock:
+            self._entries.pop((model_name, api_key.secret), None)
+
+    def _lookup(self, key, model_name, now):
+        """返回 (缓存名称或 None, 是否可以创建)；需持有 self._lock"""
+        if self._unsupported.get(model_name, 0) > now:
+            return None, False
+        entry = self._entries.get(key)
+        if entry and entry[1] - config.PROMPT_CACHE_REFRESH_MARGIN > now:
+            return entry[0], False
+        return None, True
+
+    def _gemini_cache(self, model_name, api_key, deadline):
+        key = (model_name, api_key.secret)
+        with self._lock:
+            name, creatable = self._lookup(key, model_name, time.time())
+            if not creatable:
+                return name
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        timeout = config.PROMPT_CACHE_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        # 同一 Key 的并发请求在这里等待创建完成，只创建一次；创建请求不持有全局锁
+        if timeout <= 0 or not key_lock.acquire(timeout=timeout):
+            return None
+        try:
+            with self._lock:
+                name, creatable = self._lookup(key, model_name, time.time())
+            if not creatable:
+                return name
+            if deadline is not None:
+                timeout = min(timeout, deadline.remaining())
+            try:
+                name, tokens = self._create_gemini(model_name, api_key, timeout)
+            except CacheUnsupportedError as e:
+                with self._lock:
+                    self._unsupported[model_name] = time.time() + config.PROMPT_CACHE_RETRY_SECONDS
+                Logger.info(f"{model_name} 不支持系统提示词缓存，改用 systemInstruction: {e}", indent=3)
+                return None
+            except Exception as e:
+                # 超时、5xx 等临时错误: 本次请求不使用缓存，下次请求再尝试创建
+                Logger.info(f"{model_name} 创建系统提示词缓存失败，本次改用 systemInstruction: {e}", indent=3)
+                return None
+            with self._lock:
+                self._entries[key] = (name, time.time() + config.PROMPT_CACHE_TTL)
+            Logger.info(f"已为 {model_name} (Key {api_key.label}) 创建系统提示词缓存 {name} ({tokens} token)。", indent=3)
+            return name
+        finally:
+            key_lock.release()
+
+    def _create_gemini(self, model_name, api_key, timeout):
+        """创建 cachedContents，返回 (缓存名称, 缓存的 token 数)"""
+        if timeout <= 0:
+            raise TimeoutError("本页时间预算不足")
+        payload = {
+            "model": f"models/{model_name}",
+            "systemInstruction": system_instruction(),
+            "ttl": f"{config.PROMPT_CACHE_TTL}s",
+        }
+        response = self._session().post(f"{config.GEMINI_API_BASE}/cachedContents?key={api_key.secret}",
+                                        headers={"Content-Type": "application/json"},
+                                        data=json.dumps(payload), timeout=timeout)
+        if response.status_code >= 400:
+            try:
+                message = response.json()["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = response.text[:200]
+            error_class = CacheUnsupportedError if response.status_code == 400 else RuntimeError
+            raise error_class(f"HTTP {response.status_code}: {message}")
+        body = response.json()
+        return body["name"], body.get("usageMetadata", {}).get("totalTokenCount", 0)
@@ -0,0 +1,384 @@
+# service.py
+"""
+翻译服务 API: 客户端上传 PDF 获得任务 ID，查询逐页状态，或通过 SSE 实时接收翻译完成的页面。
+相同内容的 PDF (SHA-256) 只翻译一次，重复上传直接返回已有任务。
+准入控制: 排队 + 翻译中的任务总数与每个客户端同时进行的任务数均有上限，超出时返回 503 / 429。
+
+用法:
+    python service.py
+
+接口:
+    POST /jobs?filename=paper.pdf        请求体为 PDF 原始字节，可带 X-Client-Id 头 -> {"job_id", "state", ...}
+    GET  /jobs                           所有任务概览
+    GET  /jobs/<job_id>                  任务状态与逐页状态
+    GET  /jobs/<job_id>/events           SSE: 每完成一页推送 page 事件，结束时推送 done 事件
+    GET  /jobs/<job_id>/pages/<n>        第 n 页翻译结果 (Markdown)
+    GET  /jobs/<job_id>/result           合并后的完整翻译 (Markdown)
+    GET  /health                         队列深度
+"""
+import os
+import re
+import sys
+import json
+import time
+import signal
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import config
+from utils import Logger, ensure_directories
+from ai_handler import AIHandler
+from stats_manager import StatsManager
+from job_store import JobStore, DONE, FAILED
+from main import pre_flight_checks, process_paper, finish_run, record_startup
+
+# 任务状态
+QUEUED, RUNNING, COMPLETED, ERROR, INTERRUPTED = "queued", "running", "done", "failed", "interrupted"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class AdmissionError(Exception):
+    """任务被准入控制拒绝"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class TranslationService:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.stats_manager = StatsManager(config.OUTPUT_DIR)
+        self.ai_handler = None
+        self.job_store = None
+        self.executor = None
+        self.jobs = {}  # job_id -> 任务信息
+        self.lock = threading.Lock()
+
+    def start(self):
+        if not pre_flight_checks():
+            Logger.plain("\n环境检查未通过，程序已终止。请根据提示修复问题后重试。")
+            sys.exit(1)
+        ensure_directories([config.OUTPUT_DIR, config.TRANS_DIR, config.SERVICE_UPLOAD_DIR])
+        self.ai_handler = AIHandler(self.stats_manager)
+        self.job_store = JobStore()
+        self.executor = ThreadPoolExecutor(max_workers=config.SERVICE_WORKERS, thread_name_prefix="job")
+        self._resume_uploads()
+        record_startup(self.stats_manager)
+
+    def _resume_uploads(self):
+        """服务重启后恢复历史任务: 已完成的直接可查询，未完成的重新排队"""
+        resumed = 0
+        for upload in self.job_store.list_uploads():
+            job = self._new_job(upload)
+            paper = self.job_store.get_paper(upload["paper_name"])
+            if paper and self.job_store.is_paper_complete(paper["id"]) and os.path.exists(self._result_path(upload)):
+                job["state"] = COMPLETED
+            else:
+                self._enqueue(job)
+                resumed += 1
+            self.jobs[upload["job_id"]] = job
+        if resumed:
+            Logger.info(f"已恢复 {resumed} 个未完成的任务。")
+
+    @staticmethod
+    def _new_job(upload):
+        return {
+            "job_id": upload["job_id"], "paper_name": upload["paper_name"], "filename": upload["filename"],
+            "client_id": upload["client_id"], "content_hash": upload["content_hash"], "state": QUEUED,
+            "submitted_at": time.time(), "started_at": None, "finished_at": None,
+        }
+
+    @staticmethod
+    def _result_path(upload):
+        return os.path.join(config.TRANS_DIR, f"翻译-{upload['paper_name']}.md")
+
+    # ---------- 提交 ----------
+    def submit(self, pdf_bytes, filename, client_id):
+        """登记上传的 PDF，返回 (任务信息, 是否为重复上传)；被准入控制拒绝时抛出 AdmissionError"""
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        with self.lock:
+            job, upload = self._find_active(content_hash)
+            if job:
+                return job, True
+            self._admit(client_id)
+
+        if upload is None:
+            # 写入文件时不持有锁，避免大文件阻塞状态查询与其他提交；文件名带内容哈希，并发写入同一内容也不会冲突
+            stem = re.sub(r'[^\w.-]+', '_', os.path.splitext(os.path.basename(filename or "upload"))[0])[:80]
+            paper_name = f"{stem}-{content_hash[:12]}"
+            pdf_path = os.path.join(config.SERVICE_UPLOAD_DIR, f"{paper_name}.pdf")
+            tmp_path = f"{pdf_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, pdf_path)
+
+        with self.lock:
+            # 写文件期间可能已有相同内容的提交或其他任务入队，重新检查
+            job, upload = self._find_active(content_hash)
+            if job:
+                return job, True
+            self._admit(client_id)
+            if upload is None:
+                self.job_store.record_upload(content_hash, content_hash[:16], paper_name, filename, client_id, pdf_path)
+                upload = self.job_store.find_upload(content_hash=content_hash)
+
+            job = self._new_job(upload)
+            job["client_id"] = client_id
+            self.jobs[job["job_id"]] = job
+            self._enqueue(job)
+        Logger.info(f"任务已排队: {job['job_id']} ({filename}，客户端 {client_id})")
+        return job, False
+
+    def _find_active(self, content_hash):
+        """返回 (相同内容的进行中或已完成任务, 上传记录)；需持有 self.lock"""
+        upload = self.job_store.find_upload(content_hash=content_hash)
+        job = self.jobs.get(upload["job_id"]) if upload else None
+        if job and job["state"] not in (ERROR, INTERRUPTED):
+            return job, upload
+        return None, upload
+
+    def _admit(self, client_id):
+        active = [job for job in self.jobs.values() if job["state"] in ACTIVE_STATES]
+        if len(active) >= config.SERVICE_MAX_QUEUE:
+            raise AdmissionError(503, f"队列已满 ({len(active)}/{config.SERVICE_MAX_QUEUE})，请稍后重试")
+        client_active = sum(1 for job in active if job["client_id"] == client_id)
+        if client_active >= config.SERVICE_MAX_JOBS_PER_CLIENT:
+            raise AdmissionError(429, f"客户端 {client_id} 已有 {client_active} 个进行中的任务")
+
+    def _enqueue(self, job):
+        job["state"] = QUEUED
+        self.executor.submit(self._run_job, job)
+
+    def _run_job(self, job):
+        if self.stop_event.is_set():
+            job["state"] = INTERRUPTED
+            return
+        job["state"], job["started_at"] = RUNNING, time.time()
+        try:
+            while True:
+                completed = process_paper(f"{job['paper_name']}.pdf", self.ai_handler, self.stats_manager, self.job_store,
+                                          stop_event=self.stop_event, label=" [服务]", data_dir=config.SERVICE_UPLOAD_DIR)
+                if completed is not None or self.stop_event.is_set():
+                    break
+                # 剩余页面由其他进程持有，等待后重新检查
+                self.stop_event.wait(config.JOB_LEASE_POLL_INTERVAL)
+        except Exception as e:
+            Logger.error(f"任务 {job['job_id']} 处理异常: {e}")
+            completed = False
+        if completed:
+            job["state"] = COMPLETED
+        else:
+            job["state"] = INTERRUPTED if self.stop_event.is_set() else ERROR
+        job["finished_at"] = time.time()
+
+    # ---------- 查询 ----------
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def page_rows(self, job):
+        paper = self.job_store.get_paper(job["paper_name"])
+        return self.job_store.get_pages(paper["id"]) if paper else []
+
+    def describe(self, job, with_pages=True):
+        body = {key: job[key] for key in ("job_id", "state", "filename", "client_id", "content_hash",
+                                          "submitted_at", "started_at", "finished_at")}
+        pages = self.page_rows(job)
+        body["num_pages"] = len(pages)
+        body["pages_done"] = sum(1 for page in pages if page["status"] in (DONE, FAILED))
+        if with_pages:
+            body["pages"] = [{
+                "page": page["page_idx"] + 1, "status": page["status"], "attempts": page["attempts"],
+                "provider": page["provider"], "latency": page["latency"], "error": page["error"],
+            } for page in pages]
+        return body
+
+    def queue_depth(self):
+        with self.lock:
+            states = [job["state"] for job in self.jobs.values()]
+        return {"queued": states.count(QUEUED), "running": states.count(RUNNING),
+                "max_queue": config.SERVICE_MAX_QUEUE, "max_jobs_per_client": config.SERVICE_MAX_JOBS_PER_CLIENT}
+
+    def shutdown(self):
+        self.stop_event.set()
+        if self.executor:
+            Logger.info("等待进行中的任务保存进度...")
+            self.executor.shutdown(wait=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PdfTransService/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, body, headers=None):
+        self._send(status, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8", headers)
+
+    def _send_markdown(self, text):
+        self._send(200, text.encode("utf-8"), "text/markdown; charset=utf-8")
+
+    def _client_id(self):
+        return self.headers.get("X-Client-Id") or self.client_address[0]
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/jobs":
+            return self._send_json(404, {"error": "not found"})
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._send_json(411, {"error": "Content-Length required"})
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._send_json(400, {"error": "invalid Content-Length"})
+        if length > config.SERVICE_MAX_UPLOAD_MB * 1024 * 1024:
+            self.close_connection = True
+            return self._send_json(413, {"error": f"文件超过 {config.SERVICE_MAX_UPLOAD_MB} MB"})
+        pdf_bytes = self.rfile.read(length)
+        if not pdf_bytes.startswith(b"%PDF-"):
+            return self._send_json(400, {"error": "请求体不是 PDF 文件"})
+
+        filename = parse_qs(url.query).get("filename", [None])[0] or self.headers.get("X-Filename") or "upload.pdf"
+        service = self.server.service
+        try:
+            job, deduplicated = service.submit(pdf_bytes, filename, self._client_id())
+        except AdmissionError as e:
+            return self._send_json(e.status, {"error": str(e)}, {"Retry-After": str(config.SERVICE_RETRY_AFTER)})
+        body = service.describe(job, with_pages=False)
+        body["deduplicated"] = deduplicated
+        self._send_json(200 if deduplicated else 202, body)
+
+    def do_GET(self):
+        service = self.server.service
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        if parts == ["health"]:
+            return self._send_json(200, service.queue_depth())
+        if parts == ["jobs"]:
+            with service.lock:
+                jobs = list(service.jobs.values())
+            return self._send_json(200, {"jobs": [service.describe(job, with_pages=False) for job in jobs]})
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._send_json(404, {"error": "not found"})
+
+        job = service.get_job(parts[1])
+        if job is None:
+            return self._send_json(404, {"error": "unknown job"})
+        if len(parts) == 2:
+            return self._send_json(200, service.describe(job))
+        if parts[2:] == ["events"]:
+            return self._stream_events(job)
+        if parts[2:] == ["result"]:
+            result_path = TranslationService._result_path(job)
+            if job["state"] != COMPLETED or not os.path.exists(result_path):
+                return self._send_json(409, {"error": f"任务尚未完成 (state={job['state']})"})
+            with open(result_path, 'r', encoding='utf-8') as f:
+                return self._send_markdown(f.read())
+        if len(parts) == 4 and parts[2] == "pages" and parts[3].isdigit():
+            page_idx = int(parts[3]) - 1
+            pages = service.page_rows(job)
+            if not 0 <= page_idx < len(pages):
+                return self._send_json(404, {"error": "unknown page"})
+            text = JobStore.read_result(pages[page_idx])
+            if text is None:
+                return self._send_json(409, {"error": f"该页尚未完成 (status={pages[page_idx]['status']})"})
+            return self._send_markdown(text)
+        self._send_json(404, {"error": "not found"})
+
+    def _write_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream_events(self, job):
+        """SSE: 每当有页面完成 (或失败) 推送一次 page 事件，任务结束后推送 done 事件并关闭连接"""
+        service = self.server.service
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        sent = set()
+        last_state = None
+        last_write = time.time()
+        try:
+            while True:
+                state = job["state"]  # 先取状态再读页面，保证 done 事件前已推送全部页面
+                for page in service.page_rows(job):
+                    if page["status"] in (DONE, FAILED) and page["page_idx"] not in sent:
+                        sent.add(page["page_idx"])
+                        self._write_event("page", {
+                            "page": page["page_idx"] + 1, "status": page["status"], "provider": page["provider"],
+                            "text": JobStore.read_result(page),
+                        })
+                        last_write = time.time()
+                if state != last_state:
+                    self._write_event("status", {"job_id": job["job_id"], "state": state})
+                    last_state = state
+                    last_write = time.time()
+                if state not in ACTIVE_STATES:
+                    self._write_event("done", service.describe(job, with_pages=False))
+                    return
+                if time.time() - last_write >= 15:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    last_write = time.time()
+                time.sleep(config.SERVICE_STREAM_POLL_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端断开
+
+
+def main():
+    Logger.separator('=', 50)
+    Logger.plain("[START] AI 论文翻译服务启动")
+    Logger.separator('=', 50)
+
+    service = TranslationService()
+    service.start()
+    server = ThreadingHTTPServer((config.SERVICE_HOST, config.SERVICE_PORT), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    def handle_signal(signum, frame):
+        if not service.stop_event.is_set():
+            Logger.warning(f"收到信号 {signum}，完成进行中的页面后退出...")
+            service.stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+    threading.Thread(target=server.serve_forever, name="service-http", daemon=True).start()
+    Logger.info(f"翻译服务已启动: http://{config.SERVICE_HOST}:{config.SERVICE_PORT} (按 Ctrl+C 退出)")
+    try:
+        while not service.stop_event.wait(1):
+            pass
+    finally:
+        server.shutdown()
+        service.shutdown()
+        Logger.plain()
+        Logger.separator('=', 50)
+        Logger.plain("[END] 翻译服务已退出。")
+        Logger.separator('=', 50)
+        finish_run(service.stats_manager)
+
+
+if __name__ == "__main__":
+    main()
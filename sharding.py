@@ -0,0 +1,73 @@
+# sharding.py
+"""
+大文档 (书籍、学位论文) 按目录切分为章节: 每个章节的首页不依赖上一页的上下文，
+因此不同章节可以并行翻译，章节内部仍按页顺序衔接上下文；合并时按顺序拼接并插入章节标题。
+没有目录 (或目录过于粗糙) 时按固定页数窗口切分。
+"""
+import config
+from utils import Logger
+from job_store import DONE, FAILED
+
+
+def _toc_chapters(toc, num_pages, level):
+    """取目录中指定层级的条目作为章节起点，返回 [(标题, 起始页索引)]"""
+    starts = []
+    for entry_level, title, page in toc:
+        if entry_level != level or page < 1 or page > num_pages:
+            continue
+        if starts and starts[-1][1] >= page - 1:
+            continue  # 同一页上的多个条目只取第一个，并保证页码递增
+        starts.append((title.strip() or f"第 {len(starts) + 1} 章", page - 1))
+    return starts
+
+
+def plan_shards(pdf_path, num_pages):
+    """
+    规划章节切分，页数低于 SHARD_PAGE_THRESHOLD 时返回空列表 (不切分)。
+    返回: [{"title": str, "start_page": int, "end_page": int}, ...] (页码为 0 起始的闭区间)
+    """
+    if num_pages < config.SHARD_PAGE_THRESHOLD:
+        return []
+
+    import fitz  # PyMuPDF (延迟导入，缩短启动时间)
+    with fitz.open(pdf_path) as doc:
+        toc = doc.get_toc(simple=True)
+
+    starts = _toc_chapters(toc, num_pages, config.SHARD_TOC_LEVEL)
+    if len(starts) < 2:
+        # 顶层只有一个条目 (通常是书名) 时尝试下一层
+        starts = _toc_chapters(toc, num_pages, config.SHARD_TOC_LEVEL + 1)
+    if len(starts) < 2:
+        window = config.SHARD_WINDOW_PAGES
+        starts = [(f"第 {i // window + 1} 部分 (第 {i + 1}-{min(i + window, num_pages)} 页)", i)
+                  for i in range(0, num_pages, window)]
+    elif starts[0][1] > 0:
+        starts.insert(0, ("前言", 0))
+
+    # 过短的章节并入上一章
+    merged = []
+    for idx, (title, start) in enumerate(starts):
+        end = starts[idx + 1][1] - 1 if idx + 1 < len(starts) else num_pages - 1
+        if merged and end - start + 1 < config.SHARD_MIN_PAGES:
+            merged[-1]["end_page"] = end
+            continue
+        merged.append({"title": title, "start_page": start, "end_page": end})
+    if len(merged) > 1 and merged[0]["end_page"] - merged[0]["start_page"] + 1 < config.SHARD_MIN_PAGES:
+        front = merged.pop(0)  # 过短的前言并入第一章
+        merged[0]["start_page"] = front["start_page"]
+    return merged if len(merged) > 1 else []
+
+
+def apply_sharding(job_store, paper_id, pdf_path, num_pages):
+    """为论文规划并登记章节 (已开始翻译的论文保持原有切分)，返回章节列表"""
+    existing = job_store.get_chapters(paper_id)
+    if existing or not config.SHARDING_ENABLED:
+        return existing
+    counts = job_store.paper_status_counts(paper_id)
+    if counts.get(DONE, 0) or counts.get(FAILED, 0):
+        return []
+    chapters = plan_shards(pdf_path, num_pages)
+    if chapters:
+        job_store.set_chapters(paper_id, chapters)
+        Logger.info(f"文档共 {num_pages} 页，切分为 {len(chapters)} 个章节并行翻译。", indent=2)
+    return chapters
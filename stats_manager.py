@@ -1,17 +1,33 @@
 # stats_manager.py
 import os
+import copy
 import json
+import math
 import time
+import threading
 from datetime import datetime
 
+
+def _percentile(values, pct):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
 class StatsManager:
     def __init__(self, output_dir):
-        self.start_time = time.time()
+        self._lock = threading.Lock()  # 分片、修复线程与 KeyPool 会并发更新计数
         self.error_log_dir = os.path.join(output_dir, 'error_logs')
         self.summary_dir = os.path.join(output_dir, 'summaries')
         os.makedirs(self.error_log_dir, exist_ok=True)
         os.makedirs(self.summary_dir, exist_ok=True)
+        self._init_counters()
 
+    def _init_counters(self):
+        self.start_time = time.time()
         self.stats = {
             "total_papers": 0,
             "model_usage": {
@@ -22,18 +38,41 @@ class StatsManager:
             }
         }
         self.page_times = []
+        self.page_records = []  # 每页 (耗时, 是否成功, 模型)，写入跨运行的性能历史
+        self.api_calls = []  # 每次 API 调用 (模型, 是否成功, 耗时, 开始时间)
         self.paper_times = []
+        self.token_usage = {}  # 每个模型的实际用量与选择时的预估用量，用于对账
+        self.startup_seconds = None  # 进程启动到可以开始翻译的耗时
+        self.key_usage = {}  # 服务商 -> Key (末 4 位) -> 用量
+        self.skipped_pages = {"blank": 0, "duplicate": 0}  # 缩略图预检跳过的页数
+        self.render_dpis = {}  # 渲染 DPI -> 页数
+        self.rendered_pixels = 0
+        self.continuations = {}  # 模型 -> 输出被截断后的续写次数
+        self.deadline_misses = 0  # 单页时间预算用尽而失败的页数
+        self.uploads = {"request_bytes": 0, "file_bytes": 0, "files": 0, "files_reused": 0}  # 发往服务商的数据量
+
+    def has_records(self):
+        return bool(self.page_records or self.api_calls)
+
+    def rotate(self):
+        """
+        结束当前统计区间: 返回持有已记录数据的副本，自身清零后继续记录。
+        长期运行的守护进程用它定期落盘，避免内存无限增长、崩溃时丢失全部统计
+        """
+        with self._lock:
+            snapshot = copy.copy(self)
+            self._init_counters()
+        snapshot._lock = threading.Lock()
+        return snapshot
 
     def log_api_call(self, model_name, success, duration, request_details=None, response_details=None):
         """记录一次API调用及其结果"""
-        if model_name not in self.stats["model_usage"]:
+        with self._lock:
+            self.api_calls.append((model_name, success, duration, time.time() - duration))
             # 以防万一有未预设的模型名称
-            self.stats["model_usage"][model_name] = {"success": 0, "failure": 0}
-
-        if success:
-            self.stats["model_usage"][model_name]["success"] += 1
-        else:
-            self.stats["model_usage"][model_name]["failure"] += 1
+            usage = self.stats["model_usage"].setdefault(model_name, {"success": 0, "failure": 0})
+            usage["success" if success else "failure"] += 1
+        if not success:
             self._log_detailed_error(model_name, duration, request_details, response_details)
 
     def _log_detailed_error(self, model_name, duration, request_details, response_details):
@@ -51,15 +90,95 @@ class StatsManager:
             f.write(str(response_details))
             f.write("\n")
 
-    def record_page_time(self, duration):
-        self.page_times.append(duration)
+    def _usage_entry(self, model_name):
+        """需持有 self._lock"""
+        if model_name not in self.token_usage:
+            self.token_usage[model_name] = {
+                "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "cost": 0.0,
+                "estimated_input_tokens": 0, "estimated_output_tokens": 0, "estimated_cost": 0.0,
+            }
+        return self.token_usage[model_name]
+
+    def record_usage(self, model_name, input_tokens, output_tokens, cost, cached_tokens=0):
+        """记录服务端返回的实际 token 用量与费用 (cached_tokens 为输入中命中服务端缓存的部分)"""
+        with self._lock:
+            entry = self._usage_entry(model_name)
+            entry["input_tokens"] += input_tokens
+            entry["cached_input_tokens"] += cached_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost"] += cost
+
+    def record_usage_estimate(self, model_name, input_tokens, output_tokens, cost):
+        """记录模型选择时的预估用量"""
+        with self._lock:
+            entry = self._usage_entry(model_name)
+            entry["estimated_input_tokens"] += input_tokens
+            entry["estimated_output_tokens"] += output_tokens
+            entry["estimated_cost"] += cost
+
+    def record_page_time(self, duration, success=True, model_name=None):
+        with self._lock:
+            self.page_times.append(duration)
+            self.page_records.append((duration, success, model_name))
 
     def record_paper_time(self, duration):
-        self.paper_times.append(duration)
-        self.stats["total_papers"] += 1
+        with self._lock:
+            self.paper_times.append(duration)
+            self.stats["total_papers"] += 1
+
+    def record_key_usage(self, provider, key_label, success, latency=None, disabled_reason=None):
+        """记录单个 API Key 的一次调用"""
+        with self._lock:
+            usage = self.key_usage.setdefault(provider, {}).setdefault(
+                key_label, {"requests": 0, "success": 0, "failure": 0, "total_latency": 0.0, "disabled": None})
+            usage["requests"] += 1
+            usage["success" if success else "failure"] += 1
+            usage["total_latency"] += latency or 0.0
+            if disabled_reason:
+                usage["disabled"] = disabled_reason
+            elif success:
+                usage["disabled"] = None
+
+    def record_page_skip(self, reason):
+        with self._lock:
+            self.skipped_pages[reason] = self.skipped_pages.get(reason, 0) + 1
+
+    def record_continuation(self, model_name):
+        with self._lock:
+            self.continuations[model_name] = self.continuations.get(model_name, 0) + 1
+
+    def record_deadline_miss(self):
+        with self._lock:
+            self.deadline_misses += 1
+
+    def record_request_bytes(self, size):
+        with self._lock:
+            self.uploads["request_bytes"] += size
+
+    def record_file_upload(self, size, reused=False):
+        """记录一次页面图片上传 (reused 为 True 表示复用了已上传的文件)"""
+        with self._lock:
+            if reused:
+                self.uploads["files_reused"] += 1
+            else:
+                self.uploads["files"] += 1
+                self.uploads["file_bytes"] += size
+
+    def record_render(self, dpi, pixels):
+        with self._lock:
+            self.render_dpis[dpi] = self.render_dpis.get(dpi, 0) + 1
+            self.rendered_pixels += pixels
+
+    def record_startup_time(self, duration):
+        self.startup_seconds = duration
 
     def generate_summary(self):
-        """生成包含所有统计数据的字典"""
+        """生成包含所有统计数据的字典 (深拷贝，之后的更新不会影响已生成的摘要)"""
+        with self._lock:
+            return copy.deepcopy(self._generate_summary())
+
+    def _generate_summary(self):
+        """需持有 self._lock"""
         end_time = time.time()
         total_duration = end_time - self.start_time
         total_pages = len(self.page_times)
@@ -69,12 +188,32 @@ class StatsManager:
                 "start_time": datetime.fromtimestamp(self.start_time).isoformat(),
                 "end_time": datetime.fromtimestamp(end_time).isoformat(),
                 "total_duration_seconds": total_duration,
+                "startup_seconds": self.startup_seconds,
                 "translated_papers": self.stats["total_papers"],
                 "translated_pages": total_pages,
+                "skipped_pages": dict(self.skipped_pages),
+                "deadline_misses": self.deadline_misses,
                 "avg_time_per_paper_seconds": sum(self.paper_times) / len(self.paper_times) if self.paper_times else 0,
                 "avg_time_per_page_seconds": sum(self.page_times) / total_pages if total_pages else 0,
+                "pages_per_minute": total_pages / total_duration * 60 if total_duration > 0 else 0,
+                "page_time_percentiles_seconds": {
+                    "p50": _percentile(self.page_times, 50),
+                    "p90": _percentile(self.page_times, 90),
+                    "p99": _percentile(self.page_times, 99),
+                    "max": max(self.page_times) if self.page_times else 0,
+                },
             },
-            "model_usage_stats": self.stats["model_usage"]
+            "model_usage_stats": self.stats["model_usage"],
+            "token_usage_stats": self.token_usage,
+            "key_usage_stats": self.key_usage,
+            "continuations": dict(self.continuations),
+            "upload_stats": dict(self.uploads),
+            "render_stats": {
+                "pages": sum(self.render_dpis.values()),
+                "dpi_histogram": {str(dpi): count for dpi, count in sorted(self.render_dpis.items())},
+                "total_megapixels": self.rendered_pixels / 1e6,
+            },
+            "total_cost": sum(u["cost"] for u in self.token_usage.values()),
         }
         return summary
 
@@ -101,9 +240,21 @@ class StatsManager:
             "="*60,
             f"  论文翻译总数: {exec_summary['translated_papers']} 篇",
             f"  页面翻译总数: {exec_summary['translated_pages']} 页",
+            f"  预检跳过页数: 空白 {exec_summary['skipped_pages'].get('blank', 0)} 页 / "
+            f"重复 {exec_summary['skipped_pages'].get('duplicate', 0)} 页",
+            f"  超出单页时间预算: {exec_summary['deadline_misses']} 页",
             f"  总耗时: {total_duration_str}",
+            f"  渲染: {summary_data['render_stats']['pages']} 页，共 {summary_data['render_stats']['total_megapixels']:.1f} 百万像素，"
+            f"DPI 分布 {summary_data['render_stats']['dpi_histogram']}",
+            f"  上传数据量: 请求体 {summary_data['upload_stats']['request_bytes'] / 1e6:.1f} MB，"
+            f"文件 {summary_data['upload_stats']['file_bytes'] / 1e6:.1f} MB "
+            f"({summary_data['upload_stats']['files']} 个，复用 {summary_data['upload_stats']['files_reused']} 次)",
+            f"  启动耗时: {exec_summary['startup_seconds'] * 1000:.0f} 毫秒" if exec_summary['startup_seconds'] is not None else "  启动耗时: 未记录",
             f"  平均每篇论文耗时: {exec_summary['avg_time_per_paper_seconds']:.2f} 秒",
             f"  平均每页翻译耗时: {exec_summary['avg_time_per_page_seconds']:.2f} 秒",
+            f"  每页耗时 P50/P90/P99: {exec_summary['page_time_percentiles_seconds']['p50']:.2f} / "
+            f"{exec_summary['page_time_percentiles_seconds']['p90']:.2f} / "
+            f"{exec_summary['page_time_percentiles_seconds']['p99']:.2f} 秒",
             "-"*60,
             " " * 22 + "模型使用统计",
             "-"*60,
@@ -116,6 +267,30 @@ class StatsManager:
                 lines.append(f"    - 总调用: {total} 次")
                 lines.append(f"    - 成功: {usage['success']} 次")
                 lines.append(f"    - 失败: {usage['failure']} 次")
-        
+                if summary_data["continuations"].get(model):
+                    lines.append(f"    - 截断续写: {summary_data['continuations'][model]} 次")
+
+        if summary_data["token_usage_stats"]:
+            lines.append("-"*60)
+            lines.append(" " * 22 + "Token 用量 (实际 / 预估)")
+            lines.append("-"*60)
+            for model, usage in summary_data["token_usage_stats"].items():
+                lines.append(f"  模型: {model}")
+                lines.append(f"    - 输入: {usage['input_tokens']} / {usage['estimated_input_tokens']}"
+                             f" (命中缓存 {usage['cached_input_tokens']})")
+                lines.append(f"    - 输出: {usage['output_tokens']} / {usage['estimated_output_tokens']}")
+                lines.append(f"    - 费用: ${usage['cost']:.4f} / ${usage['estimated_cost']:.4f}")
+            lines.append(f"  总费用: ${summary_data['total_cost']:.4f}")
+
+        # 只有某个服务商配置了多个 Key 时才打印分 Key 统计
+        if any(len(keys) > 1 for keys in summary_data["key_usage_stats"].values()):
+            lines.append("-"*60)
+            lines.append(" " * 22 + "API Key 使用统计")
+            lines.append("-"*60)
+            for provider, keys in summary_data["key_usage_stats"].items():
+                for label, usage in keys.items():
+                    status = f" [已停用: {usage['disabled']}]" if usage["disabled"] else ""
+                    lines.append(f"  {provider} {label}: {usage['success']}/{usage['requests']} 成功{status}")
+
         lines.append("="*60)
         return "\n".join(lines)
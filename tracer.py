@@ -0,0 +1,127 @@
+# tracer.py
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+import config
+
+
+class Tracer:
+    """轻量级分段计时器，可导出为 Chrome trace-event JSON (可用 Perfetto / chrome://tracing 打开)"""
+
+    def __init__(self, enabled=True, max_events=200000):
+        self.enabled = enabled
+        self.max_events = max_events
+        self.dropped_events = 0
+        self._lock = threading.Lock()
+        self._events = []  # (name, cat, start, duration, tid, args)，导出时再转换，热路径只做一次 append
+        self._thread_names = {}
+        self._epoch = time.perf_counter()
+        self._wall_epoch = time.time()
+
+    @contextmanager
+    def span(self, name, cat="pipeline", **args):
+        """
+        记录一个耗时区间。yield 出的字典可在区间内补充参数，例如实际服务的 provider。
+        用法: with tracer.span("attempt", provider="gemini") as s: s["ok"] = True
+        """
+        if not self.enabled:
+            yield {}
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self._append(name, cat, start, time.perf_counter() - start, args)
+
+    def add_span(self, name, start, duration, cat="pipeline", **args):
+        """补录一个已知起止时间的区间 (start 为 time.perf_counter() 的值)"""
+        if self.enabled:
+            self._append(name, cat, start, duration, args)
+
+    def instant(self, name, cat="pipeline", **args):
+        """记录一个瞬时事件 (如降级、锁定模型)"""
+        if self.enabled:
+            self._append(name, cat, time.perf_counter(), None, args)
+
+    def _append(self, name, cat, start, duration, args):
+        tid = threading.get_ident()
+        with self._lock:
+            full = len(self._events) >= self.max_events
+            if full:
+                self.dropped_events += 1
+                first_drop = self.dropped_events == 1
+            else:
+                if tid not in self._thread_names:
+                    self._thread_names[tid] = threading.current_thread().name
+                self._events.append((name, cat, start, duration, tid, args))
+        if full and first_drop:
+            from utils import Logger  # utils 导入了 tracer，这里延迟导入避免循环依赖
+            Logger.warning(f"追踪事件已达上限 TRACE_MAX_EVENTS={self.max_events}，之后的事件将被丢弃"
+                           f" (导出的 trace 中 dropped_events 记录丢弃数量)。")
+
+    def clear(self):
+        """清空已记录的事件 (用于同一进程内多次运行，如基准测试)"""
+        with self._lock:
+            self._events = []
+            self.dropped_events = 0
+        self._epoch = time.perf_counter()
+        self._wall_epoch = time.time()
+
+    def has_events(self):
+        return bool(self._events)
+
+    def to_chrome_trace(self, rotate=False):
+        """转换为 Chrome trace-event 格式的字典；rotate 为 True 时同时清空已导出的事件 (时间基准不变)"""
+        pid = os.getpid()
+        trace_events = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "pdf-trans"}}
+        ]
+        with self._lock:
+            thread_names = list(self._thread_names.items())
+            events = list(self._events)
+            dropped_events = self.dropped_events
+            if rotate:
+                self._events = []
+                self.dropped_events = 0
+        for tid, thread_name in thread_names:
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+
+        for name, cat, start, duration, tid, args in events:
+            event = {
+                "name": name,
+                "cat": cat,
+                "ts": (start - self._epoch) * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {k: v if isinstance(v, (str, int, float, bool)) or v is None else str(v) for k, v in args.items()},
+            }
+            if duration is None:
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = duration * 1e6
+            trace_events.append(event)
+
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "start_time": self._wall_epoch,
+                "dropped_events": dropped_events,
+            },
+        }
+
+    def export_chrome_trace(self, file_path, rotate=False):
+        """将所有记录写入 Chrome trace-event JSON 文件"""
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        trace = self.to_chrome_trace(rotate)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False)
+        return file_path
+
+
+# 全局追踪器实例
+tracer = Tracer(enabled=config.TRACE_ENABLED, max_events=config.TRACE_MAX_EVENTS)
@@ -4,51 +4,204 @@ import sys
 import time
 import json
 import base64
-import mimetypes
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from colorama import Fore, Style, init
+from tracer import tracer
+from page_store import read_page, page_mime_type, page_filename, PDF_MIME_TYPE
 
 # Initialize Colorama
 init(autoreset=True)
 
+# 日志级别 (数值越大越重要)，LOG_LEVEL 以下的消息在入队前直接丢弃
+LOG_LEVELS = {"API": 10, "INFO": 20, "SUCCESS": 20, "PLAIN": 20, "RETRY": 25, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+LOG_COLORS = {
+    "API": Fore.BLUE, "INFO": Fore.CYAN, "SUCCESS": Fore.GREEN, "RETRY": Fore.MAGENTA,
+    "WARNING": Fore.YELLOW, "ERROR": Fore.RED, "CRITICAL": Fore.RED + Style.BRIGHT,
+}
+
+
+class _LogWriter:
+    """
+    日志写线程: 调用线程只把 (时间戳, 级别, 消息, 缩进, 字段) 放入队列，
+    时间格式化、着色、JSON 序列化与输出都在单独的线程中完成，各行之间不会交错。
+    """
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.RLock()
+        self.thread = None
+        self.pid = None
+        self.file = None
+        self.configured = False
+
+    def configure(self, level=None, fmt=None, quiet=None, log_file=None, async_mode=None):
+        import config
+        self.flush()
+        with self.lock:
+            self.level = LOG_LEVELS.get(str(level or config.LOG_LEVEL).upper(), LOG_LEVELS["INFO"])
+            self.fmt = fmt or config.LOG_FORMAT
+            self.quiet = config.LOG_QUIET if quiet is None else quiet
+            self.async_mode = config.LOG_ASYNC if async_mode is None else async_mode
+            log_file = config.LOG_FILE if log_file is None else log_file
+            if self.file:
+                self.file.close()
+            self.file = None
+            if log_file:
+                os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+                self.file = open(log_file, "a", encoding="utf-8")
+            self.configured = True
+
+    def emit(self, level, msg, indent, fields):
+        if not self.configured:
+            with self.lock:
+                if not self.configured:
+                    self.configure()
+        if LOG_LEVELS[level] < self.level:
+            return
+        context = getattr(_log_context, "fields", None)
+        if context:
+            fields = {**context, **fields}
+        record = (time.time(), level, msg, indent, fields, threading.current_thread().name)
+        if not self.async_mode:
+            with self.lock:
+                self._write(record)
+            return
+        if self.pid != os.getpid():
+            self._start()
+        self.queue.put(record)
+
+    def _start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if isinstance(record, threading.Event):
+                sys.stdout.flush()
+                if self.file:
+                    self.file.flush()
+                record.set()
+                continue
+            try:
+                self._write(record)
+            except Exception:
+                pass  # 日志输出失败 (例如控制台已关闭) 不影响翻译
+
+    def _json_line(self, record):
+        ts, level, msg, indent, fields, thread_name = record
+        entry = {"ts": datetime.fromtimestamp(ts).isoformat(timespec="milliseconds"), "level": level, "msg": msg}
+        entry.update(fields)
+        entry["thread"] = thread_name
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    def _write(self, record):
+        ts, level, msg, indent = record[:4]
+        if self.file:
+            self.file.write(self._json_line(record) + "\n")
+        if self.quiet and LOG_LEVELS[level] < LOG_LEVELS["WARNING"]:
+            return
+        if self.fmt == "json":
+            line = self._json_line(record)
+        elif level == "PLAIN":
+            line = msg
+        else:
+            timestamp = datetime.fromtimestamp(ts).strftime('%H:%M:%S')
+            line = f"{LOG_COLORS[level]}{timestamp} {'  ' * indent}[{level}] {msg}{Style.RESET_ALL}"
+        sys.stdout.write(line + "\n")
+
+    def flush(self, timeout=5):
+        """等待队列中已有的日志全部输出"""
+        if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+
+_log_context = threading.local()
+_writer = _LogWriter()
+atexit.register(_writer.flush)
+
+
 class Logger:
     @staticmethod
-    def _format_message(msg_type, msg, color, indent):
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        prefix = "  " * indent
-        return f"{color}{timestamp} {prefix}[{msg_type}] {msg}{Style.RESET_ALL}"
+    def configure(level=None, fmt=None, quiet=None, log_file=None, async_mode=None):
+        """设置日志级别、控制台格式 (text / json)、安静模式与 JSON Lines 日志文件，未指定的项使用 config"""
+        _writer.configure(level, fmt, quiet, log_file, async_mode)
+
+    @staticmethod
+    def flush():
+        _writer.flush()
+
+    @staticmethod
+    @contextmanager
+    def bind(**fields):
+        """在当前线程内为之后的日志附加字段 (例如 paper、page、provider)，JSON 输出中可见"""
+        previous = getattr(_log_context, "fields", None)
+        _log_context.fields = {**(previous or {}), **fields}
+        try:
+            yield
+        finally:
+            _log_context.fields = previous
+
+    @staticmethod
+    def plain(msg="", **fields):
+        """不带时间与级别前缀的输出 (启动横幅、执行摘要)"""
+        _writer.emit("PLAIN", msg, 0, fields)
 
     @staticmethod
     def separator(char='-', length=50):
-        print(char * length)
+        _writer.emit("PLAIN", char * length, 0, {})
 
     @staticmethod
-    def info(msg, indent=0):
-        print(Logger._format_message("INFO", msg, Fore.CYAN, indent))
+    def info(msg, indent=0, **fields):
+        _writer.emit("INFO", msg, indent, fields)
 
     @staticmethod
-    def success(msg, indent=0):
-        print(Logger._format_message("SUCCESS", msg, Fore.GREEN, indent))
+    def success(msg, indent=0, **fields):
+        _writer.emit("SUCCESS", msg, indent, fields)
 
     @staticmethod
-    def warning(msg, indent=0):
-        print(Logger._format_message("WARNING", msg, Fore.YELLOW, indent))
+    def warning(msg, indent=0, **fields):
+        _writer.emit("WARNING", msg, indent, fields)
 
     @staticmethod
-    def error(msg, indent=0):
-        print(Logger._format_message("ERROR", msg, Fore.RED, indent))
+    def error(msg, indent=0, **fields):
+        _writer.emit("ERROR", msg, indent, fields)
 
     @staticmethod
-    def api_log(msg, indent=0):
-        print(Logger._format_message("API", msg, Fore.BLUE, indent))
+    def api_log(msg, indent=0, **fields):
+        _writer.emit("API", msg, indent, fields)
 
     @staticmethod
-    def retry_log(msg, indent=0):
-        print(Logger._format_message("RETRY", msg, Fore.MAGENTA, indent))
+    def retry_log(msg, indent=0, **fields):
+        _writer.emit("RETRY", msg, indent, fields)
 
     @staticmethod
-    def critical(msg, indent=0):
-        print(Logger._format_message("CRITICAL", msg, Fore.RED + Style.BRIGHT, indent))
+    def critical(msg, indent=0, **fields):
+        _writer.emit("CRITICAL", msg, indent, fields)
+
+
+def add_log_arguments(parser):
+    """为命令行入口添加日志参数，解析后调用 configure_logging(args)"""
+    parser.add_argument("--log-level", default=None, choices=sorted(set(LOG_LEVELS) - {"PLAIN"}),
+                        help="日志级别 (默认 config.LOG_LEVEL)")
+    parser.add_argument("--log-format", default=None, choices=["text", "json"], help="控制台输出格式")
+    parser.add_argument("--log-file", default=None, help="同时以 JSON Lines 写入该文件")
+    parser.add_argument("--quiet", action="store_true", default=None, help="安静模式: 控制台只输出警告与错误")
+
+
+def configure_logging(args):
+    Logger.configure(level=args.log_level, fmt=args.log_format, quiet=args.quiet, log_file=args.log_file)
 
 
 def ensure_directories(paths):
@@ -57,19 +210,25 @@ def ensure_directories(paths):
             os.makedirs(path)
 
 
-def image_to_base64(image_path):
-    """将图片文件转换为 Base64 编码的字符串"""
+def image_to_base64(image_path, rasterize_pdf=False):
+    """
+    将图片文件 (或页面容器引用) 转换为 Base64 编码的字符串。
+    rasterize_pdf 为 True 时，原生 PDF 模式的单页 PDF 先渲染为 PNG (用于不支持 PDF 输入的模型)
+    """
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        data = read_page(image_path)
+        if rasterize_pdf and page_mime_type(image_path) == PDF_MIME_TYPE:
+            from pdf_processor import rasterize_page  # 延迟导入 (pdf_processor 依赖本模块)
+            data = rasterize_page(image_path)
+        with tracer.span("base64_encode", image=page_filename(image_path)):
+            return base64.b64encode(data).decode('utf-8')
     except Exception as e:
         Logger.error(f"读取图片失败: {e}")
         return None
 
 
 def get_mime_type(image_path):
-    mime_type, _ = mimetypes.guess_type(image_path)
-    return mime_type or "application/octet-stream"
+    return page_mime_type(image_path)
 
 
 def extract_last_sentences(text, num_sentences=2):
@@ -94,15 +253,20 @@ def extract_last_sentences(text, num_sentences=2):
     return ".".join(sentences[-num_sentences:]) + "."
 
 
-def save_progress(folder_path, data):
-    """保存翻译进度到JSON文件"""
-    file_path = os.path.join(folder_path, "progress.json")
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def stitch_continuation(text, piece, min_overlap=6, max_overlap=200):
+    """
+    拼接续写内容: 模型有时会重复截断处的几个字，去掉与前文末尾重叠的部分。
+    取最短的重叠 (不少于 min_overlap 个字符)，避免在表格等重复性内容上误删。
+    """
+    piece = piece or ""
+    for size in range(min_overlap, min(max_overlap, len(text), len(piece)) + 1):
+        if text.endswith(piece[:size]):
+            return text + piece[size:]
+    return text + piece
 
 
 def load_progress(folder_path):
-    """加载翻译进度"""
+    """加载旧版 progress.json 翻译进度 (仅用于导入任务队列)"""
     file_path = os.path.join(folder_path, "progress.json")
     if os.path.exists(file_path):
         try:
@@ -0,0 +1,139 @@
+# versioning.py
+"""
+论文新版本 (如 arXiv v2、v3) 的增量翻译: 按 arXiv ID 或标题匹配已翻译的旧版本，
+比较每页文字层指纹与渲染图片指纹，未变化的页面 (即使页码发生偏移) 直接复用旧译文，
+只有变化的页面才会被发送给模型。
+"""
+import re
+import hashlib
+import config
+from utils import Logger
+from job_store import DONE, PENDING
+from page_store import read_page
+
+ARXIV_ID_PATTERN = re.compile(r'(?:arXiv:)?(\d{4}\.\d{4,5})(v\d+)?', re.IGNORECASE)
+# arXiv 在首页侧边加的水印，例如 "arXiv:2101.00001v2 [cs.LG] 3 Feb 2021"
+ARXIV_STAMP_PATTERN = re.compile(r'arXiv:\d{4}\.\d{4,5}v\d+\s*\[[^\]]*\][^\n]*', re.IGNORECASE)
+
+
+def normalize_title(title):
+    """小写并去掉非字母数字字符，长度不足时返回 None"""
+    key = re.sub(r'[\W_]+', '', (title or "").lower())
+    return key if len(key) >= config.VERSION_MATCH_MIN_TITLE_CHARS else None
+
+
+def _guess_title(doc):
+    """优先使用 PDF 元数据中的标题，否则取首页字号最大的文字"""
+    title = (doc.metadata or {}).get("title", "")
+    if normalize_title(title):
+        return title
+    if doc.page_count == 0:
+        return None
+    spans = [span for block in doc[0].get_text("dict")["blocks"] for line in block.get("lines", [])
+             for span in line["spans"] if span["text"].strip()]
+    if not spans:
+        return None
+    largest = max(span["size"] for span in spans)
+    return " ".join(span["text"].strip() for span in spans if span["size"] >= largest - 0.5)
+
+
+def paper_identity(pdf_path):
+    """
+    识别论文: 文件名或首页文字中的 arXiv ID (不含版本号) 与规范化标题
+    返回: {"arxiv_id": str|None, "title_key": str|None}
+    """
+    import fitz  # PyMuPDF (延迟导入，缩短启动时间)
+    with fitz.open(pdf_path) as doc:
+        first_page_text = doc[0].get_text("text") if doc.page_count else ""
+        title = _guess_title(doc)
+    match = ARXIV_ID_PATTERN.search(pdf_path.replace("\\", "/").rsplit("/", 1)[-1]) or \
+        ARXIV_ID_PATTERN.search(first_page_text)
+    return {"arxiv_id": match.group(1) if match else None, "title_key": normalize_title(title)}
+
+
+def _normalize_page_text(text):
+    """去掉 arXiv 水印和只有数字的行 (页码)，压缩空白，使页码偏移不影响指纹"""
+    text = ARXIV_STAMP_PATTERN.sub("", text)
+    lines = [line.strip() for line in text.splitlines()]
+    return " ".join(line for line in lines if line and not line.isdigit())
+
+
+def page_fingerprints(pdf_path, image_paths):
+    """
+    计算每页指纹:
+      text_hash   - 规范化文字层 + 嵌入图片摘要的 SHA-1 (无文字层的扫描页为 None)
+      render_hash - 渲染图片的 SHA-1
+    """
+    import fitz
+    fingerprints = []
+    with fitz.open(pdf_path) as doc:
+        for page_idx, page in enumerate(doc):
+            text = _normalize_page_text(page.get_text("text"))
+            text_hash = None
+            if text:
+                digest = hashlib.sha1(text.encode("utf-8"))
+                for info in sorted(page.get_image_info(hashes=True), key=lambda i: i.get("digest") or b""):
+                    digest.update(info.get("digest") or b"")
+                text_hash = digest.hexdigest()
+            render_hash = None
+            if page_idx < len(image_paths):
+                render_hash = hashlib.sha1(read_page(image_paths[page_idx])).hexdigest()
+            fingerprints.append({"text_hash": text_hash, "render_hash": render_hash})
+    return fingerprints
+
+
+def match_pages(old_pages, new_fingerprints):
+    """
+    将新版本的页面匹配到旧版本中内容相同的页面。
+    文字层指纹相同即视为未变化 (渲染指纹用于无文字层的页面)；同一指纹出现多次时，
+    选择最接近当前偏移量的旧页面，以处理插入/删除页面导致的整体偏移。
+    返回: {新页码索引: 旧页码索引}
+    """
+    candidates = {}
+    for page in old_pages:
+        key = page["text_hash"] or (page["render_hash"] and f"r:{page['render_hash']}")
+        if key and page["status"] == DONE:
+            candidates.setdefault(key, []).append(page["page_idx"])
+
+    mapping, used, offset = {}, set(), 0
+    for new_idx, fp in enumerate(new_fingerprints):
+        key = fp["text_hash"] or (fp["render_hash"] and f"r:{fp['render_hash']}")
+        options = [old_idx for old_idx in candidates.get(key, []) if old_idx not in used]
+        if not options:
+            continue
+        old_idx = min(options, key=lambda idx: abs(idx - (new_idx + offset)))
+        mapping[new_idx] = old_idx
+        used.add(old_idx)
+        offset = old_idx - new_idx
+    return mapping
+
+
+def prepare_paper_version(job_store, paper_id, pdf_path, image_paths):
+    """
+    记录论文身份与页面指纹；若该论文尚未开始翻译且存在已翻译的旧版本，复用未变化页面的译文。
+    返回: 复用的页数
+    """
+    identity = paper_identity(pdf_path)
+    fingerprints = page_fingerprints(pdf_path, image_paths)
+    job_store.set_paper_identity(paper_id, identity["title_key"], identity["arxiv_id"])
+    job_store.set_page_fingerprints(paper_id, fingerprints)
+
+    pages = job_store.get_pages(paper_id)
+    if any(page["status"] != PENDING for page in pages):
+        return 0
+    previous = job_store.find_previous_version(paper_id, identity["arxiv_id"], identity["title_key"])
+    if previous is None:
+        return 0
+
+    old_pages = job_store.get_pages(previous["id"])
+    mapping = match_pages(old_pages, fingerprints)
+    # 先读出全部旧译文再写入，新旧版本的结果文件路径可能重叠
+    reused = {new_idx: job_store.read_result(old_pages[old_idx], placeholder=False) for new_idx, old_idx in mapping.items()}
+    for new_idx, text in sorted(reused.items()):
+        if text is not None:
+            job_store.complete_page(paper_id, new_idx, None, text,
+                                    provider=f"reused:{previous['name']}#{mapping[new_idx] + 1}")
+    count = sum(1 for text in reused.values() if text is not None)
+    Logger.info(f"匹配到旧版本 \"{previous['name']}\"，复用 {count}/{len(image_paths)} 页译文，"
+                f"仅翻译变化的 {len(image_paths) - count} 页。", indent=2)
+    return count
@@ -0,0 +1,224 @@
+# worker.py
+"""
+远程翻译 worker: 向协调服务 (coordinator.py) 注册后循环领取页面租约，
+调用 AIHandler.translate_page 翻译并回传结果；后台线程定期心跳续租。
+收到 Ctrl+C / SIGTERM 后完成进行中的页面再退出。
+
+用法:
+    COORDINATOR_URL=http://<协调服务地址>:8700 python worker.py --threads 2 --name gpu-box
+"""
+import os
+import sys
+import time
+import base64
+import signal
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import requests
+import config
+from utils import Logger, add_log_arguments, configure_logging
+from ai_handler import AIHandler
+from stats_manager import StatsManager
+from main import pre_flight_checks, finish_run, record_startup
+
+
+class CoordinatorClient:
+    """协调服务的 HTTP 客户端，worker 未注册 (协调服务重启) 时自动重新注册"""
+
+    def __init__(self, base_url, name):
+        self.base_url = base_url.rstrip("/")
+        self.name = name
+        self.session = requests.Session()
+        if config.COORDINATOR_TOKEN:
+            self.session.headers["X-Coordinator-Token"] = config.COORDINATOR_TOKEN
+        self.worker_id = None
+        self.heartbeat_interval = config.WORKER_HEARTBEAT_INTERVAL
+        self._lock = threading.Lock()
+
+    def register(self):
+        # 重新注册时带上原 ID，已领取页面的租约仍归本 worker，翻译结果不会因租约校验被拒绝
+        response = self.session.post(f"{self.base_url}/workers/register",
+                                     json={"name": self.name, "worker_id": self.worker_id},
+                                     timeout=config.NETWORK_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        with self._lock:
+            self.worker_id = data["worker_id"]
+            self.heartbeat_interval = data.get("heartbeat_interval", self.heartbeat_interval)
+        Logger.success(f"已注册到协调服务 {self.base_url}，worker ID: {self.worker_id}")
+
+    def post(self, path, payload):
+        """发送请求，返回 (状态码, JSON 或 None)"""
+        for _ in range(2):
+            response = self.session.post(f"{self.base_url}{path}", json=dict(payload, worker_id=self.worker_id),
+                                         timeout=config.NETWORK_TIMEOUT)
+            if response.status_code == 410:
+                Logger.warning("协调服务不认识当前 worker (可能已重启)，重新注册...")
+                self.register()
+                continue
+            if response.status_code == 409:
+                # 租约已被回收，协调服务丢弃了本次回传的结果
+                return response.status_code, None
+            response.raise_for_status()
+            return response.status_code, (response.json() if response.content else None)
+        response.raise_for_status()
+
+
+class TranslationWorker:
+    def __init__(self, client, threads):
+        self.client = client
+        self.threads = threads
+        self.stop_event = threading.Event()
+        self.stats_manager = StatsManager(config.OUTPUT_DIR)
+        self.ai_handler = None
+        self.leases = set()  # 当前持有的 (paper_id, page_idx)
+        self.leases_lock = threading.Lock()
+        self.papers_seen = set()  # 已重置过论文级预算的 paper_id
+        self.work_dir = tempfile.mkdtemp(prefix="pdf_trans_worker_")
+
+    # ---------- 信号处理 ----------
+    def _handle_signal(self, signum, frame):
+        if self.stop_event.is_set():
+            Logger.warning("正在等待进行中的页面完成，请稍候...")
+            return
+        Logger.warning(f"收到信号 {signum}，完成进行中的页面后退出...")
+        self.stop_event.set()
+
+    def _install_signal_handlers(self):
+        signal.signal(signal.SIGINT, self._handle_signal)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, self._handle_signal)
+
+    # ---------- 心跳 ----------
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(self.client.heartbeat_interval):
+            with self.leases_lock:
+                leases = [list(lease) for lease in self.leases]
+            try:
+                _, data = self.client.post("/workers/heartbeat", {"leases": leases})
+                for paper_id, page_idx in (data or {}).get("lost", []):
+                    Logger.warning(f"论文 {paper_id} 第 {page_idx + 1} 页的租约已被回收，结果可能被其他 worker 覆盖。")
+            except requests.exceptions.RequestException as e:
+                Logger.warning(f"心跳失败: {e}")
+
+    # ---------- 翻译 ----------
+    def _translate_lease(self, lease, current_paper):
+        paper_id, page_idx = lease["paper_id"], lease["page_idx"]
+        if self.ai_handler.model_selector and current_paper.get("id") != paper_id:
+            # 同一篇论文的预算由本 worker 的所有线程共用，只在首次遇到时重置
+            with self.leases_lock:
+                first_seen = paper_id not in self.papers_seen
+                self.papers_seen.add(paper_id)
+            if first_seen:
+                self.ai_handler.model_selector.begin_paper(lease["paper_name"])
+            else:
+                self.ai_handler.model_selector.use_paper(lease["paper_name"])
+            current_paper["id"] = paper_id
+
+        img_path = os.path.join(self.work_dir, f"{paper_id}_{threading.get_ident()}_{lease['image_name']}")
+        with open(img_path, "wb") as f:
+            f.write(base64.b64decode(lease["image_b64"]))
+
+        Logger.info(f"翻译 \"{lease['paper_name']}\" 第 {page_idx + 1} 页 (第 {lease['attempt']} 次领取)...", indent=1)
+        page_start_time = time.time()
+        try:
+            with Logger.bind(paper=lease["paper_name"], page=page_idx + 1):
+                text = self.ai_handler.translate_page(img_path, lease["prompt"], lease.get("page_info"))
+            latency = time.time() - page_start_time
+            self.stats_manager.record_page_time(latency, True, self.ai_handler.last_served_model())
+            status, _ = self.client.post("/results", {
+                "paper_id": paper_id, "page_idx": page_idx, "text": text,
+                "provider": self.ai_handler.last_served_model(), "latency": latency,
+            })
+            if status == 409:
+                Logger.warning(f"\"{lease['paper_name']}\" 第 {page_idx + 1} 页的租约已被回收，结果已被协调服务丢弃。", indent=1)
+            else:
+                Logger.success(f"\"{lease['paper_name']}\" 第 {page_idx + 1} 页已回传。", indent=1)
+        except requests.exceptions.RequestException:
+            raise
+        except Exception as e:
+            latency = time.time() - page_start_time
+            self.stats_manager.record_page_time(latency, False)
+            Logger.error(f"\"{lease['paper_name']}\" 第 {page_idx + 1} 页翻译失败: {e}", indent=1)
+            self.client.post("/failures", {"paper_id": paper_id, "page_idx": page_idx, "error": str(e), "latency": latency})
+        finally:
+            if os.path.exists(img_path):
+                os.remove(img_path)
+
+    def _work_loop(self):
+        current_paper = {}
+        while not self.stop_event.is_set():
+            try:
+                status, lease = self.client.post("/leases", {})
+            except requests.exceptions.RequestException as e:
+                Logger.warning(f"无法连接协调服务: {e}，{config.WORKER_POLL_INTERVAL} 秒后重试。")
+                self.stop_event.wait(config.WORKER_POLL_INTERVAL)
+                continue
+            if status == 204 or not lease:
+                self.stop_event.wait(config.WORKER_POLL_INTERVAL)
+                continue
+
+            key = (lease["paper_id"], lease["page_idx"])
+            with self.leases_lock:
+                self.leases.add(key)
+            try:
+                if self.stop_event.is_set():
+                    # 领取后才收到停止信号，归还页面
+                    self.client.post("/leases/release", {"paper_id": key[0], "page_idx": key[1]})
+                    break
+                self._translate_lease(lease, current_paper)
+            except requests.exceptions.RequestException as e:
+                # 结果未能回传，租约到期后页面会被重新领取
+                Logger.error(f"与协调服务通信失败: {e}", indent=1)
+                self.stop_event.wait(config.WORKER_POLL_INTERVAL)
+            finally:
+                with self.leases_lock:
+                    self.leases.discard(key)
+
+    def run(self):
+        Logger.separator('=', 50)
+        Logger.plain(f"[START] 翻译 worker 启动 ({self.threads} 个线程)")
+        Logger.separator('=', 50)
+
+        if not pre_flight_checks():
+            Logger.plain("\n环境检查未通过，程序已终止。请根据提示修复问题后重试。")
+            sys.exit(1)
+
+        self.ai_handler = AIHandler(self.stats_manager)
+        self.client.register()
+        self._install_signal_handlers()
+        record_startup(self.stats_manager)
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True)
+        heartbeat.start()
+        workers = [threading.Thread(target=self._work_loop, name=f"worker-{i}") for i in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in workers):
+                for thread in workers:
+                    thread.join(timeout=1)
+        finally:
+            self.stop_event.set()
+            for thread in workers:
+                thread.join()
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            Logger.plain()
+            Logger.separator('=', 50)
+            Logger.plain("[END] worker 已退出。")
+            Logger.separator('=', 50)
+            finish_run(self.stats_manager)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分布式翻译 worker")
+    parser.add_argument("--coordinator", default=config.COORDINATOR_URL, help="协调服务地址")
+    parser.add_argument("--threads", type=int, default=1, help="同时翻译的页面数")
+    parser.add_argument("--name", default=socket.gethostname(), help="worker 名称 (显示在协调服务状态页)")
+    add_log_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args)
+    TranslationWorker(CoordinatorClient(args.coordinator, args.name), max(1, args.threads)).run()